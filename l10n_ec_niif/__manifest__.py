@@ -1,6 +1,6 @@
 {
     "name": "Ecuador - Accounting IFRS",
-    "version": "13.0.1.2.2",
+    "version": "13.0.1.2.3",
     "category": "Localization",
     "author": "Spearhead",
     "website": "https://www.spearhead.global",
@@ -72,6 +72,9 @@
         "views/sri_error_code_view.xml",
         "views/sri_key_type_view.xml",
         "views/xml_data_view.xml",
+        "views/xml_data_stage_view.xml",
+        "views/taxpayer_cache_view.xml",
+        "wizard/wizard_load_taxpayer_registry_view.xml",
         "views/l10n_ec_portal_common_electronic_templates.xml",
         "views/l10n_ec_portal_withhold_templates.xml",
         "views/res_config_view.xml",
@@ -1,3 +1,4 @@
 # from . import mail
 from . import l10n_ec_portal_common_electronic
 from . import l10n_ec_portal_withhold
+from . import l10n_ec_xml_stage
@@ -0,0 +1,11 @@
+from odoo import http
+from odoo.http import request
+
+
+class XmlDataStageStatistics(http.Controller):
+    @http.route("/l10n_ec/xml_stage_statistics", type="json", auth="user")
+    def xml_stage_statistics(self, hours=24, company_ids=None, **kwargs):
+        """
+        Estadisticas(percentiles de duracion, documentos por hora, errores) de cada etapa del proceso electronico
+        """
+        return request.env["sri.xml.data.stage"].get_stage_statistics(hours=hours, company_ids=company_ids)
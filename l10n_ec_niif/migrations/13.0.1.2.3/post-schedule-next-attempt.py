@@ -0,0 +1,24 @@
+def migrate(cr, version):
+    # programar de inmediato los documentos que la tarea cron debia seguir consultando en el SRI
+    cr.execute(
+        """
+        UPDATE sri_xml_data x
+        SET next_attempt_date = (now() at time zone 'UTC')
+        WHERE x.next_attempt_date IS NULL
+            AND (
+                x.state = 'waiting'
+                OR (
+                    x.state = 'signed'
+                    AND EXISTS (
+                        SELECT 1 FROM sri_xml_data_send_try t WHERE t.xml_id = x.id AND t.type_send = 'send'
+                    )
+                )
+                OR (
+                    x.state = 'rejected'
+                    AND EXISTS (
+                        SELECT 1 FROM sri_error_code e WHERE e.id = x.last_error_id AND e.code IN ('43', '50', '70')
+                    )
+                )
+            )
+        """
+    )
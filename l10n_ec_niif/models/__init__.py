@@ -2,6 +2,7 @@ from . import agency
 from . import authorization
 from . import authorization_supplier
 from . import res_partner
+from . import taxpayer_cache
 from . import account_tax
 from . import account_chart_template
 from . import account_fiscal_position
@@ -17,6 +18,7 @@ from . import l10n_ec_account_invoice_refund
 from . import sri_error_code
 from . import sri_key_type
 from . import xml_data
+from . import xml_data_stage
 from . import company
 from . import account_payment
 from . import account_move
@@ -27,3 +29,4 @@ from . import res_users
 from . import res_config
 from . import l10n_ec_utils
 from . import mail_template
+from . import ir_config_parameter
@@ -1,9 +1,9 @@
 import json
 import logging
 import re
-from xml.etree.ElementTree import SubElement
 
 from lxml import etree
+from lxml.etree import SubElement
 
 from odoo import _, api, fields, models, tools
 from odoo.exceptions import UserError, ValidationError
@@ -11,7 +11,9 @@ from odoo.tools import float_compare, float_is_zero
 from odoo.tools.misc import formatLang
 from odoo.tools.safe_eval import safe_eval
 
-from ..models import modules_mapping
+from ..models import modules_mapping, sri_xml_plan
+from ..models.agency import SEQUENCE_COUNTER_TYPES
+from ..models.l10n_ec_common_document_electronic import XML_LINES_CHUNK_SIZE
 
 _logger = logging.getLogger(__name__)
 
@@ -374,6 +376,8 @@ class AccountMove(models.Model):
         "invoice_date",
     )
     def _compute_l10n_ec_amounts(self):
+        # tasas de cambio consultadas, compartidas entre todas las facturas del recordset
+        rates = {}
         for move in self:
             move_date = move.invoice_date or fields.Date.context_today(move)
             l10n_ec_base_iva_0 = sum(line.l10n_ec_base_iva_0 for line in move.invoice_line_ids)
@@ -386,20 +390,18 @@ class AccountMove(models.Model):
             move.l10n_ec_base_iva = l10n_ec_base_iva
             move.l10n_ec_iva = l10n_ec_iva
             move.l10n_ec_discount_total = l10n_ec_discount_total
-            move.l10n_ec_base_iva_0_currency = move.currency_id._convert(
-                l10n_ec_base_iva_0, move.company_currency_id, move.company_id, move_date
-            )
-            move.l10n_ec_base_iva_currency = move.currency_id._convert(
-                l10n_ec_base_iva, move.company_currency_id, move.company_id, move_date
-            )
-            move.l10n_ec_iva_currency = move.currency_id._convert(
-                l10n_ec_iva, move.company_currency_id, move.company_id, move_date
-            )
-            move.l10n_ec_discount_total_currency = move.currency_id._convert(
-                l10n_ec_discount_total,
+            (
+                move.l10n_ec_base_iva_0_currency,
+                move.l10n_ec_base_iva_currency,
+                move.l10n_ec_iva_currency,
+                move.l10n_ec_discount_total_currency,
+            ) = self._l10n_ec_convert_amounts(
+                [l10n_ec_base_iva_0, l10n_ec_base_iva, l10n_ec_iva, l10n_ec_discount_total],
+                move.currency_id,
                 move.company_currency_id,
                 move.company_id,
                 move_date,
+                rates,
             )
 
     @api.depends(
@@ -567,14 +569,11 @@ class AccountMove(models.Model):
 
     @api.depends("type", "line_ids.tax_ids")
     def _compute_l10n_ec_withhold_required(self):
-        group_iva_withhold = self.env.ref("l10n_ec_niif.tax_group_iva_withhold")
-        group_rent_withhold = self.env.ref("l10n_ec_niif.tax_group_renta_withhold")
         for rec in self:
             withhold_required = False
             if rec.type == "in_invoice":
-                withhold_required = any(
-                    t.tax_group_id.id in (group_iva_withhold.id, group_rent_withhold.id)
-                    for t in rec.line_ids.mapped("tax_ids")
+                withhold_required = bool(
+                    rec.line_ids.mapped("tax_ids")._l10n_ec_filter_by_role("withhold_iva", "withhold_rent")
                 )
             rec.l10n_ec_withhold_required = withhold_required
 
@@ -620,6 +619,26 @@ class AccountMove(models.Model):
                         % (invoice.l10n_ec_withhold_number)
                     )
 
+    # indices unicos parciales(restricciones EXCLUDE con igualdad) por familia de documentos,
+    # garantizan la unicidad en la base de datos incluso con transacciones concurrentes
+    # las restricciones de python validan con una sola consulta por lote para mostrar mensajes mas claros
+    _sql_constraints = [
+        (
+            "l10n_ec_document_number_company_uniq",
+            "EXCLUDE USING btree (company_id WITH =, type WITH =, l10n_latam_internal_type WITH =, "
+            "l10n_ec_document_number WITH =) "
+            "WHERE (type IN ('out_invoice', 'out_refund') OR l10n_latam_internal_type = 'liquidation')",
+            _("There is another document with the same number for the company!"),
+        ),
+        (
+            "l10n_ec_document_number_partner_uniq",
+            "EXCLUDE USING btree (partner_id WITH =, type WITH =, l10n_latam_internal_type WITH =, "
+            "l10n_ec_document_number WITH =) "
+            "WHERE (type IN ('in_invoice', 'in_refund') AND l10n_latam_internal_type <> 'liquidation')",
+            _("There is another document with the same number for the partner!"),
+        ),
+    ]
+
     @api.constrains(
         "name",
         "l10n_ec_document_number",
@@ -628,18 +647,41 @@ class AccountMove(models.Model):
         "l10n_latam_document_type_id",
     )
     def _check_l10n_ec_document_number_duplicity(self):
-        auth_line_model = self.env["l10n_ec.sri.authorization.line"]
+        document_keys = {}
         for move in self.filtered(
             lambda x: x.company_id.country_id.code == "EC"
             and x.l10n_ec_get_invoice_type() in ("out_invoice", "out_refund", "debit_note_out", "liquidation")
             and x.l10n_ec_document_number
         ):
-            auth_line_model.with_context(from_constrain=True).validate_unique_value_document(
-                move.l10n_ec_get_invoice_type(),
-                move.l10n_ec_document_number,
-                move.company_id.id,
-                move.id,
-            )
+            invoice_type = move.l10n_ec_get_invoice_type()
+            move_type, internal_type = modules_mapping.get_invoice_type_reverse(invoice_type)
+            document_keys[(move.company_id.id, move_type, internal_type, move.l10n_ec_document_number)] = invoice_type
+        if not document_keys:
+            return
+        # una sola consulta para todos los documentos del lote
+        groups = self.read_group(
+            [
+                ("company_id", "in", list({key[0] for key in document_keys})),
+                ("type", "in", list({key[1] for key in document_keys})),
+                ("l10n_ec_document_number", "in", list({key[3] for key in document_keys})),
+            ],
+            ["company_id"],
+            ["company_id", "type", "l10n_latam_internal_type", "l10n_ec_document_number"],
+            lazy=False,
+        )
+        for group in groups:
+            company_id = group["company_id"] and group["company_id"][0]
+            key = (company_id, group["type"], group["l10n_latam_internal_type"], group["l10n_ec_document_number"])
+            if group["__count"] > 1 and key in document_keys:
+                document_type = modules_mapping.get_document_type(document_keys[key])
+                raise ValidationError(
+                    _("There is another document type %s with number '%s' for the company %s")
+                    % (
+                        modules_mapping.get_document_name(document_type),
+                        key[3],
+                        self.env["res.company"].browse(company_id).name,
+                    )
+                )
 
     @api.constrains("l10n_ec_electronic_authorization", "l10n_ec_type_emission")
     def _check_electronic_authorization_supplier(self):
@@ -1169,6 +1211,31 @@ class AccountMove(models.Model):
                 default["l10n_ec_authorization_line_id"] = auth_line.id
         return super(AccountMove, self).copy_data(default)
 
+    @api.model_create_multi
+    def create(self, vals_list):
+        moves = super(AccountMove, self).create(vals_list)
+        self.env["l10n_ec.point.of.emission.counter"]._register_numbers(moves._l10n_ec_get_sequence_numbers())
+        return moves
+
+    def write(self, vals):
+        if not set(vals) & {
+            "name",
+            "l10n_latam_document_number",
+            "l10n_latam_document_type_id",
+            "l10n_ec_point_of_emission_id",
+            "type",
+        }:
+            return super(AccountMove, self).write(vals)
+        counter_model = self.env["l10n_ec.point.of.emission.counter"]
+        old_numbers = self._l10n_ec_get_sequence_numbers()
+        res = super(AccountMove, self).write(vals)
+        new_numbers = self._l10n_ec_get_sequence_numbers()
+        counter_model._register_numbers(new_numbers)
+        counter_model._release_numbers(
+            {key: number for key, number in old_numbers.items() if new_numbers.get(key) != number}
+        )
+        return res
+
     def unlink(self):
         ecuadorian_moves = self.filtered(lambda x: x.company_id.country_id.code == "EC")
         for move in ecuadorian_moves:
@@ -1176,9 +1243,32 @@ class AccountMove(models.Model):
                 raise UserError(_("You cannot delete a document that is authorized"))
             if move.is_invoice() and move.state != "draft":
                 raise UserError(_("You only delete invoices in draft state"))
+        old_numbers = ecuadorian_moves._l10n_ec_get_sequence_numbers()
         super(AccountMove, ecuadorian_moves.with_context(force_delete=True)).unlink()
+        self.env["l10n_ec.point.of.emission.counter"]._release_numbers(old_numbers)
         return super(AccountMove, self - ecuadorian_moves).unlink()
 
+    def _l10n_ec_get_sequence_numbers(self):
+        """
+        Secuencial mayor de los documentos por punto de emision y tipo de documento,
+        para actualizar los contadores de l10n_ec.point.of.emission.counter
+        :return: dict {(punto de emision, tipo de documento): secuencial}
+        """
+        numbers = {}
+        for move in self.filtered(
+            lambda x: x.company_id.country_id.code == "EC"
+            and x.l10n_ec_point_of_emission_id
+            and x.l10n_ec_document_number
+        ):
+            invoice_type = move.l10n_ec_get_invoice_type()
+            if invoice_type not in SEQUENCE_COUNTER_TYPES:
+                continue
+            printer = move.l10n_ec_point_of_emission_id
+            number = printer._l10n_ec_parse_sequence(move.l10n_ec_document_number)
+            if number > numbers.get((printer, invoice_type), 0):
+                numbers[(printer, invoice_type)] = number
+        return numbers
+
     def action_cancel_invoice_sent_email(self):
         MailComposeMessage = self.env["mail.compose.message"]
         self.ensure_one()
@@ -1325,26 +1415,39 @@ class AccountMove(models.Model):
     def post(self):
         withhold_model = self.env["l10n_ec.withhold"]
         withhold_line_model = self.env["l10n_ec.withhold.line"]
-        for move in self:
-            if move.company_id.country_id.code == "EC":
-                move._check_document_values_for_ecuador()
-                move._l10n_ec_action_validate_authorization_sri()
-                move.validate_quantity_move_line()
-                # proceso de retenciones en compra
-                if move.type == "in_invoice":
-                    if move.l10n_ec_withhold_required:
-                        current_withhold = withhold_model.create(move._prepare_withhold_values())
-                        tax_data = move._prepare_withhold_lines_values(current_withhold)
-                        withhold_line_model.create(tax_data)
-
-                        current_withhold.action_done()
-                # proceso de facturacion electronica
-                if move.is_invoice():
-                    move.l10n_ec_action_create_xml_data()
+        ec_moves = self.filtered(lambda x: x.company_id.country_id.code == "EC")
+        if len(ec_moves) > 1:
+            ec_moves._l10n_ec_prefetch_electronic_data()
+        for move in ec_moves:
+            move._check_document_values_for_ecuador()
+            move._l10n_ec_action_validate_authorization_sri()
+            move.validate_quantity_move_line()
+        # proceso de retenciones en compra, crear todas las retenciones y sus lineas a la vez
+        withhold_moves = ec_moves.filtered(lambda x: x.type == "in_invoice" and x.l10n_ec_withhold_required)
+        if withhold_moves:
+            withholds = withhold_model.create([move._prepare_withhold_values() for move in withhold_moves])
+            withhold_lines_values = []
+            for move, withhold in zip(withhold_moves, withholds):
+                withhold_lines_values.extend(move._prepare_withhold_lines_values(withhold))
+            withhold_line_model.create(withhold_lines_values)
+            withholds.action_done()
+        # proceso de facturacion electronica
+        ec_moves.filtered(lambda x: x.is_invoice()).l10n_ec_action_create_xml_data()
         res = super(AccountMove, self).post()
         self.l10n_ec_asign_discount_to_lines()
         return res
 
+    def l10n_ec_post_bulk(self):
+        """
+        Validar muchos documentos a la vez(importaciones, punto de venta, conectores externos)
+        sin esperar respuesta del SRI:
+        * la autorizacion de documentos de proveedores se verifica luego en la tarea cron
+        l10n_ec_validate_supplier_documents_sri
+        * los documentos electronicos se crean en borrador, en la misma transaccion,
+        y la tarea cron de documentos offline se encarga de crear el xml, firmarlo y enviarlo al SRI
+        """
+        return self.with_context(l10n_ec_defer_electronic=True).post()
+
     def action_invoice_sent(self):
         self.ensure_one()
         res = super(AccountMove, self).action_invoice_sent()
@@ -1401,12 +1504,6 @@ class AccountMove(models.Model):
     def _check_document_values_for_ecuador(self):
         # TODO: se deberia agregar un campo en el grupo de impuesto para diferenciarlos(l10n_ec_type_ec)
         supplier_authorization_model = self.env["l10n_ec.sri.authorization.supplier"]
-        withhold_iva_group = self.env.ref("l10n_ec_niif.tax_group_iva_withhold")
-        withhold_rent_group = self.env.ref("l10n_ec_niif.tax_group_renta_withhold")
-        iva_group = self.env.ref("l10n_ec_niif.tax_group_iva")
-        iva_no_apply_group = self.env.ref("l10n_ec_niif.tax_group_iva_no_apply")
-        iva_exempt_group = self.env.ref("l10n_ec_niif.tax_group_iva_exempt")
-        iva_group_0 = self.env.ref("l10n_ec_niif.tax_group_iva_0")
         error_list = []
         currency = self.currency_id
         # validar que la empresa tenga ruc y tipo de documento
@@ -1548,15 +1645,14 @@ class AccountMove(models.Model):
                     % (self.l10n_latam_document_number, self.partner_id.display_name)
                 )
             for line in self.invoice_line_ids:
-                iva_taxes = line.tax_ids.filtered(lambda x: x.tax_group_id.id == iva_group.id and x.amount > 0)
-                iva_0_taxes = line.tax_ids.filtered(
-                    lambda x: x.tax_group_id.id in (iva_group_0.id, iva_no_apply_group.id, iva_exempt_group.id)
-                    and x.amount == 0
+                iva_taxes = line.tax_ids._l10n_ec_filter_by_role("iva").filtered(lambda x: x.amount > 0)
+                iva_0_taxes = line.tax_ids._l10n_ec_filter_by_role("iva0", "iva_no_apply", "iva_exempt").filtered(
+                    lambda x: x.amount == 0
                 )
-                withhold_iva_taxes = line.tax_ids.filtered(
-                    lambda x: x.tax_group_id.id == withhold_iva_group.id and x.amount > 0
+                withhold_iva_taxes = line.tax_ids._l10n_ec_filter_by_role("withhold_iva").filtered(
+                    lambda x: x.amount > 0
                 )
-                rent_withhold_taxes = line.tax_ids.filtered(lambda x: x.tax_group_id.id == withhold_rent_group.id)
+                rent_withhold_taxes = line.tax_ids._l10n_ec_filter_by_role("withhold_rent")
                 if self.partner_id.country_id.code == "EC":
                     if self.l10n_latam_document_type_id.code == "41":
                         if rent_withhold_taxes or withhold_iva_taxes:
@@ -1585,10 +1681,9 @@ class AccountMove(models.Model):
                         % (" / ".join(t.description or t.name for t in withhold_iva_taxes))
                     )
         for line in self.invoice_line_ids:
-            iva_taxes = line.tax_ids.filtered(lambda x: x.tax_group_id.id == iva_group.id and x.amount > 0)
-            iva_0_taxes = line.tax_ids.filtered(
-                lambda x: x.tax_group_id.id in (iva_group_0.id, iva_no_apply_group.id, iva_exempt_group.id)
-                and x.amount == 0
+            iva_taxes = line.tax_ids._l10n_ec_filter_by_role("iva").filtered(lambda x: x.amount > 0)
+            iva_0_taxes = line.tax_ids._l10n_ec_filter_by_role("iva0", "iva_no_apply", "iva_exempt").filtered(
+                lambda x: x.amount == 0
             )
             if len(iva_taxes) >= 1 and len(iva_0_taxes) >= 1:
                 error_list.append(_("Cannot apply VAT zero rate with another VAT rate"))
@@ -1669,6 +1764,9 @@ class AccountMove(models.Model):
                 if self.l10n_ec_invoice_type == "in_invoice" and self.l10n_latam_document_type_id.code != "01":
                     self.write({"l10n_ec_sri_authorization_state": "valid"})
                     return True
+                # validacion en bloque, la tarea cron verifica luego el documento con el SRI
+                if self.env.context.get("l10n_ec_defer_electronic"):
+                    return True
                 if self.l10n_ec_supplier_authorization_id:
                     authorization_number = self.l10n_ec_supplier_authorization_id.number
                 else:
@@ -1695,6 +1793,8 @@ class AccountMove(models.Model):
                     else:
                         self.write({"l10n_ec_sri_authorization_state": "valid"})
             elif self.l10n_ec_type_emission == "electronic" and self.l10n_ec_electronic_authorization:
+                if self.env.context.get("l10n_ec_defer_electronic"):
+                    return True
                 xml_data = self.env["sri.xml.data"]
                 try:
                     limit_days = int(
@@ -1795,46 +1895,25 @@ class AccountMove(models.Model):
         :return: list(dict) with values for create withhold lines
         """
         percent_model = self.env["l10n_ec.withhold.line.percent"]
-        withhold_iva_group = self.env.ref("l10n_ec_niif.tax_group_iva_withhold")
-        withhold_rent_group = self.env.ref("l10n_ec_niif.tax_group_renta_withhold")
         tax_data = {}
         for line in self.invoice_line_ids:
             for tax in line.tax_ids:
-                if tax.tax_group_id.id in (
-                    withhold_iva_group.id,
-                    withhold_rent_group.id,
-                ):
-                    base_tag_id = tax.invoice_repartition_line_ids.filtered(
-                        lambda x: x.repartition_type == "base"
-                    ).mapped("tag_ids")
-                    tax_tag_id = tax.invoice_repartition_line_ids.filtered(
-                        lambda x: x.repartition_type == "tax"
-                    ).mapped("tag_ids")
-                    tax_type = "rent"
-                    percent = abs(tax.amount)
-                    if tax.tax_group_id.id == withhold_iva_group.id:
-                        tax_type = "iva"
-                        percent = abs(
-                            tax.invoice_repartition_line_ids.filtered(
-                                lambda x: x.repartition_type == "tax"
-                            ).factor_percent
-                        )
-                    tax_data.setdefault(
-                        tax,
-                        {
-                            "withhold_id": withhold.id,
-                            "invoice_id": self.id,
-                            "tax_id": tax.id,
-                            "base_tag_id": base_tag_id and base_tag_id.ids[0] or False,
-                            "tax_tag_id": tax_tag_id and tax_tag_id.ids[0] or False,
-                            "type": tax_type,
-                            "base_amount": 0.0,
-                            "tax_amount": 0.0,
-                            "base_amount_currency": 0.0,
-                            "tax_amount_currency": 0.0,
-                            "percent_id": percent_model._get_percent(percent, tax_type).id,
-                        },
-                    )
+                tax_info = tax._l10n_ec_get_tax_info()
+                if tax_info["role"] in ("withhold_iva", "withhold_rent") and tax not in tax_data:
+                    tax_type = tax_info["role"] == "withhold_iva" and "iva" or "rent"
+                    tax_data[tax] = {
+                        "withhold_id": withhold.id,
+                        "invoice_id": self.id,
+                        "tax_id": tax.id,
+                        "base_tag_id": tax_info["base_tag_ids"] and tax_info["base_tag_ids"][0] or False,
+                        "tax_tag_id": tax_info["tax_tag_ids"] and tax_info["tax_tag_ids"][0] or False,
+                        "type": tax_type,
+                        "base_amount": 0.0,
+                        "tax_amount": 0.0,
+                        "base_amount_currency": 0.0,
+                        "tax_amount_currency": 0.0,
+                        "percent_id": percent_model._get_percent(tax_info["percent"], tax_type).id,
+                    }
         for tax in tax_data.keys():
             base_amount = 0
             tax_amount = 0
@@ -1876,7 +1955,7 @@ class AccountMove(models.Model):
                         factor = tax_repartition_lines.factor
                         # cuando es impuesto de retencion iva 0, a la base multiplicarla por el % de impuesto
                         # para obtener la base correcta
-                        if not factor and tax.tax_group_id == withhold_iva_group:
+                        if not factor and tax_data[tax]["type"] == "iva":
                             factor = tax.amount
                         base_amount *= factor * 0.01
                     tax_data[tax]["base_amount"] += base_amount
@@ -1888,7 +1967,7 @@ class AccountMove(models.Model):
                         tax_amount, self.company_id.currency_id
                     )
         for tax, tax_vals in tax_data.items():
-            if tax.tax_group_id.id == withhold_iva_group.id:
+            if tax_vals["type"] == "iva":
                 invoice_lines = self.invoice_line_ids.filtered(lambda x: tax in x.tax_ids)
                 tax_vals["base_amount"] = sum(invoice_lines.mapped("l10n_ec_iva"))
                 tax_vals["base_amount_currency"] = self.currency_id.compute(
@@ -2010,7 +2089,9 @@ class AccountMove(models.Model):
                 new_xml_rec = xml_model.create(sri_xml_vals)
                 xml_recs += new_xml_rec
                 invoice._l10n_ec_add_followers_to_electronic_documents()
-        if xml_recs:
+        # al validar documentos en bloque(l10n_ec_post_bulk) no crear el xml ni conectarse al SRI,
+        # los documentos quedan en borrador para la tarea cron
+        if xml_recs and not self.env.context.get("l10n_ec_defer_electronic"):
             xml_recs.process_document_electronic()
         return True
 
@@ -2090,9 +2171,18 @@ class AccountMove(models.Model):
     def l10n_ec_get_payment_data(self):
         payment_data = []
         foreign_currency = self.currency_id if self.currency_id != self.company_id.currency_id else False
-        pay_term_line_ids = self.line_ids.filtered(
-            lambda line: line.account_id.user_type_id.type in ("receivable", "payable")
-        )
+        if len(self.line_ids) > XML_LINES_CHUNK_SIZE:
+            # buscar solo las lineas por cobrar/pagar, sin leer todas las lineas del documento
+            pay_term_line_ids = self.env["account.move.line"].search(
+                [
+                    ("move_id", "=", self.id),
+                    ("account_id.user_type_id.type", "in", ("receivable", "payable")),
+                ]
+            )
+        else:
+            pay_term_line_ids = self.line_ids.filtered(
+                lambda line: line.account_id.user_type_id.type in ("receivable", "payable")
+            )
         partials = pay_term_line_ids.mapped("matched_debit_ids") + pay_term_line_ids.mapped("matched_credit_ids")
         for partial in partials:
             counterpart_lines = partial.debit_move_id + partial.credit_move_id
@@ -2157,10 +2247,10 @@ class AccountMove(models.Model):
 
     def l10n_ec_get_tarifa_iva(self):
         tarifa_iva = 0
-        iva_group = self.env.ref("l10n_ec_niif.tax_group_iva")
-        for line in self.line_ids:
-            if line.tax_line_id.tax_group_id.id == iva_group.id and line.tax_line_id.amount > 0:
-                tarifa_iva = line.tax_line_id.amount
+        for line in self.line_ids.filtered("tax_line_id"):
+            tax_info = line.tax_line_id._l10n_ec_get_tax_info()
+            if tax_info["role"] == "iva" and tax_info["amount"] > 0:
+                tarifa_iva = tax_info["amount"]
         if not tarifa_iva:
             tarifa_iva = 12.0
         return tarifa_iva
@@ -2198,6 +2288,103 @@ class AccountMove(models.Model):
         # algo como: id, prefijo, secuencial
         return f"{self.id}_{self.l10n_latam_document_type_id.doc_code_prefix}_{self.l10n_ec_get_document_number()}"
 
+    def _l10n_ec_prefetch_electronic_data(self):
+        """
+        Cargar en la cache del ORM los datos de todas las facturas para generar sus xml en lote
+        cada campo se lee para todo el recordset en una sola consulta(lineas, impuestos, grupos de impuestos,
+        empresas, pagos conciliados y monedas), asi la cantidad de consultas no depende del numero de lineas
+        """
+        self.mapped("company_id.partner_id.property_account_position_id")
+        self.mapped("company_id.currency_id")
+        self.mapped("currency_id")
+        self.mapped("partner_id")
+        self.mapped("commercial_partner_id.l10n_ec_sri_payment_id")
+        self.mapped("l10n_ec_identification_type_id")
+        self.mapped("l10n_latam_document_type_id")
+        self.mapped("l10n_ec_sri_payment_id")
+        self.mapped("invoice_payment_term_id")
+        self.mapped("l10n_ec_original_invoice_id")
+        self.mapped("debit_origin_id")
+        self.mapped("l10n_ec_info_aditional_ids")
+        self.mapped("invoice_line_ids")
+        # los documentos con muchas lineas se leen por bloques al generar su xml, no precargar sus lineas
+        lines = self.filtered(lambda move: len(move.line_ids) <= XML_LINES_CHUNK_SIZE).mapped("line_ids")
+        lines.mapped("product_id.name")
+        lines.mapped("tax_ids.tax_group_id")
+        lines.mapped("tax_line_id.tax_group_id")
+        # pagos conciliados con las cuentas por cobrar/pagar y su forma de pago del SRI
+        pay_term_lines = lines.filtered(lambda line: line.account_id.user_type_id.type in ("receivable", "payable"))
+        partials = pay_term_lines.mapped("matched_debit_ids") | pay_term_lines.mapped("matched_credit_ids")
+        partials.mapped("currency_id")
+        counterpart_lines = partials.mapped("debit_move_id") | partials.mapped("credit_move_id")
+        counterpart_lines.mapped("payment_id.l10n_ec_sri_payment_id")
+        return self
+
+    def _l10n_ec_get_xml_fingerprint_data(self):
+        self.ensure_one()
+        invoice_type = self.l10n_ec_get_invoice_type()
+        data = [
+            invoice_type,
+            self._l10n_ec_get_fields_values(
+                self,
+                [
+                    "name",
+                    "l10n_latam_document_number",
+                    "l10n_latam_document_type_id",
+                    "invoice_date",
+                    "l10n_ec_identification_type_id",
+                    "commercial_partner_id.name",
+                    "commercial_partner_id.vat",
+                    "commercial_partner_id.street",
+                    "commercial_partner_id.l10n_ec_type_sri",
+                    "currency_id",
+                    "amount_untaxed",
+                    "amount_total",
+                    "l10n_ec_base_iva",
+                    "l10n_ec_base_iva_0",
+                    "l10n_ec_iva",
+                    "l10n_ec_discount_total",
+                    "l10n_ec_rise",
+                    "l10n_ec_legacy_document_number",
+                    "l10n_ec_legacy_document_date",
+                    "l10n_ec_original_invoice_id.l10n_latam_document_number",
+                    "l10n_ec_original_invoice_id.invoice_date",
+                    "debit_origin_id.l10n_latam_document_number",
+                    "debit_origin_id.invoice_date",
+                    "company_id.l10n_ec_string_ride_detail1",
+                    "company_id.l10n_ec_string_ride_detail2",
+                    "company_id.l10n_ec_string_ride_detail3",
+                    "l10n_ec_refund_ids",
+                    "l10n_ec_refund_ids.write_date",
+                ],
+            ),
+            self._l10n_ec_get_fields_values(
+                self.invoice_line_ids,
+                [
+                    "sequence",
+                    "display_type",
+                    "name",
+                    "product_id.default_code",
+                    "product_id.name",
+                    "quantity",
+                    "price_unit",
+                    "discount",
+                    "price_subtotal",
+                    "tax_ids",
+                    "l10n_ec_base_iva",
+                    "l10n_ec_base_iva_0",
+                    "l10n_ec_iva",
+                    "l10n_ec_xml_additional_info1",
+                    "l10n_ec_xml_additional_info2",
+                    "l10n_ec_xml_additional_info3",
+                ],
+            ),
+        ]
+        # formas de pago, incluye los pagos conciliados con la factura
+        if invoice_type in ("out_invoice", "liquidation"):
+            data.append(self.l10n_ec_get_payment_data())
+        return data
+
     def l10n_ec_action_generate_xml_data(self, node_root, xml_version):
         invoice_type = self.l10n_ec_get_invoice_type()
         if invoice_type == "out_invoice":
@@ -2221,69 +2408,91 @@ class AccountMove(models.Model):
             lines_discount: browse_record(account.move.line) lineas de descuento con valores a repartir
             invoice_line_data: dict(line_id, dict), diccionario con los valores calculados por cada linea de factura
         """
-        iva_group = self.env.ref("l10n_ec_niif.tax_group_iva")
-        iva0_group = self.env.ref("l10n_ec_niif.tax_group_iva_0")
-        invoice_lines = self.invoice_line_ids.filtered(lambda x: not x.display_type).sorted("price_subtotal")
-        lines_discount = invoice_lines.filtered(lambda x: x.price_subtotal < 0)
-        invoice_lines -= lines_discount
+        if len(self.invoice_line_ids) > XML_LINES_CHUNK_SIZE:
+            # ordenar en la base de datos, sin leer todas las lineas en la cache
+            # el orden por id es el mismo que tienen las lineas en el documento
+            line_model = self.env["account.move.line"]
+            domain = [("id", "in", self.invoice_line_ids.ids), ("display_type", "=", False)]
+            invoice_lines = line_model.search(domain + [("price_subtotal", ">=", 0)], order="price_subtotal, id")
+            lines_discount = line_model.search(domain + [("price_subtotal", "<", 0)], order="price_subtotal, id")
+            ordered_lines = line_model.search([("id", "in", self.invoice_line_ids.ids)], order="sequence, id")
+        else:
+            invoice_lines = self.invoice_line_ids.filtered(lambda x: not x.display_type).sorted("price_subtotal")
+            lines_discount = invoice_lines.filtered(lambda x: x.price_subtotal < 0)
+            invoice_lines -= lines_discount
+            ordered_lines = self.invoice_line_ids.sorted(lambda line: (line.sequence, line.id))
+        return {
+            "invoice_lines": invoice_lines,
+            "ordered_lines": ordered_lines,
+            "lines_discount": lines_discount,
+            "invoice_line_data": self._l10n_ec_distribute_discount(invoice_lines, lines_discount),
+        }
+
+    def _l10n_ec_distribute_discount(self, invoice_lines, lines_discount):
+        """
+        Repartir el valor de las lineas de descuento entre las lineas con los mismos impuestos
+        en una sola pasada: los totales por grupo de impuestos se calculan una sola vez
+        y la diferencia por redondeo se asigna a la ultima linea de cada grupo
+        @param invoice_lines: browse_record(account.move.line), lineas ordenadas sobre las que se reparte el descuento
+        @param lines_discount: browse_record(account.move.line), lineas de descuento
+        @return: dict(line_id, dict), diccionario con los valores calculados por cada linea de factura
+        """
+        # totales por grupo de impuestos, se suman en el mismo orden de las lineas para no alterar el redondeo
+        discount_amounts_by_tax = {}
+        for line in self._l10n_ec_iter_records(lines_discount):
+            discount_amounts_by_tax.setdefault(line.tax_ids, []).append(line.price_subtotal)
+        line_amounts_by_tax = {}
+        for line in self._l10n_ec_iter_records(invoice_lines):
+            line_amounts_by_tax.setdefault(line.tax_ids, []).append(line.price_subtotal)
+        total_discount_by_tax = {taxes: abs(sum(amounts)) for taxes, amounts in discount_amounts_by_tax.items()}
+        total_lines_by_tax = {taxes: abs(sum(amounts)) for taxes, amounts in line_amounts_by_tax.items()}
+        tax_model = self.env["account.tax"]
+        is_refund = self.type in ("out_refund", "in_refund")
         invoice_line_data = {}
-        discount_by_tax = {}
-        invoice_lines_by_tax = {}
-        for line in lines_discount:
-            if line.tax_ids not in discount_by_tax:
-                discount_by_tax[line.tax_ids] = self.env["account.move.line"]
-            discount_by_tax[line.tax_ids] |= line
-        for line in invoice_lines:
-            if line.tax_ids not in invoice_lines_by_tax:
-                invoice_lines_by_tax[line.tax_ids] = self.env["account.move.line"]
-            invoice_lines_by_tax[line.tax_ids] |= line
+        # por cada grupo de impuestos: cantidad de lineas procesadas y descuento ya asignado
         discount_applied_data = {}
-        for line in invoice_lines:
-            if line.tax_ids not in discount_applied_data:
-                discount_applied_data[line.tax_ids] = {"lines": self.env["account.move.line"], "discount_applied": 0}
-            discount_applied_data[line.tax_ids]["lines"] |= line
-            discount_lines = discount_by_tax.get(line.tax_ids) or self.env["account.move.line"]
-            total_discount_amount = abs(sum(discount_lines.mapped("price_subtotal")))
-            ail_by_tax = invoice_lines_by_tax.get(line.tax_ids) or self.env["account.move.line"]
-            ail_amount_total = abs(sum(ail_by_tax.mapped("price_subtotal")))
+        for line in self._l10n_ec_iter_records(invoice_lines):
+            taxes = line.tax_ids
+            applied_data = discount_applied_data.setdefault(taxes, {"lines": 0, "discount_applied": 0})
+            applied_data["lines"] += 1
+            total_discount_amount = total_discount_by_tax.get(taxes, 0)
+            ail_amount_total = total_lines_by_tax[taxes]
             discount_unit_additional = 0.0
             if ail_amount_total:
                 discount_unit_additional = round((line.price_subtotal / ail_amount_total) * 100.0, 2)
             discount = round(((line.price_unit * line.quantity) * ((line.discount or 0.0) / 100)), 2)
             discount_additional = round((total_discount_amount * ((discount_unit_additional or 0.0) / 100)), 2)
             # en la ultima linea asignar la diferencia entre lo asignado y el total a asignar
-            if len(discount_applied_data[line.tax_ids]["lines"]) == len(ail_by_tax):
-                discount_additional = round(
-                    total_discount_amount - discount_applied_data[line.tax_ids]["discount_applied"], 2
-                )
-            discount_applied_data[line.tax_ids]["discount_applied"] += round(discount_additional, 2)
+            if applied_data["lines"] == len(line_amounts_by_tax[taxes]):
+                discount_additional = round(total_discount_amount - applied_data["discount_applied"], 2)
+            applied_data["discount_applied"] += round(discount_additional, 2)
             discount += discount_additional
             subtotal = round(((line.price_unit * line.quantity) - discount), 2)
             l10n_ec_base_iva_0 = line.l10n_ec_base_iva_0
             l10n_ec_base_iva = line.l10n_ec_base_iva
-            if iva0_group in line.tax_ids.mapped("tax_group_id"):
+            tax_roles = {tax._l10n_ec_get_tax_info()["role"] for tax in taxes}
+            if "iva0" in tax_roles:
                 l10n_ec_base_iva_0 -= discount_additional
-            if iva_group in line.tax_ids.mapped("tax_group_id"):
+            if "iva" in tax_roles:
                 l10n_ec_base_iva -= discount_additional
             l10n_ec_iva = line.l10n_ec_iva
             tarifa_iva = 12
-            taxes_res = line.tax_ids._origin.compute_all(
+            taxes_res = taxes._origin.compute_all(
                 l10n_ec_base_iva,
                 quantity=1,
                 currency=self.currency_id,
                 product=line.product_id,
                 partner=self.partner_id,
-                is_refund=self.type in ("out_refund", "in_refund"),
+                is_refund=is_refund,
             )
             # impuestos de iva 0 no agregan reparticion de impuestos,
             # por ahora se consideran base_iva_0, verificar esto
-            if taxes_res["taxes"]:
-                for tax_data in taxes_res["taxes"]:
-                    tax = self.env["account.tax"].browse(tax_data["id"])
-                    if tax.tax_group_id.id == iva_group.id:
-                        l10n_ec_iva = tax_data["amount"]
-                    if tax.tax_group_id.id in [iva_group.id, iva0_group.id]:
-                        tarifa_iva = tax.amount
+            for tax_data in taxes_res["taxes"]:
+                tax_info = tax_model.browse(tax_data["id"])._l10n_ec_get_tax_info()
+                if tax_info["role"] == "iva":
+                    l10n_ec_iva = tax_data["amount"]
+                if tax_info["role"] in ("iva", "iva0"):
+                    tarifa_iva = tax_info["amount"]
             invoice_line_data[line.id] = {
                 "discount": discount,
                 "discount_additional": discount_additional,
@@ -2293,33 +2502,133 @@ class AccountMove(models.Model):
                 "l10n_ec_iva": l10n_ec_iva,
                 "tarifa_iva": tarifa_iva,
             }
-        return {
-            "invoice_lines": invoice_lines,
-            "ordered_lines": self.env["account.move.line"].search(
-                [("id", "in", self.invoice_line_ids.ids)], order="sequence"
-            ),
-            "lines_discount": lines_discount,
-            "invoice_line_data": invoice_line_data,
-        }
+        return invoice_line_data
 
     def l10n_ec_asign_discount_to_lines(self):
         for invoice in self:
             invoice_lines_data = invoice._l10n_ec_get_invoice_lines_to_fe()
             invoice_lines = invoice_lines_data["invoice_lines"]
             invoice_line_data = invoice_lines_data["invoice_line_data"]
+            # escribir una sola vez todas las lineas con el mismo descuento
+            lines_by_discount = {}
             for line in invoice_lines:
                 line_data = invoice_line_data.get(line.id, {})
-                line.write({"l10n_ec_discount_additional": line_data.get("discount_additional") or 0.0})
+                discount_additional = line_data.get("discount_additional") or 0.0
+                lines_by_discount.setdefault(discount_additional, []).append(line.id)
+            for discount_additional, line_ids in lines_by_discount.items():
+                invoice_lines.browse(line_ids).write({"l10n_ec_discount_additional": discount_additional})
         return True
 
+    def _l10n_ec_get_xml_detail_plan(self, xml_version, currency):
+        precision_get = self.env["decimal.precision"].precision_get
+        return sri_xml_plan.get_plan(
+            xml_version.xml_header_name,
+            {
+                "qty": precision_get("Product Unit of Measure"),
+                "price": precision_get("Product Price"),
+                "discount": precision_get("Discount"),
+                "amount": currency.decimal_places,
+            },
+            xml_version.version_file,
+        )
+
+    @api.model
+    def _l10n_ec_prepare_detail_tax(self, codigo_porcentaje, base, valor, tarifa):
+        return {
+            "codigo": "2",
+            "codigoPorcentaje": codigo_porcentaje,
+            "baseImponible": base,
+            "tarifa": tarifa,
+            "valor": valor,
+        }
+
+    @api.model
+    def _l10n_ec_prepare_detail_product(self, line):
+        util_model = self.env["l10n_ec.utils"]
+        return (
+            util_model._clean_str(
+                line.product_id and line.product_id.default_code and line.product_id.default_code[:25] or "N/A"
+            ),
+            util_model._clean_str(line.product_id and line.product_id.name[:300] or line.name[:300]),
+        )
+
+    @api.model
+    def _l10n_ec_prepare_detail_factura(self, line, line_data, company):
+        codigo, descripcion = self._l10n_ec_prepare_detail_product(line)
+        additional_info = []
+        for info, name in (
+            (line.l10n_ec_xml_additional_info1, company.l10n_ec_string_ride_detail1 or "Detalle1"),
+            (line.l10n_ec_xml_additional_info2, company.l10n_ec_string_ride_detail2 or "Detalle2"),
+            (line.l10n_ec_xml_additional_info3, company.l10n_ec_string_ride_detail3 or "Detalle3"),
+        ):
+            if info:
+                additional_info.append({"nombre": name, "valor": info})
+        if line_data["tarifa_iva"] <= 0:
+            tax = self._l10n_ec_prepare_detail_tax("0", line_data["l10n_ec_base_iva_0"], 0.0, 0)
+        else:
+            tax = self._l10n_ec_prepare_detail_tax(
+                "2", line_data["l10n_ec_base_iva"], line_data["l10n_ec_iva"], line_data["tarifa_iva"]
+            )
+        return {
+            "codigoPrincipal": codigo,
+            "descripcion": descripcion,
+            "cantidad": line.quantity,
+            "precioUnitario": line.price_unit,
+            "descuento": line_data["discount"] or 0.0,
+            "precioTotalSinImpuesto": line_data["subtotal"],
+            "detallesAdicionales": additional_info and {"detAdicional": additional_info} or None,
+            "impuestos": {"impuesto": [tax]},
+        }
+
+    @api.model
+    def _l10n_ec_prepare_detail_credit_note(self, line, line_data, currency):
+        codigo, descripcion = self._l10n_ec_prepare_detail_product(line)
+        taxes = []
+        if not currency.is_zero(line_data["l10n_ec_base_iva_0"]):
+            taxes.append(self._l10n_ec_prepare_detail_tax("0", line_data["l10n_ec_base_iva_0"], 0.0, 0))
+        if not currency.is_zero(line_data["l10n_ec_base_iva"]):
+            taxes.append(
+                self._l10n_ec_prepare_detail_tax(
+                    "2", line_data["l10n_ec_base_iva"], line_data["l10n_ec_iva"], line_data["tarifa_iva"]
+                )
+            )
+        return {
+            "codigoInterno": codigo,
+            "descripcion": descripcion,
+            "cantidad": line.quantity,
+            "precioUnitario": line.price_unit,
+            "descuento": line_data["discount"] or 0.0,
+            "precioTotalSinImpuesto": line_data["subtotal"],
+            "impuestos": {"impuesto": taxes},
+        }
+
+    @api.model
+    def _l10n_ec_prepare_detail_liquidation(self, line):
+        codigo, descripcion = self._l10n_ec_prepare_detail_product(line)
+        discount = round(((line.price_unit * line.quantity) * ((line.discount or 0.0) / 100)), 2)
+        # TODO: hacer un redondeo con las utilidades del sistema
+        subtotal = round(((line.price_unit * line.quantity) - discount), 2)
+        taxes = []
+        if line.l10n_ec_base_iva_0 != 0:
+            taxes.append(self._l10n_ec_prepare_detail_tax("0", line.l10n_ec_base_iva_0, 0.0, 0))
+        if line.l10n_ec_base_iva != 0:
+            taxes.append(self._l10n_ec_prepare_detail_tax("2", line.l10n_ec_base_iva, line.l10n_ec_iva, 12))
+        return {
+            "codigoPrincipal": codigo,
+            "descripcion": descripcion,
+            "unidadMedida": line.product_uom_id and line.product_uom_id.display_name or "N/A",
+            "cantidad": line.quantity,
+            "precioUnitario": line.price_unit,
+            "descuento": discount or 0.0,
+            "precioTotalSinImpuesto": subtotal,
+            "impuestos": {"impuesto": taxes},
+        }
+
     def l10n_ec_get_info_factura(self, node, xml_version):
         util_model = self.env["l10n_ec.utils"]
         company = self.company_id or self.env.company
         currency = company.currency_id
-        precision_get = self.env["decimal.precision"].precision_get
-        digits_precision_product = precision_get("Product Price")
-        digits_precision_qty = precision_get("Product Unit of Measure")
-        digits_precision_discount = precision_get("Discount")
+        detalle_plan = self._l10n_ec_get_xml_detail_plan(xml_version, currency)
         infoFactura = SubElement(node, "infoFactura")
         fecha_factura = self.invoice_date.strftime(util_model.get_formato_date())
         SubElement(infoFactura, "fechaEmision").text = fecha_factura
@@ -2406,78 +2715,12 @@ class AccountMove(models.Model):
                 SubElement(pago, "unidadTiempo").text = payment_data.get("unidadTiempo") or "dias"
         # Lineas de Factura
         detalles = SubElement(node, "detalles")
-        for line in invoice_lines:
-            line_data = invoice_line_data.get(line.id, {})
-            discount = line_data["discount"]
-            subtotal = line_data["subtotal"]
-            l10n_ec_base_iva_0 = line_data["l10n_ec_base_iva_0"]
-            l10n_ec_base_iva = line_data["l10n_ec_base_iva"]
-            l10n_ec_iva = line_data["l10n_ec_iva"]
-            tarifa_iva = line_data["tarifa_iva"]
-            detalle = SubElement(detalles, "detalle")
-            SubElement(detalle, "codigoPrincipal").text = util_model._clean_str(
-                line.product_id and line.product_id.default_code and line.product_id.default_code[:25] or "N/A"
-            )
-            #             SubElement(detalle,"codigoAdicional").text = util_model._clean_str(line.product_id and line.product_id.default_code and line.product_id.default_code[:25] or 'N/A')
-            SubElement(detalle, "descripcion").text = util_model._clean_str(
-                line.product_id and line.product_id.name[:300] or line.name[:300]
-            )
-            # Debido a que los precios son en 2 decimales, es necesario hacer razonable el precio unitario
-            SubElement(detalle, "cantidad").text = util_model.formato_numero(line.quantity, digits_precision_qty)
-            SubElement(detalle, "precioUnitario").text = util_model.formato_numero(
-                line.price_unit, digits_precision_product
-            )
-            SubElement(detalle, "descuento").text = util_model.formato_numero(
-                discount or 0.0, digits_precision_discount
+        for line in self._l10n_ec_iter_records(invoice_lines):
+            sri_xml_plan.render(
+                detalles,
+                detalle_plan,
+                self._l10n_ec_prepare_detail_factura(line, invoice_line_data.get(line.id, {}), company),
             )
-            SubElement(detalle, "precioTotalSinImpuesto").text = util_model.formato_numero(
-                subtotal, currency.decimal_places
-            )
-            if (
-                line.l10n_ec_xml_additional_info1
-                or line.l10n_ec_xml_additional_info2
-                or line.l10n_ec_xml_additional_info3
-            ):
-                detallesAdicionales = SubElement(detalle, "detallesAdicionales")
-                if line.l10n_ec_xml_additional_info1:
-                    detAdicional = SubElement(detallesAdicionales, "detAdicional")
-                    detAdicional.set("nombre", company.l10n_ec_string_ride_detail1 or "Detalle1")
-                    detAdicional.set("valor", line.l10n_ec_xml_additional_info1)
-                if line.l10n_ec_xml_additional_info2:
-                    detAdicional = SubElement(detallesAdicionales, "detAdicional")
-                    detAdicional.set("nombre", company.l10n_ec_string_ride_detail2 or "Detalle2")
-                    detAdicional.set("valor", line.l10n_ec_xml_additional_info2)
-                if line.l10n_ec_xml_additional_info3:
-                    detAdicional = SubElement(detallesAdicionales, "detAdicional")
-                    detAdicional.set("nombre", company.l10n_ec_string_ride_detail3 or "Detalle3")
-                    detAdicional.set("valor", line.l10n_ec_xml_additional_info3)
-
-            impuestos = SubElement(detalle, "impuestos")
-            if tarifa_iva <= 0:
-                self.l10n_ec_get_total_impuestos(
-                    impuestos,
-                    "2",
-                    "0",
-                    l10n_ec_base_iva_0,
-                    0.0,
-                    "impuesto",
-                    0,
-                    decimales=currency.decimal_places,
-                )
-            else:
-                self.l10n_ec_get_total_impuestos(
-                    impuestos,
-                    "2",
-                    "2",
-                    l10n_ec_base_iva,
-                    l10n_ec_iva,
-                    "impuesto",
-                    tarifa_iva,
-                    decimales=currency.decimal_places,
-                )
-            # if line.base_no_iva != 0:
-            #     self.l10n_ec_get_total_impuestos(impuestos, '2', '6', line.base_no_iva, 0.0, 'impuesto', 0,
-            #                              decimales=currency.decimal_places)
         # Las retenciones solo aplican para el esquema de gasolineras
         # retenciones = SubElement(node,"retenciones")
         if xml_version.version_file in ("2.0.0", "2.1.0"):
@@ -2487,9 +2730,7 @@ class AccountMove(models.Model):
                 if group[6] == third_amounts_group.id:
                     other_values.setdefault(group[0], 0)
                     other_values[group[0]] += group[1]
-            other_taxes = self.line_ids.mapped("tax_ids").filtered(
-                lambda x: x.tax_group_id.id == third_amounts_group.id
-            )
+            other_taxes = self.line_ids.mapped("tax_ids")._l10n_ec_filter_by_role("third_amounts")
             if other_values and len(other_values.keys()) == 1 and len(other_taxes) == 1:
                 otrosRubrosTerceros = SubElement(node, "otrosRubrosTerceros")
                 for name in other_values.keys():
@@ -2503,10 +2744,7 @@ class AccountMove(models.Model):
         util_model = self.env["l10n_ec.utils"]
         company = self.company_id or self.env.company
         currency = company.currency_id
-        precision_get = self.env["decimal.precision"].precision_get
-        digits_precision_product = precision_get("Product Price")
-        digits_precision_qty = precision_get("Product Unit of Measure")
-        digits_precision_discount = precision_get("Discount")
+        detalle_plan = self._l10n_ec_get_xml_detail_plan(self.l10n_ec_get_document_version_xml(), currency)
         infoNotaCredito = SubElement(node, "infoNotaCredito")
         fecha_factura = self.invoice_date.strftime(util_model.get_formato_date())
         SubElement(infoNotaCredito, "fechaEmision").text = fecha_factura
@@ -2580,59 +2818,12 @@ class AccountMove(models.Model):
         )
         # Lineas de Factura
         detalles = SubElement(node, "detalles")
-        for line in invoice_lines:
-            line_data = invoice_line_data.get(line.id, {})
-            discount = line_data["discount"]
-            subtotal = line_data["subtotal"]
-            l10n_ec_base_iva_0 = line_data["l10n_ec_base_iva_0"]
-            l10n_ec_base_iva = line_data["l10n_ec_base_iva"]
-            l10n_ec_iva = line_data["l10n_ec_iva"]
-            tarifa_iva = line_data["tarifa_iva"]
-            detalle = SubElement(detalles, "detalle")
-            SubElement(detalle, "codigoInterno").text = util_model._clean_str(
-                line.product_id and line.product_id.default_code and line.product_id.default_code[:25] or "N/A"
-            )
-            #             SubElement(detalle,"codigoAdicional").text = util_model._clean_str(line.product_id and line.product_id.default_code and line.product_id.default_code[:25] or 'N/A')
-            SubElement(detalle, "descripcion").text = util_model._clean_str(
-                line.product_id and line.product_id.name[:300] or line.name[:300]
-            )
-            # Debido a que los precios son en 2 decimales, es necesario hacer razonable el precio unitario
-            SubElement(detalle, "cantidad").text = util_model.formato_numero(line.quantity, digits_precision_qty)
-            SubElement(detalle, "precioUnitario").text = util_model.formato_numero(
-                line.price_unit, digits_precision_product
-            )
-            SubElement(detalle, "descuento").text = util_model.formato_numero(
-                discount or 0.0, digits_precision_discount
-            )
-            SubElement(detalle, "precioTotalSinImpuesto").text = util_model.formato_numero(
-                subtotal, currency.decimal_places
+        for line in self._l10n_ec_iter_records(invoice_lines):
+            sri_xml_plan.render(
+                detalles,
+                detalle_plan,
+                self._l10n_ec_prepare_detail_credit_note(line, invoice_line_data.get(line.id, {}), currency),
             )
-            impuestos = SubElement(detalle, "impuestos")
-            if not currency.is_zero(l10n_ec_base_iva_0):
-                self.l10n_ec_get_total_impuestos(
-                    impuestos,
-                    "2",
-                    "0",
-                    l10n_ec_base_iva_0,
-                    0.0,
-                    "impuesto",
-                    0,
-                    decimales=currency.decimal_places,
-                )
-            if not currency.is_zero(l10n_ec_base_iva):
-                self.l10n_ec_get_total_impuestos(
-                    impuestos,
-                    "2",
-                    "2",
-                    l10n_ec_base_iva,
-                    l10n_ec_iva,
-                    "impuesto",
-                    tarifa_iva,
-                    decimales=currency.decimal_places,
-                )
-            # if line.base_no_iva != 0:
-            #     self.l10n_ec_get_total_impuestos(impuestos, '2', '6', line.base_no_iva, 0.0, 'impuesto', 0,
-            #                              decimales=currency.decimal_places)
         self.l10n_ec_add_info_adicional(node)
         return node
 
@@ -2722,10 +2913,7 @@ class AccountMove(models.Model):
         util_model = self.env["l10n_ec.utils"]
         company = self.company_id or self.env.company
         currency = company.currency_id
-        precision_get = self.env["decimal.precision"].precision_get
-        digits_precision_product = precision_get("Product Price")
-        digits_precision_qty = precision_get("Product Unit of Measure")
-        digits_precision_discount = precision_get("Discount")
+        detalle_plan = self._l10n_ec_get_xml_detail_plan(self.l10n_ec_get_document_version_xml(), currency)
         infoLiquidacionCompra = SubElement(node, "infoLiquidacionCompra")
         fecha_emision = self.invoice_date.strftime(util_model.get_formato_date())
         SubElement(infoLiquidacionCompra, "fechaEmision").text = fecha_emision
@@ -2821,59 +3009,8 @@ class AccountMove(models.Model):
                 SubElement(pago, "plazo").text = util_model.formato_numero(payment_data.get("plazo"), 0)
                 SubElement(pago, "unidadTiempo").text = payment_data.get("unidadTiempo") or "dias"
         detalles = SubElement(node, "detalles")
-        for line in self.invoice_line_ids:
-            detalle = SubElement(detalles, "detalle")
-            SubElement(detalle, "codigoPrincipal").text = util_model._clean_str(
-                line.product_id and line.product_id.default_code and line.product_id.default_code[:25] or "N/A"
-            )
-            SubElement(detalle, "descripcion").text = util_model._clean_str(
-                line.product_id and line.product_id.name[:300] or line.name[:300]
-            )
-            SubElement(detalle, "unidadMedida").text = line.product_uom_id and line.product_uom_id.display_name or "N/A"
-            # Debido a que los precios son en 2 decimales, es necesario hacer razonable el precio unitario
-            SubElement(detalle, "cantidad").text = util_model.formato_numero(
-                line.quantity, decimales=digits_precision_qty
-            )
-            SubElement(detalle, "precioUnitario").text = util_model.formato_numero(
-                line.price_unit, decimales=digits_precision_product
-            )
-            discount = round(((line.price_unit * line.quantity) * ((line.discount or 0.0) / 100)), 2)
-            # TODO: hacer un redondeo con las utilidades del sistema
-            subtotal = round(((line.price_unit * line.quantity) - discount), 2)
-            SubElement(detalle, "descuento").text = util_model.formato_numero(
-                discount or 0.0, decimales=digits_precision_discount
-            )
-            SubElement(detalle, "precioTotalSinImpuesto").text = util_model.formato_numero(
-                subtotal, decimales=currency.decimal_places
-            )
-            impuestos = SubElement(detalle, "impuestos")
-            if line.l10n_ec_base_iva_0 != 0:
-                self.l10n_ec_get_total_impuestos(
-                    impuestos,
-                    "2",
-                    "0",
-                    line.l10n_ec_base_iva_0,
-                    0.0,
-                    "impuesto",
-                    0,
-                    False,
-                    decimales=currency.decimal_places,
-                )
-            if line.l10n_ec_base_iva != 0:
-                self.l10n_ec_get_total_impuestos(
-                    impuestos,
-                    "2",
-                    "2",
-                    line.l10n_ec_base_iva,
-                    line.l10n_ec_iva,
-                    "impuesto",
-                    12,
-                    False,
-                    decimales=currency.decimal_places,
-                )
-            # if line.base_no_iva != 0:
-            #     self.l10n_ec_get_total_impuestos(impuestos, '2', '6', line.base_no_iva, 0.0, 'impuesto', 0,
-            #     False, decimales=currency.decimal_places)
+        for line in self._l10n_ec_iter_records(self.invoice_line_ids):
+            sri_xml_plan.render(detalles, detalle_plan, self._l10n_ec_prepare_detail_liquidation(line))
         # informacion de reembolso solo se debe agregar si el tipo de documento es
         # Comprobante de venta emitido por reembolso(codigo 41)
         if self.l10n_ec_refund_ids:
@@ -2996,6 +3133,11 @@ class AccountMoveLine(models.Model):
         "move_id.invoice_date",
     )
     def _compute_l10n_ec_amounts(self):
+        tax_model = self.env["account.tax"]
+        # datos compartidos por todas las lineas del recordset:
+        # tasas de cambio consultadas y resultado de compute_all por cada combinacion de impuestos, precio, cantidad, moneda, producto y empresa
+        rates = {}
+        taxes_res_cache = {}
         for move_line in self:
             move = move_line.move_id
             move_date = move.date or fields.Date.context_today(move)
@@ -3004,25 +3146,36 @@ class AccountMoveLine(models.Model):
             l10n_ec_iva = 0.0
             price_unit_wo_discount = move_line.price_unit * (1 - (move_line.discount / 100.0))
             l10n_ec_discount_total = move_line._l10n_ec_get_discount_total()
-            taxes_res = move_line.tax_ids._origin.compute_all(
+            is_refund = move.type in ("out_refund", "in_refund")
+            taxes = move_line.tax_ids._origin
+            taxes_key = (
+                taxes,
                 price_unit_wo_discount,
-                quantity=move_line.quantity,
-                currency=move.currency_id,
-                product=move_line.product_id,
-                partner=move.partner_id,
-                is_refund=move.type in ("out_refund", "in_refund"),
+                move_line.quantity,
+                move.currency_id,
+                move_line.product_id,
+                move.partner_id,
+                is_refund,
             )
+            if taxes_key not in taxes_res_cache:
+                taxes_res_cache[taxes_key] = taxes.compute_all(
+                    price_unit_wo_discount,
+                    quantity=move_line.quantity,
+                    currency=move.currency_id,
+                    product=move_line.product_id,
+                    partner=move.partner_id,
+                    is_refund=is_refund,
+                )
+            taxes_res = taxes_res_cache[taxes_key]
             # impuestos de iva 0 no agregan reparticion de impuestos,
             # por ahora se consideran base_iva_0, verificar esto
             if taxes_res["taxes"]:
                 for tax_data in taxes_res["taxes"]:
-                    tax = self.env["account.tax"].browse(tax_data["id"])
-                    iva_group = self.env.ref("l10n_ec_niif.tax_group_iva")
-                    iva_0_group = self.env.ref("l10n_ec_niif.tax_group_iva_0")
-                    if tax.tax_group_id.id == iva_group.id:
+                    tax_role = tax_model.browse(tax_data["id"])._l10n_ec_get_tax_info()["role"]
+                    if tax_role == "iva":
                         l10n_ec_base_iva = tax_data["base"]
                         l10n_ec_iva = tax_data["amount"]
-                    if tax.tax_group_id.id == iva_0_group.id:
+                    if tax_role == "iva0":
                         l10n_ec_base_iva_0 = tax_data["base"]
             else:
                 l10n_ec_base_iva_0 = taxes_res["total_excluded"]
@@ -3033,26 +3186,18 @@ class AccountMoveLine(models.Model):
             # FIXME: cuando se crean lineas desde una NC, en el onchange de la factura a rectificar
             # no se tiene aun referencia a la moneda, asi que no hacer conversion de moneda
             if move.currency_id:
-                move_line.l10n_ec_base_iva_0_currency = move.currency_id._convert(
-                    l10n_ec_base_iva_0,
-                    move.company_currency_id,
-                    move.company_id,
-                    move_date,
-                )
-                move_line.l10n_ec_base_iva_currency = move.currency_id._convert(
-                    l10n_ec_base_iva,
-                    move.company_currency_id,
-                    move.company_id,
-                    move_date,
-                )
-                move_line.l10n_ec_iva_currency = move.currency_id._convert(
-                    l10n_ec_iva, move.company_currency_id, move.company_id, move_date
-                )
-                move_line.l10n_ec_discount_total_currency = move.currency_id._convert(
-                    l10n_ec_discount_total,
+                (
+                    move_line.l10n_ec_base_iva_0_currency,
+                    move_line.l10n_ec_base_iva_currency,
+                    move_line.l10n_ec_iva_currency,
+                    move_line.l10n_ec_discount_total_currency,
+                ) = move._l10n_ec_convert_amounts(
+                    [l10n_ec_base_iva_0, l10n_ec_base_iva, l10n_ec_iva, l10n_ec_discount_total],
+                    move.currency_id,
                     move.company_currency_id,
                     move.company_id,
                     move_date,
+                    rates,
                 )
             else:
                 move_line.l10n_ec_base_iva_0_currency = l10n_ec_base_iva_0
@@ -3067,10 +3212,9 @@ class AccountMoveLine(models.Model):
     def _get_third_amounts_line(self):
         self.ensure_one()
         res = {}
-        other_tax = self.env.ref("l10n_ec_niif.tax_group_third_amounts")
         not_apply_iva = self.env.ref("l10n_ec_niif.1_tax_541_iva")
-        if len(self.tax_ids.filtered(lambda x: x.tax_group_id.id == other_tax.id)) == 1:
-            other_tax = self.tax_ids.filtered(lambda x: x.tax_group_id.id == other_tax.id)
+        other_tax = self.tax_ids._l10n_ec_filter_by_role("third_amounts")
+        if len(other_tax) == 1:
             taxes = other_tax.compute_all(price_unit=self.price_subtotal, quantity=1.0)
             amount_tax = 0
             account_id = False
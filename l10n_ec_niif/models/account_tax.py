@@ -1,4 +1,15 @@
-from odoo import api, fields, models
+from odoo import api, fields, models, tools
+
+# rol de los impuestos en la localizacion segun su grupo de impuestos
+L10N_EC_TAX_GROUP_ROLES = [
+    ("iva", "l10n_ec_niif.tax_group_iva"),
+    ("iva0", "l10n_ec_niif.tax_group_iva_0"),
+    ("iva_exempt", "l10n_ec_niif.tax_group_iva_exempt"),
+    ("iva_no_apply", "l10n_ec_niif.tax_group_iva_no_apply"),
+    ("withhold_iva", "l10n_ec_niif.tax_group_iva_withhold"),
+    ("withhold_rent", "l10n_ec_niif.tax_group_renta_withhold"),
+    ("third_amounts", "l10n_ec_niif.tax_group_third_amounts"),
+]
 
 
 class AccountTaxGroup(models.Model):
@@ -6,6 +17,16 @@ class AccountTaxGroup(models.Model):
 
     l10n_ec_xml_fe_code = fields.Char("Tax Code for Electronic Documents", size=5)
 
+    def write(self, vals):
+        res = super(AccountTaxGroup, self).write(vals)
+        self.clear_caches()
+        return res
+
+    def unlink(self):
+        res = super(AccountTaxGroup, self).unlink()
+        self.clear_caches()
+        return res
+
 
 class AccountTax(models.Model):
     _inherit = "account.tax"
@@ -25,26 +46,86 @@ class AccountTax(models.Model):
     @api.model_create_multi
     def create(self, vals):
         recs = super(AccountTax, self).create(vals)
+        self.clear_caches()
         recs._l10n_ec_action_create_tax_for_withholding()
         return recs
 
+    def write(self, vals):
+        res = super(AccountTax, self).write(vals)
+        self.clear_caches()
+        return res
+
+    def unlink(self):
+        res = super(AccountTax, self).unlink()
+        self.clear_caches()
+        return res
+
+    @api.model
+    def _l10n_ec_get_role_by_group(self):
+        role_by_group = {}
+        for role, xml_id in L10N_EC_TAX_GROUP_ROLES:
+            tax_group = self.env.ref(xml_id, raise_if_not_found=False)
+            if tax_group:
+                role_by_group[tax_group.id] = role
+        return role_by_group
+
+    def _l10n_ec_prepare_tax_info(self, role_by_group):
+        self.ensure_one()
+        role = role_by_group.get(self.tax_group_id.id, False)
+        base_lines = self.invoice_repartition_line_ids.filtered(lambda x: x.repartition_type == "base")
+        tax_lines = self.invoice_repartition_line_ids.filtered(lambda x: x.repartition_type == "tax")
+        percent = abs(self.amount)
+        if role == "withhold_iva":
+            percent = abs(tax_lines[:1].factor_percent)
+        return {
+            "role": role,
+            "tax_group_id": self.tax_group_id.id,
+            "amount": self.amount,
+            "percent": percent,
+            "xml_fe_code": self.l10n_ec_xml_fe_code,
+            "group_code": self.tax_group_id.l10n_ec_xml_fe_code,
+            "base_tag_ids": tuple(base_lines.mapped("tag_ids").ids),
+            "tax_tag_ids": tuple(tax_lines.mapped("tag_ids").ids),
+        }
+
+    @api.model
+    @tools.ormcache()
+    def _l10n_ec_get_tax_classification(self):
+        """
+        Clasificacion de todos los impuestos para la localizacion, se calcula una vez por registro(base de datos)
+        y se descarta al modificar impuestos, grupos de impuestos o lineas de reparticion
+        el resultado es compartido, no se debe modificar
+        :return: dict(tax_id, dict) con rol, grupo, porcentaje, codigos del SRI y etiquetas de base e impuesto
+        """
+        role_by_group = self._l10n_ec_get_role_by_group()
+        taxes = self.sudo().with_context(active_test=False).search([])
+        taxes.mapped("tax_group_id")
+        taxes.mapped("invoice_repartition_line_ids.tag_ids")
+        return {tax.id: tax._l10n_ec_prepare_tax_info(role_by_group) for tax in taxes}
+
+    def _l10n_ec_get_tax_info(self):
+        """
+        Devuelve la clasificacion del impuesto sin consultar la base de datos
+        """
+        self.ensure_one()
+        tax_info = self._l10n_ec_get_tax_classification().get(self._origin.id)
+        if tax_info is None:
+            # impuesto nuevo o creado en otro proceso luego de calcular la clasificacion
+            tax_info = self._l10n_ec_prepare_tax_info(self._l10n_ec_get_role_by_group())
+        return tax_info
+
+    def _l10n_ec_filter_by_role(self, *roles):
+        return self.filtered(lambda x: x._l10n_ec_get_tax_info()["role"] in roles)
+
     def _l10n_ec_action_create_tax_for_withholding(self):
-        withhold_iva_group = self.env.ref("l10n_ec_niif.tax_group_iva_withhold")
-        withhold_rent_group = self.env.ref("l10n_ec_niif.tax_group_renta_withhold")
         percent_model = self.env["l10n_ec.withhold.line.percent"]
+        # no usar la clasificacion en cache, se recalcularia por cada impuesto creado(ej: al instalar el plan contable)
+        role_by_group = self._l10n_ec_get_role_by_group()
         for rec in self:
-            if rec.tax_group_id.id in (withhold_iva_group.id, withhold_rent_group.id):
-                withhold_type = (
-                    rec.tax_group_id.id == withhold_iva_group.id
-                    and "iva"
-                    or rec.tax_group_id.id == withhold_rent_group.id
-                    and "rent"
-                )
-                percent = abs(rec.amount)
-                if withhold_type == "iva":
-                    percent = abs(
-                        rec.invoice_repartition_line_ids.filtered(lambda x: x.repartition_type == "tax").factor_percent
-                    )
+            tax_info = rec._l10n_ec_prepare_tax_info(role_by_group)
+            if tax_info["role"] in ("withhold_iva", "withhold_rent"):
+                withhold_type = tax_info["role"] == "withhold_iva" and "iva" or "rent"
+                percent = tax_info["percent"]
                 current_percent = percent_model.search([("type", "=", withhold_type), ("percent", "=", percent)])
                 if not current_percent:
                     percent_model.create(
@@ -92,3 +173,19 @@ class AccountTaxRepartitionLine(models.Model):
     # at duplicate tax raise error for duplicity
     # on test is need duplicate taxes
     tag_ids = fields.Many2many(copy=False)
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        recs = super(AccountTaxRepartitionLine, self).create(vals_list)
+        self.clear_caches()
+        return recs
+
+    def write(self, vals):
+        res = super(AccountTaxRepartitionLine, self).write(vals)
+        self.clear_caches()
+        return res
+
+    def unlink(self):
+        res = super(AccountTaxRepartitionLine, self).unlink()
+        self.clear_caches()
+        return res
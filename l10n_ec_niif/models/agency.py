@@ -8,6 +8,10 @@ from ..models import modules_mapping
 
 _logger = logging.getLogger(__name__)
 
+# tipos de documento cuyo ultimo secuencial se guarda en l10n_ec.point.of.emission.counter
+# los documentos de estos tipos actualizan el contador al crearse, cambiar su numero o eliminarse
+SEQUENCE_COUNTER_TYPES = ("out_invoice", "out_refund", "debit_note_out", "liquidation", "withhold_purchase")
+
 
 class L10nEcAgency(models.Model):
 
@@ -195,6 +199,67 @@ class L10EcPointOfEmission(models.Model):
                 _logger.debug("Error function complete_number %s" % str(e))
         return document_format
 
+    def _l10n_ec_parse_sequence(self, document_number):
+        """
+        Devuelve el secuencial del numero de documento, 0 si el numero no es de este punto de emision
+        :param document_number: numero de documento con formato 001-001-000000001
+        :rtype: int
+        """
+        self.ensure_one()
+        try:
+            number_shop, number_printer, number = (document_number or "").split("-")
+            if number_shop == self.agency_id.number and number_printer == self.number:
+                return int(number)
+        except ValueError as e:
+            _logger.debug("Error parsing number: %s" % str(e))
+        return 0
+
+    def _l10n_ec_search_last_sequence(self, invoice_type):
+        """
+        Busca en los documentos el ultimo secuencial usado en el punto de emision
+        :param invoice_type: tipo de documento, ver get_next_value_sequence
+        :return: int, 0 si no hay documentos
+        """
+        self.ensure_one()
+        document_type = modules_mapping.get_document_type(invoice_type)
+        field_name = modules_mapping.get_field_name(document_type)
+        res_model = self.env[modules_mapping.get_model_name(document_type)]
+        start_doc_number = "{}-{}-{}".format(self.agency_id.number, self.number, "%")
+        domain = modules_mapping.get_domain(invoice_type, include_state=False) + [
+            (field_name, "like", start_doc_number)
+        ]
+        if self.company_id:
+            domain.append(("company_id", "=", self.company_id.id))
+        recs = (
+            res_model.sudo()
+            .with_context(skip_picking_type_filter=True)
+            .search(domain, order=field_name + " DESC", limit=1)
+        )
+        if not recs:
+            return 0
+        return self._l10n_ec_parse_sequence(recs[field_name])
+
+    def _l10n_ec_get_last_sequence(self, invoice_type):
+        """
+        Devuelve el ultimo secuencial usado en el punto de emision para el tipo de documento,
+        los tipos de SEQUENCE_COUNTER_TYPES se leen del contador con una sola consulta
+        :rtype: int
+        """
+        self.ensure_one()
+        if invoice_type in SEQUENCE_COUNTER_TYPES:
+            return self.env["l10n_ec.point.of.emission.counter"]._get_last_number(self, invoice_type)
+        return self._l10n_ec_search_last_sequence(invoice_type)
+
+    def l10n_ec_rebuild_sequence_counters(self):
+        """
+        Recalcular los contadores de secuenciales a partir de los documentos existentes
+        """
+        counter_model = self.env["l10n_ec.point.of.emission.counter"]
+        for printer in self:
+            for invoice_type in SEQUENCE_COUNTER_TYPES:
+                counter_model._refresh_last_number(printer, invoice_type)
+        return True
+
     def _get_first_number_electronic(self, invoice_type):
         self.ensure_one()
         first_number_electronic = False
@@ -222,6 +287,7 @@ class L10EcPointOfEmission(models.Model):
             company = self.env.company
         if not emission_date:
             emission_date = fields.Date.context_today(self)
+        emission_date = fields.Date.to_date(emission_date)
         document_type = modules_mapping.get_document_type(invoice_type)
         model_description = modules_mapping.get_document_name(document_type)
         doc_find = auth_line_model.browse()
@@ -238,19 +304,7 @@ class L10EcPointOfEmission(models.Model):
             _logger.debug("Error parsing number of document: %s" % str(e))
             is_number_valid = False
         if is_number_valid and number:
-            doc_find = auth_line_model.search(
-                [
-                    ("document_type", "=", document_type),
-                    ("point_of_emission_id", "=", self.id),
-                    ("first_sequence", "<=", number),
-                    ("last_sequence", ">=", number),
-                    ("authorization_id.company_id", "=", company.id),
-                    ("authorization_id.start_date", "<=", emission_date),
-                    ("authorization_id.expiration_date", ">=", emission_date),
-                ],
-                order="first_sequence",
-                limit=1,
-            )
+            doc_find = auth_line_model._find_authorization_range(self, document_type, number, emission_date, company)
         # mostrar excepcion si el punto de emision es electronico
         # pero para el tipo de documento no se esta en produccion aun(ambiente pruebas)
         force_preprint = False
@@ -288,69 +342,34 @@ class L10EcPointOfEmission(models.Model):
         xml_model = self.env["sri.xml.data"]
         if not date:
             date = fields.Date.context_today(self)
+        date = fields.Date.to_date(date)
         document_type = modules_mapping.get_document_type(invoice_type)
-        model_name = modules_mapping.get_model_name(document_type)
-        field_name = modules_mapping.get_field_name(document_type)
         model_description = modules_mapping.get_document_name(document_type)
-        res_model = self.env[model_name]
-        doc_recs = auth_line_model.search(
-            [
-                ("document_type", "=", document_type),
-                ("point_of_emission_id", "=", self.id),
-                ("authorization_id.start_date", "<=", date),
-                ("authorization_id.expiration_date", ">=", date),
-            ],
-            order="first_sequence",
-        )
-        start_doc_number = "{}-{}-{}".format(self.agency_id.number, self.number, "%")
-        domain = modules_mapping.get_domain(invoice_type, include_state=False) + [
-            (field_name, "like", start_doc_number)
-        ]
-        recs_finded = res_model.search(domain, order=field_name + " DESC", limit=1)
+        auth_ranges = auth_line_model._get_authorization_ranges(self.id, document_type)[1]
+        last_number = self._l10n_ec_get_last_sequence(invoice_type)
         doc_finded = auth_line_model.browse()
         next_seq = False
-        seq = False
-        if recs_finded:
-            next_seq = recs_finded[0][field_name]
+        seq = last_number
         try:
-            if next_seq:
-                seq = int(next_seq.split("-")[2])
             if self.env.context.get("numbers_skip", []):
                 seq = int(sorted(self.env.context.get("numbers_skip", []))[-1].split("-")[2])
         except Exception as e:
             _logger.debug("Error parsing number: %s" % str(e))
             seq = False
-        if doc_recs:
-            for doc in doc_recs:
-                if date >= doc.authorization_id.start_date:
-                    if seq and doc.first_sequence <= seq < doc.last_sequence:
-                        next_seq = doc.point_of_emission_id.create_number(seq + 1)
-                        doc_finded = doc
-                        break
-                    elif seq and seq == doc.last_sequence:
-                        next_seq = "{}-{}-".format(self.agency_id.number, self.number)
-                        doc_finded = doc
-                        break
-                    elif not seq:
-                        next_seq = doc.point_of_emission_id.create_number(doc.first_sequence)
-                        doc_finded = doc
-                        break
-            if not doc_finded and recs_finded:
-                try:
-                    seq = int(next_seq.split("-")[2])
-                except Exception as e:
-                    _logger.debug("Error parsing number: %s" % str(e))
-                    seq = False
-                if seq:
-                    for doc in doc_recs:
-                        if doc.first_sequence > seq and date >= doc.authorization_id.start_date:
-                            next_seq = doc.point_of_emission_id.create_number(doc.first_sequence)
-                            doc_finded = doc
-                            break
-                    if not doc_finded:
-                        next_seq = ""
-                else:
-                    next_seq = ""
+        if any(auth_range.start_date <= date <= auth_range.expiration_date for auth_range in auth_ranges):
+            # los rangos no se cruzan, buscar el que contiene el secuencial o el primero vigente
+            if seq:
+                doc_finded = auth_line_model._find_authorization_range(self, document_type, seq, date)
+                if doc_finded and seq < doc_finded.last_sequence:
+                    next_seq = self.create_number(seq + 1)
+                elif doc_finded:
+                    next_seq = "{}-{}-".format(self.agency_id.number, self.number)
+            else:
+                doc_finded = auth_line_model._find_next_authorization_range(self, document_type, None, date)
+                next_seq = self.create_number(doc_finded.first_sequence)
+            if not doc_finded and last_number:
+                doc_finded = auth_line_model._find_next_authorization_range(self, document_type, last_number, date)
+                next_seq = doc_finded and self.create_number(doc_finded.first_sequence) or ""
         else:
             next_seq = ""
         # mostrar excepcion si el punto de emision es electronico
@@ -404,22 +423,8 @@ class L10EcPointOfEmission(models.Model):
                 except Exception:
                     return False, False
                 next_seq = self.create_number(first_number_electronic)
-                # todos los documentos de account.move se guardan en la misma tabla y con el mismo nombre de campo
-                # obtener el domain segun el tipo de documento
-                domain = modules_mapping.get_domain(invoice_type, include_state=False)
-                start_doc_number = "{}-{}-{}".format(self.agency_id.number, self.number, "%")
-                domain.append((field_name, "ilike", start_doc_number))
-                domain.append(("company_id", "=", self.company_id.id))
-                recs = res_model.with_context(skip_picking_type_filter=True).search(
-                    domain, order=field_name + " DESC", limit=1
-                )
-                if recs:
-                    try:
-                        last_number = int(recs[0][field_name].split("-")[2])
-                    except Exception:
-                        last_number = 0
-                    if last_number >= first_number_electronic:
-                        next_seq = self.create_number(last_number + 1)
+                if last_number >= first_number_electronic:
+                    next_seq = self.create_number(last_number + 1)
             return next_seq, doc_finded
 
 
@@ -445,3 +450,113 @@ class L10EcPointOfEmissionDocumentSequence(models.Model):
         ],
         required=True,
     )
+
+
+class L10nEcPointOfEmissionCounter(models.Model):
+    """
+    Ultimo secuencial usado por punto de emision y tipo de documento,
+    permite obtener el siguiente numero con una sola consulta sin importar la cantidad de documentos
+    el contador se crea a partir de los documentos existentes la primera vez que se consulta
+    """
+
+    _name = "l10n_ec.point.of.emission.counter"
+    _description = "Secuenciales por punto de emision"
+
+    printer_id = fields.Many2one(
+        comodel_name="l10n_ec.point.of.emission",
+        string="Point of Emission",
+        required=True,
+        readonly=True,
+        ondelete="cascade",
+    )
+    invoice_type = fields.Char(string="Document Type", required=True, readonly=True)
+    last_number = fields.Integer(string="Last Number", readonly=True)
+
+    _sql_constraints = [
+        (
+            "printer_invoice_type_uniq",
+            "unique (printer_id, invoice_type)",
+            _("The counter must be unique by point of emission and document type!"),
+        ),
+    ]
+
+    @api.model
+    def _get_last_number(self, printer, invoice_type):
+        self.env.cr.execute(
+            "SELECT last_number FROM l10n_ec_point_of_emission_counter WHERE printer_id = %s AND invoice_type = %s",
+            (printer.id, invoice_type),
+        )
+        row = self.env.cr.fetchone()
+        if row is None:
+            return self._refresh_last_number(printer, invoice_type)
+        return row[0]
+
+    @api.model
+    def _refresh_last_number(self, printer, invoice_type):
+        """
+        Tomar el ultimo secuencial de los documentos existentes,
+        el contador se bloquea antes de buscar en los documentos,
+        asi una transaccion que registro un secuencial mayor termina antes
+        o provoca un error de concurrencia(la transaccion se reintenta) y el contador no queda desactualizado
+        """
+        self.env.cr.execute(
+            """
+            SELECT id FROM l10n_ec_point_of_emission_counter
+            WHERE printer_id = %s AND invoice_type = %s
+            FOR UPDATE
+            """,
+            (printer.id, invoice_type),
+        )
+        counter_exists = bool(self.env.cr.fetchone())
+        last_number = printer._l10n_ec_search_last_sequence(invoice_type)
+        if counter_exists:
+            self.env.cr.execute(
+                """
+                UPDATE l10n_ec_point_of_emission_counter SET last_number = %s
+                WHERE printer_id = %s AND invoice_type = %s
+                """,
+                (last_number, printer.id, invoice_type),
+            )
+        else:
+            # otra transaccion pudo crear el contador al mismo tiempo, no reducir el secuencial que registro
+            self.env.cr.execute(
+                """
+                INSERT INTO l10n_ec_point_of_emission_counter
+                    (printer_id, invoice_type, last_number, create_uid, create_date, write_uid, write_date)
+                VALUES (%s, %s, %s, %s, now() at time zone 'UTC', %s, now() at time zone 'UTC')
+                ON CONFLICT (printer_id, invoice_type) DO UPDATE
+                    SET last_number = GREATEST(l10n_ec_point_of_emission_counter.last_number, EXCLUDED.last_number)
+                """,
+                (printer.id, invoice_type, last_number, self.env.uid, self.env.uid),
+            )
+        return last_number
+
+    @api.model
+    def _register_numbers(self, numbers):
+        """
+        Actualizar los contadores con los secuenciales de documentos nuevos o modificados,
+        solo se bloquea el contador cuando el secuencial es mayor al registrado
+        :param numbers: dict {(punto de emision, tipo de documento): secuencial}
+        """
+        for (printer, invoice_type), number in numbers.items():
+            if number > self._get_last_number(printer, invoice_type):
+                self.env.cr.execute(
+                    """
+                    UPDATE l10n_ec_point_of_emission_counter SET last_number = GREATEST(last_number, %s)
+                    WHERE printer_id = %s AND invoice_type = %s
+                    """,
+                    (number, printer.id, invoice_type),
+                )
+        return True
+
+    @api.model
+    def _release_numbers(self, numbers):
+        """
+        Recalcular los contadores cuando se elimina o cambia el numero del ultimo documento,
+        asi el siguiente documento vuelve a tomar ese secuencial
+        :param numbers: dict {(punto de emision, tipo de documento): secuencial anterior}
+        """
+        for (printer, invoice_type), number in numbers.items():
+            if number >= self._get_last_number(printer, invoice_type):
+                self._refresh_last_number(printer, invoice_type)
+        return True
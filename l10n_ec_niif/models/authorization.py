@@ -1,11 +1,19 @@
 #
+from bisect import bisect_right
+from collections import namedtuple
 
-from odoo import api, fields, models
+from odoo import api, fields, models, tools
 from odoo.exceptions import UserError, ValidationError
 from odoo.tools.translate import _
 
 from ..models import modules_mapping
 
+# rango de secuenciales de una linea de autorizacion, se guarda en cache(sin registros del ORM)
+AuthorizationRange = namedtuple(
+    "AuthorizationRange",
+    ["first_sequence", "last_sequence", "start_date", "expiration_date", "company_id", "line_id"],
+)
+
 
 class L10nECSriAuthorization(models.Model):
 
@@ -32,6 +40,12 @@ class L10nECSriAuthorization(models.Model):
     )
     count_invoice = fields.Integer(string="Count Invoice", compute="_compute_count_invoice")
 
+    def write(self, values):
+        res = super(L10nECSriAuthorization, self).write(values)
+        # las fechas, compañia y estado de la autorizacion estan en los rangos guardados en cache
+        self.clear_caches()
+        return res
+
     @api.constrains(
         "start_date",
         "expiration_date",
@@ -65,6 +79,7 @@ class L10nECSriAuthorization(models.Model):
                 )
         # Delete the empty agency
         result = super(L10nECSriAuthorization, self).unlink()
+        self.clear_caches()
         return result
 
     _sql_constraints = [
@@ -140,6 +155,98 @@ class L10nECSriAuthorizationLine(models.Model):
     count_invoice = fields.Integer(string="Count Invoice", related="authorization_id.count_invoice")
     active = fields.Boolean(string="Active?", related="authorization_id.active", default=True)
 
+    def init(self):
+        # indice para buscar los rangos por punto de emision y tipo de documento ordenados por secuencial
+        tools.create_index(
+            self._cr,
+            "l10n_ec_sri_authorization_line_range_index",
+            self._table,
+            ["point_of_emission_id", "document_type", "first_sequence", "last_sequence"],
+        )
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        recs = super(L10nECSriAuthorizationLine, self).create(vals_list)
+        self.clear_caches()
+        return recs
+
+    def write(self, values):
+        res = super(L10nECSriAuthorizationLine, self).write(values)
+        self.clear_caches()
+        return res
+
+    def unlink(self):
+        res = super(L10nECSriAuthorizationLine, self).unlink()
+        self.clear_caches()
+        return res
+
+    @api.model
+    @tools.ormcache("point_of_emission_id", "document_type")
+    def _get_authorization_ranges(self, point_of_emission_id, document_type):
+        """
+        Rangos de secuenciales de las autorizaciones activas del punto de emision y tipo de documento,
+        ordenados por secuencial inicial, los rangos no se cruzan(ver _check_document_type)
+        se guardan en cache hasta que se modifique alguna autorizacion
+        :return: tuple(tuple(secuencial inicial de cada rango), tuple(AuthorizationRange))
+        """
+        lines = (
+            self.sudo()
+            .with_context(active_test=True)
+            .search(
+                [
+                    ("point_of_emission_id", "=", point_of_emission_id),
+                    ("document_type", "=", document_type),
+                ],
+                order="first_sequence",
+            )
+        )
+        ranges = tuple(
+            AuthorizationRange(
+                line.first_sequence,
+                line.last_sequence,
+                line.authorization_id.start_date,
+                line.authorization_id.expiration_date,
+                line.authorization_id.company_id.id,
+                line.id,
+            )
+            for line in lines
+        )
+        return tuple(auth_range.first_sequence for auth_range in ranges), ranges
+
+    @api.model
+    def _find_authorization_range(self, point_of_emission, document_type, number, date, company=None):
+        """
+        Buscar la linea de autorizacion que contiene el secuencial y esta vigente a la fecha
+        :param company: compañia de la autorizacion, opcional
+        :return: browse_record(l10n_ec.sri.authorization.line)
+        """
+        first_sequences, ranges = self._get_authorization_ranges(point_of_emission.id, document_type)
+        index = bisect_right(first_sequences, number) - 1
+        if index >= 0:
+            auth_range = ranges[index]
+            if (
+                number <= auth_range.last_sequence
+                and auth_range.start_date <= date <= auth_range.expiration_date
+                and (company is None or auth_range.company_id == company.id)
+            ):
+                return self.browse(auth_range.line_id)
+        return self.browse()
+
+    @api.model
+    def _find_next_authorization_range(self, point_of_emission, document_type, number, date):
+        """
+        Buscar la primera linea de autorizacion vigente a la fecha que empieza despues del secuencial
+        :param number: secuencial, None para tomar el primer rango vigente
+        :return: browse_record(l10n_ec.sri.authorization.line)
+        """
+        first_sequences, ranges = self._get_authorization_ranges(point_of_emission.id, document_type)
+        if number is not None:
+            ranges = ranges[bisect_right(first_sequences, number) :]
+        for auth_range in ranges:
+            if auth_range.start_date <= date <= auth_range.expiration_date:
+                return self.browse(auth_range.line_id)
+        return self.browse()
+
     @api.constrains(
         "first_sequence",
         "last_sequence",
@@ -318,7 +318,8 @@ class L10nECSriAuthorizationSupplier(models.Model):
                         authorization.last_sequence,
                     )
                 )
-        if number:
+        # la duplicidad ya fue validada para todo el lote
+        if number and not self.env.context.get("l10n_ec_duplicity_checked"):
             if partner_id:
                 # FIX: no usar like ya que si tengo un documento 001-001-00000004
                 # y el numero a validar es 001-001-000000044
@@ -353,6 +354,9 @@ class L10nECSriAuthorizationSupplier(models.Model):
             raise UserError(_("Check parameters of partner and number to continue"))
         if not invoice_type:
             raise UserError(_("You must specify type of document to continue."))
+        # la duplicidad ya fue validada para todo el lote
+        if self.env.context.get("l10n_ec_duplicity_checked"):
+            return True
         partner_model = self.env["res.partner"]
         document_type = modules_mapping.get_document_type(invoice_type)
         model_name = modules_mapping.get_model_name(document_type)
@@ -94,6 +94,11 @@ class ResCompany(models.Model):
     l10n_ec_electronic_credit_note = fields.Boolean("Authorized for Credit Note?")
     l10n_ec_electronic_debit_note = fields.Boolean("Authorized for Debit Note?")
     l10n_ec_electronic_liquidation = fields.Boolean("Authorized for Purchase Liquidation?")
+    l10n_ec_electronic_batch = fields.Boolean(
+        "Send documents in batch(Lote Masivo)?",
+        help="Offline documents are signed individually and sent to SRI in a single batch per document type",
+    )
+    l10n_ec_batch_size = fields.Integer("Documents per batch", default=50)
     l10n_ec_invoice_version_xml_id = fields.Many2one(
         "l10n_ec.xml.version",
         string="XML Version for Invoice",
@@ -124,6 +129,12 @@ class ResCompany(models.Model):
     l10n_ec_max_intentos = fields.Integer("Maximum attempts for authorization")
     l10n_ec_ws_timeout = fields.Integer("Timeout Web Service", default=30)
     l10n_ec_cron_process = fields.Integer("Number Documents Process in Cron", default=100)
+    l10n_ec_cron_workers = fields.Integer(
+        "Parallel processes for offline documents",
+        default=1,
+        help="Number of threads that send offline documents to SRI at the same time, "
+        "each document is processed and saved in its own transaction",
+    )
     l10n_ec_send_mail_from = fields.Datetime("Sent mail from", default=lambda self: fields.Datetime.now())
     l10n_ec_send_mail_invoice = fields.Boolean(
         "Invoice?",
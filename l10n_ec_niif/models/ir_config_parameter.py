@@ -0,0 +1,27 @@
+from odoo import api, models
+
+from ..models import sri_ws_client
+
+
+class IrConfigParameter(models.Model):
+    _inherit = "ir.config_parameter"
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        records = super(IrConfigParameter, self).create(vals_list)
+        records._l10n_ec_clear_ws_clients()
+        return records
+
+    def write(self, vals):
+        res = super(IrConfigParameter, self).write(vals)
+        self._l10n_ec_clear_ws_clients()
+        return res
+
+    def unlink(self):
+        self._l10n_ec_clear_ws_clients()
+        return super(IrConfigParameter, self).unlink()
+
+    def _l10n_ec_clear_ws_clients(self):
+        # si cambia la url de algun webservice del SRI, descartar los clientes en memoria
+        if any(param.key in sri_ws_client.WS_CONFIG_PARAMETERS for param in self):
+            sri_ws_client.clear_clients()
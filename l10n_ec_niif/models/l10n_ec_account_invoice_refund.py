@@ -69,7 +69,27 @@ class AccountInvoiceRefund(models.Model):
 
     @api.constrains("document_number", "l10n_ec_partner_authorization_id")
     def _check_number_invoice(self):
-        auth_s_model = self.env["l10n_ec.sri.authorization.supplier"]
+        # validar la duplicidad de todo el lote con una sola consulta
+        # los documentos de proveedores extranjeros con autorizacion no se validan
+        refunds = self.filtered(
+            lambda x: x.document_number and x.partner_id and not (x.document_type == "normal" and x.l10n_ec_foreign)
+        )
+        if refunds:
+            groups = self.read_group(
+                [
+                    ("partner_id", "in", refunds.mapped("partner_id").ids),
+                    ("document_number", "in", list(set(refunds.mapped("document_number")))),
+                ],
+                ["partner_id"],
+                ["partner_id", "document_number"],
+                lazy=False,
+            )
+            refund_keys = {(refund.partner_id.id, refund.document_number) for refund in refunds}
+            for group in groups:
+                key = (group["partner_id"] and group["partner_id"][0], group["document_number"])
+                if group["__count"] > 1 and key in refund_keys:
+                    raise ValidationError(_("Another document with the same number already exists"))
+        auth_s_model = self.env["l10n_ec.sri.authorization.supplier"].with_context(l10n_ec_duplicity_checked=True)
         util_model = self.env["l10n_ec.utils"]
         padding_auth = "1,9"
         for refund in self:
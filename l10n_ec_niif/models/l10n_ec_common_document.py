@@ -1,4 +1,4 @@
-from odoo import fields, models
+from odoo import api, fields, models
 
 
 class L10nEcCommonDocument(models.AbstractModel):
@@ -33,6 +33,25 @@ class L10nEcCommonDocument(models.AbstractModel):
         # (account.move, purchase.order, sale.order, pos.order, etc)
         pass
 
+    @api.model
+    def _l10n_ec_convert_amounts(self, amounts, currency, to_currency, company, date, rates=None):
+        """
+        Convertir varios valores de una moneda a otra consultando la tasa de cambio una sola vez,
+        el resultado es el mismo que llamar a currency._convert por cada valor
+        :param amounts: lista de valores a convertir
+        :param rates: dict con las tasas ya consultadas, para compartirlas entre varios documentos
+        :return: lista con los valores convertidos y redondeados en la moneda destino
+        """
+        currency, to_currency = currency or to_currency, to_currency or currency
+        if currency == to_currency:
+            return [to_currency.round(amount) for amount in amounts]
+        if rates is None:
+            rates = {}
+        rate_key = (currency.id, to_currency.id, company.id, date)
+        if rate_key not in rates:
+            rates[rate_key] = currency._get_conversion_rate(currency, to_currency, company, date)
+        return [to_currency.round(amount * rates[rate_key]) for amount in amounts]
+
 
 class L10nEcCommonDocumentLine(models.AbstractModel):
     _name = "l10n_ec.common.document.line"
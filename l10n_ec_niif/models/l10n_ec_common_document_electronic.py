@@ -1,10 +1,14 @@
 import base64
-from xml.etree.ElementTree import SubElement
+
+from lxml.etree import SubElement
 
 from odoo import _, api, fields, models
 from odoo.exceptions import UserError, ValidationError
 from odoo.tools import DEFAULT_SERVER_DATETIME_FORMAT as DTF
 
+# cantidad de lineas que se leen a la vez al generar el xml de documentos con muchas lineas
+XML_LINES_CHUNK_SIZE = 1000
+
 
 class L10nEcCommonDocumentElectronic(models.AbstractModel):
     _name = "l10n_ec.common.document.electronic"
@@ -27,21 +31,25 @@ class L10nEcCommonDocumentElectronic(models.AbstractModel):
     @api.constrains("l10n_ec_electronic_authorization")
     def _check_duplicity_electronic_authorization(self):
         partner_company = self.env.company.partner_id
-        for rec in self.filtered("l10n_ec_electronic_authorization"):
-            other_docs = self.search(
-                [
-                    (
-                        "l10n_ec_electronic_authorization",
-                        "=",
-                        rec.l10n_ec_electronic_authorization,
-                    ),
-                    ("commercial_partner_id", "!=", partner_company.id),
-                ]
-            )
-            if len(other_docs) > 1:
+        authorizations = set(
+            self.filtered("l10n_ec_electronic_authorization").mapped("l10n_ec_electronic_authorization")
+        )
+        if not authorizations:
+            return
+        # una sola consulta para todos los documentos del lote
+        groups = self.read_group(
+            [
+                ("l10n_ec_electronic_authorization", "in", list(authorizations)),
+                ("commercial_partner_id", "!=", partner_company.id),
+            ],
+            ["l10n_ec_electronic_authorization"],
+            ["l10n_ec_electronic_authorization"],
+        )
+        for group in groups:
+            if group["l10n_ec_electronic_authorization_count"] > 1:
                 raise ValidationError(
                     _("There is already a document with electronic authorization %s please verify")
-                    % (rec.l10n_ec_electronic_authorization)
+                    % (group["l10n_ec_electronic_authorization"])
                 )
 
     def _prepare_l10n_ec_sri_xml_values(self, company):
@@ -83,20 +91,22 @@ class L10nEcCommonDocumentElectronic(models.AbstractModel):
         if self.l10n_ec_xml_key and self.l10n_ec_xml_data_id:
             attachment = self.l10n_ec_get_attachments_electronic()
             if not attachment:
-                if file_data is None:
-                    file_data = self.l10n_ec_xml_data_id._action_create_file_authorized()
-                file_name = self.get_printed_report_name_l10n_ec()
-                if file_data:
-                    attachment = AttachmentModel.create(
-                        {
-                            "name": "%s.xml" % file_name,
-                            "res_id": self.id,
-                            "res_model": self._name,
-                            "datas": base64.encodebytes(file_data.encode()),
-                            "store_fname": "%s.xml" % file_name,
-                            "description": self.l10n_ec_xml_key,
-                        }
-                    )
+                with self.l10n_ec_xml_data_id._l10n_ec_measure_stage("attachment") as measure:
+                    if file_data is None:
+                        file_data = self.l10n_ec_xml_data_id._action_create_file_authorized()
+                    file_name = self.get_printed_report_name_l10n_ec()
+                    if file_data:
+                        measure["payload_size"] = len(file_data)
+                        attachment = AttachmentModel.create(
+                            {
+                                "name": "%s.xml" % file_name,
+                                "res_id": self.id,
+                                "res_model": self._name,
+                                "datas": base64.encodebytes(file_data.encode()),
+                                "store_fname": "%s.xml" % file_name,
+                                "description": self.l10n_ec_xml_key,
+                            }
+                        )
         return attachment
 
     def l10n_ec_action_update_electronic_authorization(self, numeroAutorizacion, l10n_ec_authorization_date):
@@ -154,6 +164,51 @@ class L10nEcCommonDocumentElectronic(models.AbstractModel):
         # esta funcion debe crear la data del documento en el xml(node_root)
         raise UserError(_("You must replace this function l10n_ec_action_generate_xml_data in its inherited class"))
 
+    def _l10n_ec_prefetch_electronic_data(self):
+        # funcion puede ser reemplazada en cada clase heredada
+        # esta funcion debe cargar en la cache del ORM, con pocas consultas,
+        # los datos que usa l10n_ec_action_generate_xml_data para todos los documentos del recordset
+        return self
+
+    def _l10n_ec_get_xml_fingerprint_data(self):
+        # funcion puede ser reemplazada en cada clase heredada
+        # esta funcion debe devolver los valores de todos los campos con que se genera el xml del documento
+        # None indica que no se puede calcular, asi el xml se genera y firma nuevamente en cada intento
+        return None
+
+    @api.model
+    def _l10n_ec_get_fields_values(self, records, field_paths):
+        """
+        Devuelve los valores de los campos de cada registro, en el orden de los registros y los campos
+        @param field_paths: lista de campos, pueden ser campos relacionados separados por punto
+        @return: lista de valores, los registros relacionados se devuelven como lista de ids
+        """
+        values = []
+        for record in self._l10n_ec_iter_records(records):
+            for field_path in field_paths:
+                value = record.mapped(field_path)
+                if isinstance(value, models.BaseModel):
+                    value = value.ids
+                values.append(value)
+        return values
+
+    @api.model
+    def _l10n_ec_iter_records(self, records, chunk_size=XML_LINES_CHUNK_SIZE):
+        """
+        Recorrer los registros(lineas del documento) por bloques,
+        cada bloque se lee en una sola consulta y se quita de la cache del ORM al terminar,
+        asi la memoria usada al generar el xml no depende de la cantidad de lineas del documento
+        los recordsets pequeños se recorren directamente para aprovechar los datos ya precargados
+        """
+        if len(records) <= chunk_size:
+            yield from records
+            return
+        records.flush()
+        for index in range(0, len(records), chunk_size):
+            chunk = records[index : index + chunk_size].with_prefetch()
+            yield from chunk
+            chunk.invalidate_cache(ids=chunk.ids)
+
     def _l10n_ec_get_info_aditional(self):
         info_data = []
         if "l10n_ec_info_aditional_ids" in self._fields:
@@ -1,13 +1,106 @@
 import base64
 import logging
+from functools import lru_cache
 
 import pytz
+from lxml import etree
 
 from odoo import _, api, models, tools
 from odoo.exceptions import UserError
 
 _logger = logging.getLogger(__name__)
 
+# caracteres que se eliminan del texto enviado en los xml electronicos
+CLEAN_STR_REMOVE = ".,-\a\b\f\n\r\t\v"
+# reemplazos por defecto, el resto de caracteres fuera de ALLOWED_CHARACTERS se reemplazan por espacio
+CLEAN_STR_REPLACE = {
+    "á": "a",
+    "à": "a",
+    "ä": "a",
+    "â": "a",
+    "Á": "A",
+    "À": "A",
+    "Ä": "A",
+    "Â": "A",
+    "é": "e",
+    "è": "e",
+    "ë": "e",
+    "ê": "e",
+    "É": "E",
+    "È": "E",
+    "Ë": "E",
+    "Ê": "E",
+    "í": "i",
+    "ì": "i",
+    "ï": "i",
+    "î": "i",
+    "Í": "I",
+    "Ì": "I",
+    "Ï": "I",
+    "Î": "I",
+    "ó": "o",
+    "ò": "o",
+    "ö": "o",
+    "ô": "o",
+    "Ó": "O",
+    "Ò": "O",
+    "Ö": "O",
+    "Ô": "O",
+    "ú": "u",
+    "ù": "u",
+    "ü": "u",
+    "û": "u",
+    "Ú": "U",
+    "Ù": "U",
+    "Ü": "U",
+    "Û": "U",
+    "ñ": "n",
+    "Ñ": "N",
+    "/": "-",
+    "&": "Y",
+    "º": "",
+    "´": "",
+}
+# espacio en blanco, numeros, letras mayusculas y minusculas
+ALLOWED_CHARACTERS = frozenset(" 0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz")
+# cantidad de textos limpios a mantener en memoria(nombres de empresas, direcciones, productos)
+CLEAN_STR_CACHE_SIZE = 4096
+
+
+class _CleanStrTable(dict):
+    """
+    Tabla de traduccion para str.translate, los caracteres que no estan en la tabla
+    se agregan al consultarse: se mantienen si estan permitidos, caso contrario se reemplazan por un espacio
+    """
+
+    def __missing__(self, code):
+        character = chr(code)
+        value = character if character in ALLOWED_CHARACTERS else " "
+        self[code] = value
+        return value
+
+
+def _build_clean_str_table():
+    table = _CleanStrTable()
+    for character in CLEAN_STR_REMOVE:
+        table[ord(character)] = ""
+    for character, replacement in CLEAN_STR_REPLACE.items():
+        # el reemplazo tambien debe quedar dentro de los caracteres permitidos
+        table[ord(character)] = "".join(c if c in ALLOWED_CHARACTERS else " " for c in replacement)
+    return table
+
+
+_clean_str_table = _build_clean_str_table()
+
+
+@lru_cache(maxsize=CLEAN_STR_CACHE_SIZE)
+def clean_str(value):
+    """
+    Dejar solo letras sin tildes, numeros y espacios, en una sola pasada sobre el texto
+    mismo resultado que l10n_ec.utils._clean_str con los reemplazos por defecto
+    """
+    return value.lstrip().translate(_clean_str_table).lstrip()
+
 
 class L10necUtils(models.AbstractModel):
     _name = "l10n_ec.utils"
@@ -15,6 +108,12 @@ class L10necUtils(models.AbstractModel):
 
     @api.model
     def indent(self, elem, level=0):
+        # lxml(4.5 o superior) indenta sin recursion en python, con el mismo resultado
+        if hasattr(etree, "indent") and etree.iselement(elem):
+            etree.indent(elem, space="  ", level=level)
+            if (len(elem) or level) and (not elem.tail or not elem.tail.strip()):
+                elem.tail = "\n" + level * "  "
+            return
         i = "\n" + level * "  "
         if len(elem):
             if not elem.text or not elem.text.strip():
@@ -97,8 +196,9 @@ class L10necUtils(models.AbstractModel):
         """
         if not string_to_reeplace:
             return string_to_reeplace
-        else:
-            string_to_reeplace = string_to_reeplace.lstrip()
+        if not list_characters and not separator and isinstance(string_to_reeplace, str):
+            return clean_str(string_to_reeplace)
+        string_to_reeplace = string_to_reeplace.lstrip()
         caracters = [".", ",", "-", "\a", "\b", "\f", "\n", "\r", "\t", "\v"]
         for c in caracters:
             string_to_reeplace = string_to_reeplace.replace(c, separator)
@@ -1,4 +1,6 @@
-from odoo import fields, models
+from odoo import fields, models, tools
+
+from ..models import sri_xsd_schema
 
 
 class L10nEcXmlVersion(models.Model):
@@ -28,6 +30,13 @@ class L10nEcXmlVersion(models.Model):
         required=True,
     )
 
+    def _register_hook(self):
+        res = super(L10nEcXmlVersion, self)._register_hook()
+        # compilar los esquemas xsd al cargar el registro, activar en el archivo de configuracion
+        if tools.config.get("l10n_ec_xsd_warmup", False):
+            sri_xsd_schema.warm_up(self.search([]).mapped("file_path"))
+        return res
+
     def name_get(self):
         res = []
         for element in self:
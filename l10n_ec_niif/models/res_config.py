@@ -142,6 +142,9 @@ class ResConfigSettings(models.TransientModel):
         related="company_id.l10n_ec_cron_process",
         readonly=False,
     )
+    l10n_ec_cron_workers = fields.Integer(related="company_id.l10n_ec_cron_workers", readonly=False)
+    l10n_ec_electronic_batch = fields.Boolean(related="company_id.l10n_ec_electronic_batch", readonly=False)
+    l10n_ec_batch_size = fields.Integer(related="company_id.l10n_ec_batch_size", readonly=False)
     l10n_ec_send_mail_from = fields.Datetime(
         "Sent mail from", related="company_id.l10n_ec_send_mail_from", readonly=False
     )
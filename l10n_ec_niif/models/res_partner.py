@@ -1,7 +1,6 @@
 import logging
 import re
 
-import requests
 from stdnum.ec import ci, ruc
 
 from odoo import SUPERUSER_ID, api, fields, models, tools
@@ -10,6 +9,38 @@ from odoo.tools.translate import _
 
 _logger = logging.getLogger(__name__)
 
+FINAL_CONSUMER_VAT = "9999999999999"
+
+
+def _check_vat_ec(vat):
+    """
+    Validar la identificacion ecuatoriana(cedula/RUC) sin pasar por el ORM
+    :return: tuple(valido, tipo de identificacion)
+    """
+    if vat == FINAL_CONSUMER_VAT:
+        return True, "Consumidor"
+    if len(vat) == 10:
+        return ci.is_valid(vat), "Cedula"
+    if len(vat) == 13:
+        if vat[2] == "6" and ci.is_valid(vat[:10]):
+            return True, "Ruc"
+        return ruc.is_valid(vat), "Ruc"
+    return False, False
+
+
+def _guess_identification_type(vat, refs):
+    """
+    Tipo de identificacion segun el numero, para los contribuyentes ecuatorianos que no lo tienen
+    :param refs: dict devuelto por ResPartner._l10n_ec_get_vat_validation_refs
+    :return: id del tipo de identificacion
+    """
+    if re.match(r"^([\s\d]+)$", vat):
+        if len(vat) == 10:
+            return refs["it_cedula_id"]
+        elif len(vat) == 13:
+            return refs["it_ruc_id"]
+    return refs["it_pasaporte_id"]
+
 
 class ResPartner(models.Model):
     _inherit = "res.partner"
@@ -172,70 +203,120 @@ class ResPartner(models.Model):
             return False
 
     def check_vat_ec(self, vat):
-        consumidor_final = self.verify_final_consumer(vat)
-        if consumidor_final:
-            return consumidor_final, "Consumidor"
-        elif len(vat) == 10:
-            return ci.is_valid(vat), "Cedula"
-        elif len(vat) == 13:
-            if vat[2] == "6":
-                if ci.is_valid(vat[:10]):
-                    return True, "Ruc"
-                else:
-                    return ruc.is_valid(vat), "Ruc"
-            else:
-                return ruc.is_valid(vat), "Ruc"
-        else:
-            return False, False
+        return _check_vat_ec(vat)
 
     @api.model
     def _get_partner_info_from_sri(self, vat):
         """
-        Consultar informacion del contribuyente segun el numero de RUC
+        Consultar informacion del contribuyente segun el numero de RUC,
+        primero en la cache local(l10n_ec.taxpayer.cache) y luego al SRI con tiempo maximo de espera
         :return: dict con la data devuelta por el SRI
         """
-        try:
-            response = requests.get(f"https://srienlinea.sri.gob.ec/movil-servicios/api/v1.0/estadoTributario/{vat}")
-            data = response.json()
-        except Exception as e:
-            data = {}
-            _logger.error("Error retrieving data from sri: %s" % tools.ustr(e))
-        return data
+        return self.env["l10n_ec.taxpayer.cache"].sudo().get_taxpayer_info(vat)
 
-    @api.constrains("vat", "country_id", "l10n_latam_identification_type_id")
-    def check_vat(self):
+    @api.model
+    def _l10n_ec_get_vat_validation_refs(self):
+        """
+        Referencias usadas para validar las identificaciones, se leen una sola vez por cada lote de contribuyentes
+        """
         it_ruc = self.env.ref("l10n_ec_niif.it_ruc", False)
         it_cedula = self.env.ref("l10n_ec_niif.it_cedula", False)
-        if self.sudo().env.ref("base.module_base_vat").state == "installed":
-            ecuadorian_partners = self.filtered(lambda partner: partner.country_id == self.env.ref("base.ec"))
-            for partner in ecuadorian_partners:
-                if partner.vat:
-                    if partner.l10n_latam_identification_type_id.id in (it_ruc.id, it_cedula.id):
-                        valid, vat_type = self.check_vat_ec(partner.vat)
-                        if not valid:
-                            # cuando no pasa el algoritmo de modulo 11
-                            # intentar validarlo contra el SRI
-                            # si es un ruc valido, me devolvera la data del contribuyente
-                            # caso contrario me devolvera un mensaje
-                            # pero si no obtengo respuesta posiblemente este caido el SRI<data estara vacio>
-                            # NOTA: si el usuario activo l10n_ec_force_validate_nif se omitira la validacion
-                            data = self._get_partner_info_from_sri(partner.vat)
-                            if data:
-                                if data.get("razonSocial"):
-                                    valid = True
-                                elif not data.get("mensaje"):
-                                    valid = True
-                        if not valid and not partner.l10n_ec_force_validate_nif:
-                            raise UserError(
-                                _(
-                                    "VAT %s is not valid for an Ecuadorian company, "
-                                    "it must be like this form 17165373411001"
-                                )
-                                % (partner.vat)
-                            )
-            return super(ResPartner, self).check_vat()
-        else:
+        it_pasaporte = self.env.ref("l10n_ec_niif.it_pasaporte", False)
+        return {
+            "country_ec_id": self.env.ref("base.ec").id,
+            "it_ruc_id": it_ruc.id if it_ruc else False,
+            "it_cedula_id": it_cedula.id if it_cedula else False,
+            "it_pasaporte_id": it_pasaporte.id if it_pasaporte else False,
+            "base_vat_installed": self.sudo().env.ref("base.module_base_vat").state == "installed",
+        }
+
+    @api.model
+    def l10n_ec_validate_vat_batch(self, partners_or_values, async_lookup=None):
+        """
+        Validar en una sola pasada las identificaciones(cedula/RUC) de muchos contribuyentes,
+        pensado para importaciones masivas
+        :param partners_or_values: recordset de res.partner o lista de dict con los valores para crear
+        :param async_lookup: las identificaciones que no pasan el modulo 11 y no estan en la cache de contribuyentes
+            no se consultan al SRI, quedan pendientes para la tarea programada y no se reportan como error,
+            por defecto se toma de la clave l10n_ec_vat_async_lookup del contexto
+        :return: list(dict) por cada fila con index, vat, vat_type,
+            status(valid, invalid, pending, skipped) y error(mensaje cuando status es invalid)
+        """
+        return self._l10n_ec_validate_vat_rows(
+            partners_or_values, self._l10n_ec_get_vat_validation_refs(), async_lookup=async_lookup
+        )
+
+    @api.model
+    def _l10n_ec_validate_vat_rows(self, partners_or_values, refs, async_lookup=None):
+        if async_lookup is None:
+            async_lookup = self.env.context.get("l10n_ec_vat_async_lookup", False)
+        ruc_cedula_ids = {refs["it_ruc_id"], refs["it_cedula_id"]} - {False}
+        # cada identificacion se valida una sola vez aunque se repita en el lote
+        vat_results = {}
+        report = []
+        for index, row in enumerate(partners_or_values):
+            if isinstance(row, models.BaseModel):
+                vat = row.vat
+                country_id = row.country_id.id
+                identification_type_id = row.l10n_latam_identification_type_id.id
+                force_validate = row.l10n_ec_force_validate_nif
+            else:
+                vat = row.get("vat")
+                country_id = row.get("country_id")
+                identification_type_id = row.get("l10n_latam_identification_type_id")
+                if not identification_type_id and vat and country_id == refs["country_ec_id"]:
+                    identification_type_id = _guess_identification_type(vat, refs)
+                force_validate = row.get("l10n_ec_force_validate_nif")
+            line = {"index": index, "vat": vat, "vat_type": False, "status": "skipped", "error": False}
+            report.append(line)
+            if (
+                not refs["base_vat_installed"]
+                or not vat
+                or country_id != refs["country_ec_id"]
+                or identification_type_id not in ruc_cedula_ids
+            ):
+                continue
+            if vat not in vat_results:
+                vat_results[vat] = _check_vat_ec(vat)
+            valid, line["vat_type"] = vat_results[vat]
+            # NOTA: si el usuario activo l10n_ec_force_validate_nif se omitira la validacion
+            line["status"] = "valid" if valid or force_validate else "invalid"
+        # cuando no pasa el algoritmo de modulo 11 intentar validarlo contra el SRI
+        # si es un ruc valido, me devolvera la data del contribuyente, caso contrario me devolvera un mensaje
+        # pero si no obtengo respuesta posiblemente este caido el SRI<data estara vacio>
+        unresolved_vats = {line["vat"] for line in report if line["status"] == "invalid"}
+        if unresolved_vats:
+            taxpayer_model = self.env["l10n_ec.taxpayer.cache"].sudo()
+            sri_data = taxpayer_model._get_cached_data_multi(list(unresolved_vats))
+            pending_vats = unresolved_vats - set(sri_data)
+            if async_lookup:
+                taxpayer_model._enqueue_taxpayers(list(pending_vats))
+            else:
+                for vat in pending_vats:
+                    sri_data[vat] = self._get_partner_info_from_sri(vat)
+            for line in report:
+                if line["status"] != "invalid":
+                    continue
+                data = sri_data.get(line["vat"])
+                if data is None:
+                    line["status"] = "pending"
+                elif data and (data.get("razonSocial") or not data.get("mensaje")):
+                    line["status"] = "valid"
+                else:
+                    line["error"] = _(
+                        "VAT %s is not valid for an Ecuadorian company, it must be like this form 17165373411001"
+                    ) % (line["vat"])
+        return report
+
+    @api.constrains("vat", "country_id", "l10n_latam_identification_type_id")
+    def check_vat(self):
+        refs = self._l10n_ec_get_vat_validation_refs()
+        if not refs["base_vat_installed"]:
             return True
+        for line in self._l10n_ec_validate_vat_rows(self, refs):
+            if line["error"]:
+                raise UserError(line["error"])
+        return super(ResPartner, self).check_vat()
 
     @api.onchange("vat", "country_id")
     def _onchange_vat(self):
@@ -283,43 +364,16 @@ class ResPartner(models.Model):
 
     @api.model_create_multi
     def create(self, vals):
-        ecuador = self.env.ref("base.ec")
-        it_ruc = self.env.ref("l10n_ec_niif.it_ruc", False)
-        it_cedula = self.env.ref("l10n_ec_niif.it_cedula", False)
-        it_pasaporte = self.env.ref("l10n_ec_niif.it_pasaporte", False)
-        if (
-            self.sudo().env.ref("base.module_base_vat").state == "installed"
-            and self.env.company.partner_id.country_id.code == "EC"
-        ):
+        refs = self._l10n_ec_get_vat_validation_refs()
+        if refs["base_vat_installed"] and self.env.company.partner_id.country_id.code == "EC":
             for val in vals:
                 if not val.get("l10n_latam_identification_type_id", False) and val.get("vat"):
-                    if val.get("country_id") == ecuador.id:
-                        only_numbers = re.match(r"^([\s\d]+)$", val.get("vat"))
-                        if only_numbers:
-                            if len(val.get("vat")) == 10:
-                                val.update(
-                                    {
-                                        "l10n_latam_identification_type_id": it_cedula.id,
-                                    }
-                                )
-                            elif len(val.get("vat")) == 13:
-                                val.update(
-                                    {
-                                        "l10n_latam_identification_type_id": it_ruc.id,
-                                    }
-                                )
-                            else:
-                                val.update(
-                                    {
-                                        "l10n_latam_identification_type_id": it_pasaporte.id,
-                                    }
-                                )
-                        else:
-                            val.update(
-                                {
-                                    "l10n_latam_identification_type_id": it_pasaporte.id,
-                                }
-                            )
+                    if val.get("country_id") == refs["country_ec_id"]:
+                        val.update(
+                            {
+                                "l10n_latam_identification_type_id": _guess_identification_type(val["vat"], refs),
+                            }
+                        )
         return super(ResPartner, self).create(vals)
 
     def write(self, values):
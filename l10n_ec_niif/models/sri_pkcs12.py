@@ -0,0 +1,153 @@
+import logging
+
+from cryptography.hazmat.backends import default_backend
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.serialization import pkcs12
+
+_logger = logging.getLogger(__name__)
+
+# OID(codificados en DER) de los contenedores del archivo PKCS#12
+OID_PKCS7_DATA = bytes.fromhex("2a864886f70d010701")
+OID_KEY_BAG = bytes.fromhex("2a864886f70d010c0a0101")
+OID_SHROUDED_KEY_BAG = bytes.fromhex("2a864886f70d010c0a0102")
+TAG_OID = 0x06
+TAG_CONSTRUCTED = 0x20
+
+
+def _decode(data, offset, end):
+    """
+    Decodificar los nodos ASN.1(DER/BER) entre offset y end
+    :return: tuple(lista de nodos(tag, contenido, bytes del nodo), offset final)
+        el contenido es una lista de nodos si el tag es compuesto, caso contrario los bytes del valor
+    """
+    nodes = []
+    while offset < end:
+        start = offset
+        tag, length = data[offset], data[offset + 1]
+        offset += 2
+        if tag == 0 and length == 0:
+            # fin de contenido de un nodo con longitud indefinida(BER)
+            break
+        indefinite = length == 0x80
+        if length & 0x80 and not indefinite:
+            size = length & 0x7F
+            length = int.from_bytes(data[offset : offset + size], "big")
+            offset += size
+        if tag & TAG_CONSTRUCTED:
+            if indefinite:
+                children, offset = _decode(data, offset, end)
+            else:
+                children = _decode(data, offset, offset + length)[0]
+                offset += length
+            nodes.append((tag, children, data[start:offset]))
+        else:
+            nodes.append((tag, data[offset : offset + length], data[start : offset + length]))
+            offset += length
+    return nodes, offset
+
+
+def _octets(node):
+    """
+    Devuelve el valor de un OCTET STRING, en BER puede venir dividido en varios segmentos
+    """
+    tag, content = node[0], node[1]
+    if tag & TAG_CONSTRUCTED:
+        return b"".join(_octets(child) for child in content)
+    return content
+
+
+def _content_info_data(content_info):
+    """
+    Devuelve el contenido de un ContentInfo de tipo data, None para otros tipos(datos cifrados por ejemplo)
+    """
+    content_type, content = content_info[1][0], content_info[1][1:]
+    if content_type[0] != TAG_OID or content_type[1] != OID_PKCS7_DATA or not content:
+        return None
+    # [0] EXPLICIT OCTET STRING
+    return _octets(content[0][1][0])
+
+
+def load_private_keys(file_content, password):
+    """
+    Obtener todas las llaves privadas del archivo PKCS#12, en el orden en que aparecen
+    los archivos de algunas entidades emisoras traen mas de una llave(Signing Key, Decryption Key)
+    :param file_content: contenido del archivo p12(bytes)
+    :param password: clave del archivo
+    :return: lista de llaves privadas(cryptography)
+    """
+    private_keys = []
+    pfx = _decode(file_content, 0, len(file_content))[0][0]
+    auth_safe = _content_info_data(pfx[1][1])
+    for content_info in _decode(auth_safe, 0, len(auth_safe))[0][0][1]:
+        safe_contents = _content_info_data(content_info)
+        if safe_contents is None:
+            continue
+        for safe_bag in _decode(safe_contents, 0, len(safe_contents))[0][0][1]:
+            bag_id, bag_value = safe_bag[1][0][1], safe_bag[1][1][1][0]
+            if bag_id == OID_SHROUDED_KEY_BAG:
+                private_keys.append(
+                    serialization.load_der_private_key(bag_value[2], password.encode(), default_backend())
+                )
+            elif bag_id == OID_KEY_BAG:
+                private_keys.append(serialization.load_der_private_key(bag_value[2], None, default_backend()))
+    return private_keys
+
+
+def has_digital_signature(certificate):
+    """
+    Verificar si el certificado(cryptography) tiene la extension keyUsage con digital_signature activada
+    """
+    for exten in certificate.extensions:
+        if exten.oid._name == "keyUsage" and exten.value.digital_signature:
+            return True
+    return False
+
+
+def _public_numbers(key):
+    return key.public_key().public_numbers()
+
+
+def get_signing_key(file_content, password, bundle=None):
+    """
+    Obtener la llave privada y el certificado con que se deben firmar los documentos
+    se toma el certificado con keyUsage digital_signature y la llave privada que le corresponde
+    :param file_content: contenido del archivo p12(bytes)
+    :param password: clave del archivo
+    :param bundle: tuple(llave privada, certificado, lista de certificados adicionales) del archivo ya cargado,
+        si no se pasa se carga el archivo
+    :return: tuple(llave privada, certificado), objetos de cryptography
+    """
+    if bundle is None:
+        bundle = pkcs12.load_key_and_certificates(file_content, password.encode(), default_backend())
+    private_key, certificate, ca_certificates = bundle
+    signing_certificate = certificate
+    if certificate is None or not has_digital_signature(certificate):
+        for ca_certificate in ca_certificates or []:
+            if has_digital_signature(ca_certificate):
+                signing_certificate = ca_certificate
+                break
+    if signing_certificate is None or (
+        private_key is not None and _public_numbers(private_key) == signing_certificate.public_key().public_numbers()
+    ):
+        return private_key, signing_certificate
+    # el archivo tiene varias llaves, buscar la que corresponde al certificado de firma
+    try:
+        private_keys = load_private_keys(file_content, password)
+    except Exception as e:
+        _logger.warning("Can't read private keys of PKCS#12 file. Error: %s", e)
+        private_keys = []
+    for key in private_keys:
+        if _public_numbers(key) == signing_certificate.public_key().public_numbers():
+            return key, signing_certificate
+    return private_key, signing_certificate
+
+
+def private_key_to_pem(private_key, password):
+    """
+    Exportar la llave privada en formato PEM(PKCS#8) cifrada con la clave del archivo
+    """
+    return private_key.private_bytes(
+        serialization.Encoding.PEM,
+        serialization.PrivateFormat.PKCS8,
+        serialization.BestAvailableEncryption(password.encode()),
+    ).decode()
@@ -0,0 +1,110 @@
+import logging
+import os
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+from zeep import Client
+from zeep.cache import SqliteCache
+from zeep.transports import Transport
+
+from odoo import tools
+
+_logger = logging.getLogger(__name__)
+
+# parametros de configuracion con las url de los webservices del SRI
+# al modificarse alguno de ellos se debe limpiar los clientes en memoria
+WS_CONFIG_PARAMETERS = (
+    "l10n_ec_ws_receipt_test",
+    "l10n_ec_ws_auth_test",
+    "l10n_ec_ws_receipt_production",
+    "l10n_ec_ws_auth_production",
+)
+# tiempo(en segundos) que se mantiene en disco el wsdl y xsd descargados
+WSDL_CACHE_TIMEOUT = 60 * 60 * 24
+# conexiones persistentes(keep-alive) a mantener por cada host del SRI
+POOL_CONNECTIONS = 2
+POOL_MAXSIZE = 4
+
+_clients = {}
+_clients_lock = threading.RLock()
+_wsdl_cache = None
+
+
+def _get_wsdl_cache():
+    """
+    Devuelve la cache en disco(sqlite) para los wsdl/xsd del SRI,
+    se guarda en el directorio de datos de odoo para que sea compartida por todos los workers
+    """
+    global _wsdl_cache
+    if _wsdl_cache is None:
+        cache_dir = os.path.join(tools.config["data_dir"], "l10n_ec_niif")
+        try:
+            os.makedirs(cache_dir, exist_ok=True)
+            _wsdl_cache = SqliteCache(path=os.path.join(cache_dir, "sri_wsdl_cache.db"), timeout=WSDL_CACHE_TIMEOUT)
+        except Exception as e:
+            _logger.warning(
+                "Can't create wsdl cache on %s, wsdl will be downloaded. Error: %s", cache_dir, tools.ustr(e)
+            )
+            return None
+    return _wsdl_cache
+
+
+def _create_session():
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=POOL_CONNECTIONS, pool_maxsize=POOL_MAXSIZE, pool_block=True)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def _create_client(ws_url, timeout):
+    transport = Transport(
+        cache=_get_wsdl_cache(),
+        timeout=timeout,
+        operation_timeout=timeout,
+        session=_create_session(),
+    )
+    return Client(ws_url, transport=transport)
+
+
+def get_client(environment, url_type, ws_url, timeout):
+    """
+    Devuelve un cliente del webservice reutilizable dentro del proceso(worker)
+    el cliente mantiene una sesion http con conexiones persistentes,
+    asi se evita descargar el wsdl y negociar TLS en cada documento
+    :param environment: tipo de ambiente(1: Pruebas, 2: Produccion)
+    :param url_type: reception o authorization
+    :param ws_url: url del webservice
+    :param timeout: tiempo de espera en segundos
+    :return: zeep.Client, lanza excepcion si no se puede conectar
+    """
+    ws_url = (ws_url or "").strip()
+    key = (environment, url_type, ws_url, timeout)
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is not None:
+            return client
+        # si la url o el timeout cambio(en otro worker por ejemplo), descartar los clientes anteriores
+        for old_key in [k for k in _clients if k[:2] == (environment, url_type)]:
+            _close_client(_clients.pop(old_key))
+        client = _create_client(ws_url, timeout)
+        _clients[key] = client
+        return client
+
+
+def _close_client(client):
+    try:
+        client.transport.session.close()
+    except Exception as e:
+        _logger.debug("Error closing session of web service client: %s", tools.ustr(e))
+
+
+def clear_clients():
+    """
+    Descartar todos los clientes en memoria, se debe llamar cuando cambia la configuracion de los webservices
+    """
+    with _clients_lock:
+        for client in _clients.values():
+            _close_client(client)
+        _clients.clear()
@@ -0,0 +1,160 @@
+import threading
+from collections import namedtuple
+
+from lxml.etree import SubElement
+
+# nodo del plan de un xml:
+# tag: nombre del elemento, tambien es la clave del valor en el dict de datos
+# decimals: para valores numericos, cantidad de decimales(int) o nombre del formato(str) que se pasa al compilar
+# optional: el nodo no se agrega si el valor es None
+# children: nodos hijos, el valor debe ser un dict o una lista de dict(el elemento se repite por cada dict)
+# attributes: atributos del elemento, se toman del dict de datos con el mismo nombre
+PlanNode = namedtuple("PlanNode", ["tag", "decimals", "optional", "children", "attributes"])
+# nodo compilado: los formatos de numeros ya se resolvieron a funciones
+_CompiledNode = namedtuple("_CompiledNode", ["tag", "formatter", "optional", "children", "attributes"])
+
+
+def node(tag, decimals=None, optional=False, children=(), attributes=()):
+    return PlanNode(tag, decimals, optional, tuple(children), tuple(attributes))
+
+
+def _tax_nodes(tag):
+    tax_node = node(
+        "impuesto",
+        children=[
+            node("codigo"),
+            node("codigoPorcentaje"),
+            node("tarifa", 0, optional=True),
+            node("baseImponible", "amount"),
+            node("valor", "amount"),
+        ],
+    )
+    return node(tag, children=[tax_node])
+
+
+# detalles de cada tipo de documento, la clave es el xml_header_name de l10n_ec.xml.version
+# se usan en todas las versiones del documento que no tengan su propio plan en VERSION_DETAIL_PLANS
+# solo el detalle(una vez por linea) se genera con planes,
+# las cabeceras(infoTributaria, infoFactura, ...) se generan una vez por documento con SubElement
+DETAIL_PLANS = {
+    "factura": node(
+        "detalle",
+        children=[
+            node("codigoPrincipal"),
+            node("descripcion"),
+            node("cantidad", "qty"),
+            node("precioUnitario", "price"),
+            node("descuento", "discount"),
+            node("precioTotalSinImpuesto", "amount"),
+            node(
+                "detallesAdicionales",
+                optional=True,
+                children=[node("detAdicional", attributes=["nombre", "valor"])],
+            ),
+            _tax_nodes("impuestos"),
+        ],
+    ),
+    "notaCredito": node(
+        "detalle",
+        children=[
+            node("codigoInterno"),
+            node("descripcion"),
+            node("cantidad", "qty"),
+            node("precioUnitario", "price"),
+            node("descuento", "discount"),
+            node("precioTotalSinImpuesto", "amount"),
+            _tax_nodes("impuestos"),
+        ],
+    ),
+    "liquidacionCompra": node(
+        "detalle",
+        children=[
+            node("codigoPrincipal"),
+            node("descripcion"),
+            node("unidadMedida"),
+            node("cantidad", "qty"),
+            node("precioUnitario", "price"),
+            node("descuento", "discount"),
+            node("precioTotalSinImpuesto", "amount"),
+            _tax_nodes("impuestos"),
+        ],
+    ),
+}
+
+# detalles de versiones con estructura distinta a la del tipo de documento
+# clave: (xml_header_name, version_file) de l10n_ec.xml.version, valor: nodo del plan
+# las versiones soportadas actualmente comparten el detalle de su tipo de documento
+VERSION_DETAIL_PLANS = {}
+
+# planes compilados en el proceso(worker)
+# (nombre del plan, version, formatos): nodo compilado
+_compiled_plans = {}
+_compiled_plans_lock = threading.Lock()
+
+
+def _get_number_formatter(decimals):
+    """
+    Devuelve una funcion que da formato a los numeros, mismo resultado que l10n_ec.utils.formato_numero
+    """
+    str_format = "{:." + str(decimals) + "f}"
+
+    def formatter(value):
+        if isinstance(value, (int, float)):
+            return str_format.format(value)
+        return "0.00"
+
+    return formatter
+
+
+def _compile_node(plan_node, formats):
+    formatter = None
+    if plan_node.decimals is not None:
+        decimals = plan_node.decimals
+        if isinstance(decimals, str):
+            decimals = formats[decimals]
+        formatter = _get_number_formatter(decimals)
+    return _CompiledNode(
+        plan_node.tag,
+        formatter,
+        plan_node.optional,
+        tuple(_compile_node(child, formats) for child in plan_node.children),
+        plan_node.attributes,
+    )
+
+
+def get_plan(plan_name, formats, version=None):
+    """
+    Devuelve el plan compilado, solo se compila la primera vez para cada version y combinacion de formatos
+    :param plan_name: clave de DETAIL_PLANS(xml_header_name del documento)
+    :param formats: dict con los decimales de cada formato usado en el plan(qty, price, discount, amount)
+    :param version: version_file de l10n_ec.xml.version, usa el plan de VERSION_DETAIL_PLANS si existe
+    :return: nodo compilado para usar en render
+    """
+    key = (plan_name, version, tuple(sorted(formats.items())))
+    compiled_plan = _compiled_plans.get(key)
+    if compiled_plan is None:
+        with _compiled_plans_lock:
+            compiled_plan = _compiled_plans.get(key)
+            if compiled_plan is None:
+                plan = VERSION_DETAIL_PLANS.get((plan_name, version)) or DETAIL_PLANS[plan_name]
+                compiled_plan = _compile_node(plan, formats)
+                _compiled_plans[key] = compiled_plan
+    return compiled_plan
+
+
+def render(parent_node, compiled_plan, value):
+    """
+    Agrega al nodo padre los elementos del plan con los datos pasados
+    :param value: dict con los valores de los hijos, lista para repetir el elemento, o el texto del elemento
+    """
+    if value is None and compiled_plan.optional:
+        return
+    for item in value if isinstance(value, list) else (value,):
+        element = SubElement(parent_node, compiled_plan.tag)
+        for attribute in compiled_plan.attributes:
+            element.set(attribute, item[attribute])
+        if compiled_plan.children:
+            for child in compiled_plan.children:
+                render(element, child, item.get(child.tag))
+        elif not compiled_plan.attributes:
+            element.text = compiled_plan.formatter(item) if compiled_plan.formatter else item
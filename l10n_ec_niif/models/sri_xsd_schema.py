@@ -0,0 +1,63 @@
+import logging
+import os
+import threading
+
+from lxml import etree
+
+from odoo import tools
+
+_logger = logging.getLogger(__name__)
+
+# esquemas xsd compilados en el proceso(worker)
+# ruta del xsd: (ruta real, fecha de modificacion, esquema compilado, bloqueo para validar)
+_schemas = {}
+_schemas_lock = threading.RLock()
+
+
+def get_schema(xsd_file_path):
+    """
+    Devuelve el esquema xsd compilado, solo se compila la primera vez
+    o cuando el archivo fue modificado
+    :param xsd_file_path: ruta del archivo xsd, absoluta o relativa a los addons
+    :return: tuple(etree.XMLSchema, threading.Lock)
+    """
+    with _schemas_lock:
+        entry = _schemas.get(xsd_file_path)
+        if entry is not None:
+            real_path, mtime, schema, lock = entry
+            if os.path.getmtime(real_path) == mtime:
+                return schema, lock
+        with tools.file_open(xsd_file_path, "rb") as xsd_file:
+            real_path = xsd_file.name
+            mtime = os.path.getmtime(real_path)
+            schema = etree.XMLSchema(etree.parse(xsd_file))
+        lock = threading.Lock()
+        _schemas[xsd_file_path] = (real_path, mtime, schema, lock)
+        return schema, lock
+
+
+def validate(xml_doc, xsd_file_path):
+    """
+    Valida el documento contra el esquema xsd
+    :param xml_doc: etree del documento a validar
+    :param xsd_file_path: ruta del archivo xsd
+    :return: True si el documento es valido, lanza AssertionError con el detalle del error caso contrario
+    """
+    schema, lock = get_schema(xsd_file_path)
+    # el registro de errores del esquema es compartido, no validar en paralelo con el mismo esquema
+    with lock:
+        result = schema.validate(xml_doc)
+        if not result:
+            schema.assert_(xml_doc)
+    return result
+
+
+def warm_up(xsd_file_paths):
+    """
+    Compilar los esquemas xsd por adelantado, para que el primer documento no tenga que esperar la compilacion
+    """
+    for xsd_file_path in xsd_file_paths:
+        try:
+            get_schema(xsd_file_path)
+        except Exception as e:
+            _logger.warning("Can't compile xsd file %s. Error: %s", xsd_file_path, tools.ustr(e))
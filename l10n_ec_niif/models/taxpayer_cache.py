@@ -0,0 +1,300 @@
+import csv
+import io
+import json
+import logging
+import threading
+import time
+from datetime import timedelta
+
+import requests
+from psycopg2.extras import execute_values
+
+from odoo import api, fields, models, tools
+from odoo.exceptions import UserError
+from odoo.tools.translate import _
+
+_logger = logging.getLogger(__name__)
+
+SRI_TAXPAYER_URL = "https://srienlinea.sri.gob.ec/movil-servicios/api/v1.0/estadoTributario/%s"
+# columnas del catastro de RUC publicado por el SRI
+REGISTRY_COLUMNS = {
+    "vat": "NUMERO_RUC",
+    "razon_social": "RAZON_SOCIAL",
+    "estado": "ESTADO_CONTRIBUYENTE",
+    "clase": "CLASE_CONTRIBUYENTE",
+}
+# cantidad de contribuyentes que se guardan en cada consulta al cargar el catastro
+REGISTRY_BATCH_SIZE = 1000
+# cantidad de contribuyentes pendientes que se consultan al SRI en cada ejecucion de la tarea programada
+PENDING_BATCH_SIZE = 100
+
+
+class L10nEcTaxpayerCache(models.Model):
+    """
+    Respuestas del SRI sobre contribuyentes(RUC/cedula), incluyendo los no registrados,
+    se consultan antes de llamar al servicio del SRI mientras no caduquen
+    """
+
+    _name = "l10n_ec.taxpayer.cache"
+    _description = "Contribuyentes consultados en el SRI"
+    _rec_name = "vat"
+    _order = "fetch_date desc"
+
+    vat = fields.Char("RUC/Cédula", required=True, index=True, readonly=True)
+    found = fields.Boolean("Registrado en el SRI?", readonly=True)
+    razon_social = fields.Char("Razón Social", readonly=True)
+    estado = fields.Char("Estado Tributario", readonly=True)
+    mensaje = fields.Char("Mensaje del SRI", readonly=True)
+    data = fields.Text("Respuesta del SRI", readonly=True)
+    source = fields.Selection(
+        [
+            ("sri", "Consulta al SRI"),
+            ("file", "Catastro del SRI"),
+        ],
+        string="Origen",
+        readonly=True,
+    )
+    # sin fecha de consulta: pendiente de consultar al SRI por la tarea programada
+    fetch_date = fields.Datetime("Fecha de Consulta", readonly=True)
+
+    _sql_constraints = [
+        (
+            "vat_uniq",
+            "unique(vat)",
+            _("The taxpayer must be unique!"),
+        ),
+    ]
+
+    @api.model
+    def get_taxpayer_info(self, vat):
+        """
+        Informacion del contribuyente, se toma de la cache local
+        y solo si no existe o ya caduco se consulta al SRI
+        :return: dict con la data devuelta por el SRI, vacio cuando el SRI no responde
+        """
+        if not vat:
+            return {}
+        data = self._get_cached_data(vat)
+        if data is None:
+            data = self._fetch_from_sri(vat)
+            # cuando el SRI no responde no guardar nada, se debe volver a consultar
+            if data:
+                self._store_taxpayers([self._prepare_taxpayer_values(vat, data, "sri")], new_cursor=True)
+        return data
+
+    @api.model
+    def _get_cached_data(self, vat):
+        """
+        :return: dict con la respuesta guardada, None si no existe o ya caduco
+        """
+        return self._get_cached_data_multi([vat]).get(vat)
+
+    @api.model
+    def _get_cached_data_multi(self, vats):
+        """
+        Respuestas guardadas de varios contribuyentes con una sola consulta
+        :return: dict {vat: dict con la respuesta guardada}, no incluye los que no existen o ya caducaron
+        """
+        if not vats:
+            return {}
+        ICPSudo = self.env["ir.config_parameter"].sudo()
+        # los contribuyentes no registrados caducan antes, pueden registrarse en cualquier momento
+        found_ttl = timedelta(days=int(ICPSudo.get_param("l10n_ec.taxpayer_cache_days", 30)))
+        not_found_ttl = timedelta(hours=int(ICPSudo.get_param("l10n_ec.taxpayer_cache_negative_hours", 24)))
+        now = fields.Datetime.now()
+        self.env.cr.execute(
+            "SELECT vat, found, data, fetch_date FROM l10n_ec_taxpayer_cache WHERE vat IN %s",
+            (tuple(vats),),
+        )
+        cached_data = {}
+        for vat, found, data, fetch_date in self.env.cr.fetchall():
+            ttl = found_ttl if found else not_found_ttl
+            if not fetch_date or fetch_date + ttl < now:
+                continue
+            try:
+                cached_data[vat] = json.loads(data or "{}")
+            except ValueError:
+                continue
+        return cached_data
+
+    @api.model
+    def _fetch_from_sri(self, vat):
+        """
+        Consultar al SRI con tiempo maximo de espera(parametro l10n_ec.sri_taxpayer_timeout, 5 segundos por defecto)
+        :return: dict con la data devuelta por el SRI, vacio si el SRI no responde
+        """
+        timeout = float(self.env["ir.config_parameter"].sudo().get_param("l10n_ec.sri_taxpayer_timeout", 5))
+        try:
+            response = requests.get(SRI_TAXPAYER_URL % vat, timeout=timeout)
+            data = response.json()
+        except Exception as e:
+            data = {}
+            _logger.error("Error retrieving data from sri: %s" % tools.ustr(e))
+        if not isinstance(data, dict):
+            data = {}
+        return data
+
+    @api.model
+    def _prepare_taxpayer_values(self, vat, data, source):
+        return (
+            vat,
+            bool(data.get("razonSocial")),
+            data.get("razonSocial") or None,
+            data.get("descripcion") or None,
+            data.get("mensaje") or None,
+            json.dumps(data),
+            source,
+        )
+
+    @api.model
+    def _store_taxpayers(self, taxpayer_values, new_cursor=False):
+        """
+        Guardar o actualizar los contribuyentes con una sola consulta
+        :param taxpayer_values: lista de tuplas, ver _prepare_taxpayer_values
+        :param new_cursor: guardar en otra transaccion, asi la respuesta del SRI
+            no se pierde cuando falla la validacion que hizo la consulta
+        """
+        query = """
+            INSERT INTO l10n_ec_taxpayer_cache
+                (vat, found, razon_social, estado, mensaje, data, source,
+                fetch_date, create_uid, create_date, write_uid, write_date)
+            VALUES %s
+            ON CONFLICT (vat) DO UPDATE SET
+                found = EXCLUDED.found,
+                razon_social = EXCLUDED.razon_social,
+                estado = EXCLUDED.estado,
+                mensaje = EXCLUDED.mensaje,
+                data = EXCLUDED.data,
+                source = EXCLUDED.source,
+                fetch_date = EXCLUDED.fetch_date,
+                write_uid = EXCLUDED.write_uid,
+                write_date = EXCLUDED.write_date
+        """
+        template = "(%s, %s, %s, %s, %s, %s, %s, now() at time zone 'UTC', {uid}, now() at time zone 'UTC', {uid}, "
+        template += "now() at time zone 'UTC')"
+        template = template.format(uid=int(self.env.uid))
+        if not new_cursor:
+            execute_values(self.env.cr, query, taxpayer_values, template=template)
+            return True
+        try:
+            with self.pool.cursor() as cr:
+                execute_values(cr, query, taxpayer_values, template=template)
+        except Exception as e:
+            _logger.warning("Can't store taxpayer information. ERROR: %s", tools.ustr(e))
+            return False
+        return True
+
+    @api.model
+    def _enqueue_taxpayers(self, vats):
+        """
+        Dejar los contribuyentes pendientes de consultar al SRI,
+        la tarea programada los consulta luego sin bloquear la validacion que los pidio
+        """
+        if not vats:
+            return True
+        query = """
+            INSERT INTO l10n_ec_taxpayer_cache
+                (vat, found, fetch_date, create_uid, create_date, write_uid, write_date)
+            VALUES %s
+            ON CONFLICT (vat) DO UPDATE SET
+                fetch_date = NULL,
+                write_uid = EXCLUDED.write_uid,
+                write_date = EXCLUDED.write_date
+        """
+        template = "(%s, false, NULL, {uid}, now() at time zone 'UTC', {uid}, now() at time zone 'UTC')"
+        template = template.format(uid=int(self.env.uid))
+        execute_values(self.env.cr, query, [(vat,) for vat in set(vats)], template=template)
+        return True
+
+    @api.model
+    def _cron_fetch_pending_taxpayers(self, limit=PENDING_BATCH_SIZE):
+        """
+        Consultar al SRI los contribuyentes pendientes, primero los que hace mas tiempo no se intentan consultar,
+        los que no obtienen respuesta del SRI quedan pendientes para la siguiente ejecucion
+        pero pasan al final de la cola, asi no bloquean al resto de contribuyentes pendientes
+        cada consulta se confirma en su propia transaccion y la ejecucion se detiene
+        antes de superar el tiempo maximo(parametro l10n_ec.taxpayer_cron_time_limit, 60 segundos por defecto),
+        asi el tiempo limite del worker no descarta las consultas ya realizadas
+        """
+        ICPSudo = self.env["ir.config_parameter"].sudo()
+        auto_commit = not getattr(threading.currentThread(), "testing", False)
+        timeout = float(ICPSudo.get_param("l10n_ec.sri_taxpayer_timeout", 5))
+        deadline = time.monotonic() + float(ICPSudo.get_param("l10n_ec.taxpayer_cron_time_limit", 60))
+        self.env.cr.execute(
+            "SELECT vat FROM l10n_ec_taxpayer_cache WHERE fetch_date IS NULL ORDER BY write_date, id LIMIT %s",
+            (limit,),
+        )
+        for (vat,) in self.env.cr.fetchall():
+            # la siguiente consulta puede tardar hasta el tiempo de espera del SRI
+            if time.monotonic() + timeout > deadline:
+                break
+            data = self._fetch_from_sri(vat)
+            if data:
+                self._store_taxpayers([self._prepare_taxpayer_values(vat, data, "sri")])
+            else:
+                # la fecha de modificacion registra el ultimo intento de consulta(hora real, no la de la transaccion)
+                self.env.cr.execute(
+                    """
+                    UPDATE l10n_ec_taxpayer_cache SET write_date = clock_timestamp() at time zone 'UTC', write_uid = %s
+                    WHERE vat = %s AND fetch_date IS NULL
+                    """,
+                    (self.env.uid, vat),
+                )
+            if not data.get("razonSocial") and data.get("mensaje"):
+                _logger.warning("Taxpayer %s is not registered on SRI: %s", vat, data.get("mensaje"))
+            if auto_commit:
+                self.env.cr.commit()
+        self.invalidate_cache()
+        return True
+
+    @api.model
+    def load_registry_file(self, file_content, encoding="utf-8"):
+        """
+        Cargar los contribuyentes del catastro de RUC que publica el SRI,
+        el archivo debe tener encabezado con las columnas NUMERO_RUC, RAZON_SOCIAL, ESTADO_CONTRIBUYENTE
+        y opcionalmente CLASE_CONTRIBUYENTE, separadas por |, tabulador, punto y coma o coma
+        :param file_content: contenido del archivo en bytes
+        :return: cantidad de contribuyentes cargados
+        """
+        try:
+            text = file_content.decode(encoding)
+        except UnicodeDecodeError as e:
+            raise UserError(_("Error to read file, please choose the right encoding. \nMore info %s") % tools.ustr(e))
+        header = text[: text.find("\n")] if "\n" in text else text
+        delimiter = max("|\t;,", key=header.count)
+        reader = csv.reader(io.StringIO(text), delimiter=delimiter)
+        columns = [column.strip().upper() for column in next(reader, [])]
+        try:
+            indexes = {key: columns.index(column) for key, column in REGISTRY_COLUMNS.items() if column in columns}
+            vat_index = indexes["vat"]
+            razon_social_index = indexes["razon_social"]
+        except KeyError:
+            raise UserError(
+                _("The file must have the columns %s")
+                % ", ".join([REGISTRY_COLUMNS["vat"], REGISTRY_COLUMNS["razon_social"]])
+            )
+        estado_index = indexes.get("estado")
+        clase_index = indexes.get("clase")
+        total = 0
+        batch = {}
+        for row in reader:
+            if len(row) <= max(vat_index, razon_social_index):
+                continue
+            vat = row[vat_index].strip()
+            if not vat:
+                continue
+            data = {"razonSocial": row[razon_social_index].strip()}
+            if estado_index is not None and len(row) > estado_index:
+                data["descripcion"] = row[estado_index].strip()
+            if clase_index is not None and len(row) > clase_index:
+                data["claseContribuyente"] = row[clase_index].strip()
+            batch[vat] = self._prepare_taxpayer_values(vat, data, "file")
+            if len(batch) >= REGISTRY_BATCH_SIZE:
+                self._store_taxpayers(list(batch.values()))
+                total += len(batch)
+                batch = {}
+        if batch:
+            self._store_taxpayers(list(batch.values()))
+            total += len(batch)
+        self.invalidate_cache()
+        return total
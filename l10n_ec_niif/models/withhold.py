@@ -1,6 +1,7 @@
 import logging
 import re
-from xml.etree.ElementTree import SubElement
+
+from lxml.etree import SubElement
 
 from odoo import _, api, fields, models, tools
 from odoo.exceptions import UserError, ValidationError
@@ -240,11 +241,41 @@ class L10nEcWithhold(models.Model):
         for withhold in self:
             withhold.access_url = "/my/retencion/%s" % (withhold.id)
 
+    @api.model_create_multi
+    def create(self, vals_list):
+        withholds = super(L10nEcWithhold, self).create(vals_list)
+        self.env["l10n_ec.point.of.emission.counter"]._register_numbers(withholds._l10n_ec_get_sequence_numbers())
+        return withholds
+
     def write(self, vals):
         if "invoice_id" in vals:
             for withold in self:
                 withold.line_ids.write({"invoice_id": vals["invoice_id"]})
-        return super(L10nEcWithhold, self).write(vals)
+        if not set(vals) & {"number", "point_of_emission_id", "type"}:
+            return super(L10nEcWithhold, self).write(vals)
+        counter_model = self.env["l10n_ec.point.of.emission.counter"]
+        old_numbers = self._l10n_ec_get_sequence_numbers()
+        res = super(L10nEcWithhold, self).write(vals)
+        new_numbers = self._l10n_ec_get_sequence_numbers()
+        counter_model._register_numbers(new_numbers)
+        counter_model._release_numbers(
+            {key: number for key, number in old_numbers.items() if new_numbers.get(key) != number}
+        )
+        return res
+
+    def _l10n_ec_get_sequence_numbers(self):
+        """
+        Secuencial mayor de las retenciones en compras por punto de emision,
+        para actualizar los contadores de l10n_ec.point.of.emission.counter
+        :return: dict {(punto de emision, tipo de documento): secuencial}
+        """
+        numbers = {}
+        for withhold in self.filtered(lambda x: x.type == "purchase" and x.point_of_emission_id and x.number):
+            printer = withhold.point_of_emission_id
+            number = printer._l10n_ec_parse_sequence(withhold.number)
+            if number > numbers.get((printer, "withhold_purchase"), 0):
+                numbers[(printer, "withhold_purchase")] = number
+        return numbers
 
     @api.depends("invoice_id")
     def _compute_is_related_document(self):
@@ -311,7 +342,7 @@ class L10nEcWithhold(models.Model):
                     raise UserError(_("You must have at least one line to continue"))
                 if not rec.company_id.l10n_ec_withhold_journal_id:
                     raise UserError(_("You must configure Withhold Journal on Company to continue"))
-                if self.type == "sale":
+                if rec.type == "sale":
                     if not rec.company_id.l10n_ec_withhold_sale_iva_account_id:
                         raise UserError(_("You must configure Withhold Sale Vat Account on Company to continue"))
                     if not rec.company_id.l10n_ec_withhold_sale_rent_account_id:
@@ -330,8 +361,8 @@ class L10nEcWithhold(models.Model):
                 rec._create_account_move()
             else:
                 # validar que la empresa tenga ruc y tipo de documento
-                if self.commercial_partner_id:
-                    self.commercial_partner_id._check_l10n_ec_values()
+                if rec.commercial_partner_id:
+                    rec.commercial_partner_id._check_l10n_ec_values()
         return self.write({"state": "done"})
 
     def _create_account_move(self):
@@ -537,7 +568,10 @@ class L10nEcWithhold(models.Model):
         for rec in self:
             if rec.state != "draft" and not self.env.context.get("cancel_from_invoice"):
                 raise UserError(_("You cannot delete an approved hold"))
-        return super(L10nEcWithhold, self).unlink()
+        old_numbers = self._l10n_ec_get_sequence_numbers()
+        res = super(L10nEcWithhold, self).unlink()
+        self.env["l10n_ec.point.of.emission.counter"]._release_numbers(old_numbers)
+        return res
 
     # bloque de codigo para generar documento electronico
 
@@ -583,6 +617,44 @@ class L10nEcWithhold(models.Model):
         self.ensure_one()
         return f"RET-{self.l10n_ec_get_document_number()}"
 
+    def _l10n_ec_prefetch_electronic_data(self):
+        self.mapped("company_id.partner_id.property_account_position_id")
+        self.mapped("partner_id.commercial_partner_id")
+        self.mapped("invoice_id.l10n_latam_document_type_id")
+        self.mapped("line_ids.tax_id.tax_group_id")
+        return self
+
+    def _l10n_ec_get_xml_fingerprint_data(self):
+        self.ensure_one()
+        return [
+            self._l10n_ec_get_fields_values(
+                self,
+                [
+                    "number",
+                    "issue_date",
+                    "partner_id.commercial_partner_id.name",
+                    "partner_id.commercial_partner_id.vat",
+                    "partner_id.commercial_partner_id.l10n_ec_type_sri",
+                    "invoice_id.l10n_latam_document_type_id.code",
+                    "invoice_id.l10n_latam_document_number",
+                    "invoice_id.invoice_date",
+                ],
+            ),
+            self._l10n_ec_get_fields_values(
+                self.line_ids,
+                [
+                    "type",
+                    "tax_id",
+                    "tax_id.l10n_ec_xml_fe_code",
+                    "tax_id.description",
+                    "tax_id.tax_group_id.l10n_ec_xml_fe_code",
+                    "base_amount_currency",
+                    "percentage",
+                    "tax_amount_currency",
+                ],
+            ),
+        ]
+
     def l10n_ec_action_generate_xml_data(self, node_root, xml_version):
         util_model = self.env["l10n_ec.utils"]
         company = self.company_id or self.env.company
@@ -681,38 +753,64 @@ class L10nEcWithhold(models.Model):
         "company_id",
     )
     def _check_number_duplicity(self):
-        for rec in self:
-            if rec.type == "purchase":
-                other_records = self.search(
-                    [
-                        ("type", "=", "purchase"),
-                        ("number", "=", rec.number),
-                        ("company_id", "=", rec.company_id.id),
-                    ]
+        withholds = self.filtered(lambda x: x.type == "purchase" and x.number)
+        if not withholds:
+            return
+        # una sola consulta para todas las retenciones del lote
+        groups = self.read_group(
+            [
+                ("type", "=", "purchase"),
+                ("number", "in", list(set(withholds.mapped("number")))),
+                ("company_id", "in", withholds.mapped("company_id").ids),
+            ],
+            ["company_id"],
+            ["company_id", "number"],
+            lazy=False,
+        )
+        withhold_keys = {(withhold.company_id.id, withhold.number) for withhold in withholds}
+        for group in groups:
+            key = (group["company_id"] and group["company_id"][0], group["number"])
+            if group["__count"] > 1 and key in withhold_keys:
+                raise ValidationError(
+                    _("There is already a withhold on sales with number %s please verify") % (group["number"])
                 )
-                if len(other_records) > 1:
-                    raise ValidationError(
-                        _("There is already a withhold on sales with number %s please verify") % (rec.number)
-                    )
 
     @api.constrains("electronic_authorization")
     def _check_duplicity_electronic_authorization(self):
-        for rec in self:
-            if rec.electronic_authorization:
-                other_docs = self.search(
-                    [
-                        (
-                            "electronic_authorization",
-                            "=",
-                            rec.electronic_authorization,
-                        ),
-                    ]
+        authorizations = set(self.filtered("electronic_authorization").mapped("electronic_authorization"))
+        if not authorizations:
+            return
+        # una sola consulta para todas las retenciones del lote
+        groups = self.read_group(
+            [("electronic_authorization", "in", list(authorizations))],
+            ["electronic_authorization"],
+            ["electronic_authorization"],
+        )
+        for group in groups:
+            if group["electronic_authorization_count"] > 1:
+                raise ValidationError(
+                    _("There is already a document with electronic authorization %s please verify")
+                    % (group["electronic_authorization"])
                 )
-                if len(other_docs) > 1:
-                    raise ValidationError(
-                        _("There is already a document with electronic authorization %s please verify")
-                        % (rec.electronic_authorization)
-                    )
+
+    # indices unicos parciales(restricciones EXCLUDE con igualdad) que respaldan las validaciones de duplicidad
+    _sql_constraints = [
+        (
+            "number_company_uniq",
+            "EXCLUDE USING btree (company_id WITH =, number WITH =) WHERE (type = 'purchase')",
+            _("There is already a withhold on purchases with the same number for the company!"),
+        ),
+        (
+            "number_partner_uniq",
+            "EXCLUDE USING btree (partner_id WITH =, number WITH =) WHERE (type = 'sale')",
+            _("There is already a withhold on sales with the same number for the partner!"),
+        ),
+        (
+            "electronic_authorization_uniq",
+            "EXCLUDE USING btree (electronic_authorization WITH =) WHERE (electronic_authorization <> '')",
+            _("There is already a withhold with the same electronic authorization!"),
+        ),
+    ]
 
 
 class L10nEcWithholdLinePercent(models.Model):
@@ -868,14 +966,17 @@ class L10nEcWithholdLine(models.Model):
     def get_retention_code(self):
         self.ensure_one()
         retention_code = "6"
-        if self.tax_id.tax_group_id.l10n_ec_xml_fe_code:
-            retention_code = self.tax_id.tax_group_id.l10n_ec_xml_fe_code
+        if self.tax_id and self.tax_id._l10n_ec_get_tax_info()["group_code"]:
+            retention_code = self.tax_id._l10n_ec_get_tax_info()["group_code"]
         return retention_code
 
     def get_retention_tax_code(self):
+        if not self.tax_id:
+            return False
         if self.type == "iva":
-            return self.tax_id.l10n_ec_xml_fe_code
+            return self.tax_id._l10n_ec_get_tax_info()["xml_fe_code"]
         elif self.type == "rent":
+            # la descripcion es traducible, no se guarda en la clasificacion de impuestos
             return self.tax_id.description
 
     @api.model
@@ -1,25 +1,75 @@
 import base64
+import hashlib
 import logging
+import re
+import threading
 import time
 import traceback
-import xml.etree.ElementTree as ET
-from collections import OrderedDict
-from datetime import datetime
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from functools import wraps
 from pprint import pformat
-from random import randint
-from xml.etree.ElementTree import Element, SubElement, tostring
+from random import randint, uniform
+from types import SimpleNamespace
 
 import pytz
 from lxml import etree
-from zeep import Client
-from zeep.transports import Transport
+from lxml.etree import Element, SubElement
 
 from odoo import _, api, fields, models, tools
 from odoo.exceptions import UserError
 from odoo.tools import DEFAULT_SERVER_DATETIME_FORMAT as DTF
 
+from ..models import sri_ws_client, sri_xsd_schema
+
 _logger = logging.getLogger(__name__)
 
+# politica de reintentos segun el codigo de error devuelto por el SRI
+# tipo de reintento: (minutos de espera inicial, maximo de minutos de espera)
+RETRY_BACKOFF = {
+    "processing": (5, 120),
+    "registered": (10, 240),
+    "server": (15, 360),
+    "other": (60, 1440),
+}
+# cantidad de documentos offline que cada hilo toma a la vez, sus datos se precargan juntos
+OFFLINE_CLAIM_SIZE = 20
+RETRY_BACKOFF_BY_ERROR_CODE = {
+    # clave 70, comprobante en procesamiento
+    "70": "processing",
+    # clave 43, clave de acceso registrada
+    "43": "registered",
+    # clave 50, error interno del servidor o sin conexion con el SRI
+    "50": "server",
+}
+
+# mediciones de etapas en curso por hilo, para descontar de cada etapa el tiempo de las etapas internas
+# y mediciones terminadas pendientes de guardar(ver _l10n_ec_flush_stages)
+_stages_local = threading.local()
+
+
+def measure_stage(stage, payload_size=None, outcome=None):
+    """
+    Decorador para medir un metodo de sri.xml.data como etapa del proceso electronico
+    :param payload_size: funcion(xml_data, resultado) que devuelve el tamaño de los datos procesados
+    :param outcome: funcion(xml_data, resultado) que devuelve False si la etapa no fue exitosa
+    """
+
+    def decorator(method):
+        @wraps(method)
+        def wrapper(self, *args, **kwargs):
+            with self._l10n_ec_measure_stage(stage) as measure:
+                res = method(self, *args, **kwargs)
+                if payload_size is not None:
+                    measure["payload_size"] = payload_size(self, res)
+                if outcome is not None and not outcome(self, res):
+                    measure["outcome"] = "error"
+            return res
+
+        return wrapper
+
+    return decorator
+
 
 class SriXmlData(models.Model):
     _inherit = ["mail.thread", "mail.activity.mixin", "portal.mixin"]
@@ -29,6 +79,7 @@ class SriXmlData(models.Model):
 
     fields_size = {
         "l10n_ec_xml_key": 49,
+        "l10n_ec_batch_key": 49,
         "xml_authorization": 49,
     }
 
@@ -92,6 +143,7 @@ class SriXmlData(models.Model):
     xml_filename = fields.Char(string="Nombre de archivo xml", readonly=False, copy=False)
     xml_file_version = fields.Char("Version XML")
     l10n_ec_xml_key = fields.Char("Clave de Acceso", size=49, readonly=True, index=True, tracking=True)
+    l10n_ec_batch_key = fields.Char("Clave de Acceso del Lote", size=49, readonly=True, index=True, copy=False)
     xml_authorization = fields.Char("Autorización SRI", size=49, readonly=True, index=True)
     description = fields.Char("Description")
     invoice_out_id = fields.Many2one("account.move", "Factura", index=True, auto_join=True)
@@ -155,6 +207,27 @@ class SriXmlData(models.Model):
     authorization_to_cancel = fields.Char("Autorización para cancelar", size=64, readonly=True)
     cancel_date = fields.Datetime("Fecha de cancelación", readonly=True)
     cancel_user_id = fields.Many2one("res.users", "Usuario que canceló", readonly=True)
+    # campos para programar el siguiente intento de autorizacion en la tarea cron
+    next_attempt_date = fields.Datetime("Fecha de próximo intento", readonly=True, copy=False)
+    attempt_count = fields.Integer("Número de intentos", readonly=True, copy=False)
+    backoff_class = fields.Selection(
+        [
+            ("processing", "En procesamiento(70)"),
+            ("registered", "Clave registrada(43)"),
+            ("server", "Error del servidor(50)"),
+            ("other", "Otros errores"),
+        ],
+        string="Tipo de reintento",
+        readonly=True,
+        copy=False,
+    )
+    xml_fingerprint = fields.Char(
+        "Huella del XML firmado",
+        readonly=True,
+        copy=False,
+        help="Huella de los datos con que se genero el xml firmado, "
+        "si el documento no cambia se reutiliza el xml firmado en los siguientes intentos",
+    )
 
     _sql_constraints = [
         (
@@ -184,6 +257,15 @@ class SriXmlData(models.Model):
         ),
     ]
 
+    def init(self):
+        # indice para que la tarea cron solo tome los documentos cuyo proximo intento ya se cumplio
+        tools.create_index(
+            self._cr,
+            "sri_xml_data_next_attempt_index",
+            self._table,
+            ["company_id", "state", "next_attempt_date"],
+        )
+
     @api.model
     def get_current_wsClient(self, environment, url_type):
         """
@@ -198,12 +280,12 @@ class SriXmlData(models.Model):
         """
         # Debido a que el servidor me esta rechazando las conexiones contantemente, es necesario que se cree una sola instancia
         # Para conexion y asi evitar un reinicio constante de la comunicacion
+        # el cliente se reutiliza en el proceso(worker) mientras no cambie la url o el timeout
         wsClient = None
         company = self.env.company
         ws_url = self._get_url_ws(environment, url_type)
         try:
-            transport = Transport(timeout=company.l10n_ec_ws_timeout)
-            wsClient = Client(ws_url, transport=transport)
+            wsClient = sri_ws_client.get_client(environment, url_type, ws_url, company.l10n_ec_ws_timeout)
         except Exception as e:
             _logger.warning(
                 "Error in Connection with web services of SRI: %s. Error: %s",
@@ -212,6 +294,86 @@ class SriXmlData(models.Model):
             )
         return wsClient
 
+    @contextmanager
+    def _l10n_ec_measure_stage(self, stage):
+        """
+        Medir duracion, consultas sql y resultado de una etapa del proceso electronico del documento
+        el tiempo y consultas de las etapas internas(ej: validacion xsd dentro de la creacion del xml)
+        se descuentan de la etapa que las contiene
+        :param stage: etapa, ver XML_STAGES en xml_data_stage.py
+        :return: dict, se puede asignar payload_size con el tamaño de los datos procesados
+            y outcome='error' cuando la etapa no fue exitosa aunque no lance excepcion
+        """
+        measure = {"payload_size": 0, "outcome": "ok", "nested_duration": 0.0, "nested_queries": 0}
+        if not self.env["sri.xml.data.stage"]._is_enabled():
+            yield measure
+            return
+        stack = getattr(_stages_local, "stack", None)
+        if stack is None:
+            stack = _stages_local.stack = []
+        cr = self.env.cr
+        start = time.perf_counter()
+        queries_before = cr.sql_log_count
+        stack.append(measure)
+        try:
+            yield measure
+        except Exception:
+            measure["outcome"] = "error"
+            raise
+        finally:
+            stack.pop()
+            duration = (time.perf_counter() - start) * 1000.0
+            query_count = cr.sql_log_count - queries_before
+            self._l10n_ec_record_stage(
+                stage,
+                duration - measure["nested_duration"],
+                query_count - measure["nested_queries"],
+                measure["payload_size"],
+                measure["outcome"],
+            )
+            if stack:
+                # la etapa que contiene a esta no debe contar su tiempo
+                stack[-1]["nested_duration"] += duration
+                stack[-1]["nested_queries"] += query_count
+            else:
+                self._l10n_ec_flush_stages()
+
+    def _l10n_ec_record_stage(self, stage, duration, query_count, payload_size=0, outcome="ok"):
+        """
+        Agregar la medicion a las pendientes de guardar del hilo, se guardan con _l10n_ec_flush_stages
+        """
+        if not self.env["sri.xml.data.stage"]._is_enabled():
+            return False
+        xml_data = self[:1]
+        measures = getattr(_stages_local, "measures", None)
+        if measures is None:
+            measures = _stages_local.measures = []
+        measures.append(
+            (
+                xml_data.id or None,
+                (xml_data.company_id or self.env.company).id,
+                xml_data.l10n_ec_point_of_emission_id.id or None,
+                stage,
+                duration,
+                query_count,
+                payload_size or 0,
+                outcome,
+            )
+        )
+        return True
+
+    @api.model
+    def _l10n_ec_flush_stages(self):
+        """
+        Guardar las mediciones pendientes del hilo en otra transaccion,
+        asi las etapas con error se guardan aunque se revierta la transaccion del documento
+        """
+        measures = getattr(_stages_local, "measures", None)
+        if not measures:
+            return True
+        _stages_local.measures = []
+        return self.env["sri.xml.data.stage"]._store_stages(measures, new_cursor=True)
+
     def get_current_document(self):
         self.ensure_one()
         document = self.invoice_out_id
@@ -259,7 +421,7 @@ class SriXmlData(models.Model):
             document_active = True
         elif invoice_type == "liquidation" and company.l10n_ec_electronic_liquidation:
             document_active = True
-        elif invoice_type == "lote_masivo" and company.electronic_batch:
+        elif invoice_type == "lote_masivo" and company.l10n_ec_electronic_batch:
             document_active = True
         return document_active
 
@@ -409,15 +571,16 @@ class SriXmlData(models.Model):
         return clave_acceso, node
 
     def check_xsd(self, xml_string, xsd_file_path):
+        return self._check_xsd_tree(etree.fromstring(xml_string), xsd_file_path)
+
+    @measure_stage("xsd")
+    def _check_xsd_tree(self, xml_doc, xsd_file_path):
+        """
+        Validar el arbol lxml del documento contra el esquema, sin serializarlo
+        """
         try:
-            xsd_file = tools.file_open(xsd_file_path)
-            xmlschema_doc = etree.parse(xsd_file)
-            xmlschema = etree.XMLSchema(xmlschema_doc)
-            xml_doc = etree.fromstring(xml_string)
-            result = xmlschema.validate(xml_doc)
-            if not result:
-                xmlschema.assert_(xml_doc)
-            return result
+            # el esquema se compila una sola vez por proceso
+            return sri_xsd_schema.validate(xml_doc, xsd_file_path)
         except AssertionError as e:
             if self.env.context.get("l10n_ec_xml_call_from_cron") or tools.config.get("skip_xsd_check", False):
                 _logger.error(
@@ -432,8 +595,20 @@ class SriXmlData(models.Model):
     def action_generate_xml_file(self, document):
         """Genera estructura xml del archivo a ser firmado
         :param document: documento a firmar
+        :rtype: tuple(xml en str, xml en base64)
+        """
+        root = self._l10n_ec_build_xml_tree(document)
+        bytes_data = etree.tostring(root, encoding="UTF-8")
+        return bytes_data.decode(), base64.encodebytes(bytes_data)
+
+    @measure_stage("build")
+    def _l10n_ec_build_xml_tree(self, document):
+        """Genera el arbol lxml del archivo a ser firmado, validado contra el esquema xsd
+        :param document: documento a firmar
         :rtype: objeto root agregado con info tributaria
         """
+        with self._l10n_ec_measure_stage("fetch"):
+            document._l10n_ec_prefetch_electronic_data()
         # Cuando se encuentre en un ambiente de pruebas el sistema se debera usar para la razon social
         # PRUEBAS SERVICIO DE RENTAS INTERNAS
         util_model = self.env["l10n_ec.utils"]
@@ -476,11 +651,8 @@ class SriXmlData(models.Model):
             document.l10n_ec_action_generate_xml_data(root, xml_version)
         # Se identa con propositos de revision, no debe ser asi al enviar el documento
         util_model.indent(root)
-        bytes_data = tostring(root, encoding="UTF-8")
-        string_data = bytes_data.decode()
-        self.check_xsd(string_data, xml_version.file_path)
-        binary_data = base64.encodebytes(bytes_data)
-        return string_data, binary_data
+        self._check_xsd_tree(root, xml_version.file_path)
+        return root
 
     def _create_messaje_response(self, messajes, authorized, raise_error):
         message_model = self.env["sri.xml.data.message.line"]
@@ -547,12 +719,18 @@ class SriXmlData(models.Model):
             self.write(values)
         return messages_error, raise_error
 
+    @measure_stage(
+        "reception",
+        payload_size=lambda xml_data, response: len(base64.decodebytes(xml_data.xml_file or b"")),
+        outcome=lambda xml_data, response: bool(response),
+    )
     def _send_xml_data_to_valid(self, client_ws, client_ws_auth):
         """
         Enviar a validar el comprobante con la clave de acceso
         :param client_ws: instancia del webservice para realizar el proceso
         """
         try_model = self.env["sri.xml.data.send.try"]
+        self._l10n_ec_clear_last_error()
         self.write({"send_date": time.strftime(DTF)})
         response = False
         try:
@@ -676,6 +854,7 @@ class SriXmlData(models.Model):
             previous_authorized = True
         return ok, msj_res, error, previous_authorized
 
+    @measure_stage("authorization", outcome=lambda xml_data, response: bool(response))
     def _send_xml_data_to_autorice(self, client_ws):
         """
         Envia a autorizar el archivo
@@ -826,9 +1005,9 @@ class SriXmlData(models.Model):
         # el xml debe estar autorizado, tener fecha de autorizacion
         # si tengo xml firmado, a ese anexarle la autorizacion
         if self.state == "authorized" and self.xml_authorization and self.xml_file:
-            tree = ET.fromstring(self.get_file())
+            # anexar el xml firmado tal cual se envio al SRI, sin volver a parsearlo
             xml_authorized = self._create_file_authorized(
-                tree,
+                self._l10n_ec_get_file_without_declaration(),
                 self.xml_authorization,
                 fields.Datetime.context_timestamp(self, self.l10n_ec_authorization_date),
                 self.l10n_ec_type_environment,
@@ -849,8 +1028,8 @@ class SriXmlData(models.Model):
         authorizacion_ele.text = "PRODUCCION" if environment == "production" else "PRUEBAS"
         # agregar el resto del xml
         comprobante_node = SubElement(root, "comprobante")
-        comprobante_node.text = tostring(tree).decode()
-        xml_authorized = tostring(root).decode()
+        comprobante_node.text = tree if isinstance(tree, str) else etree.tostring(tree).decode()
+        xml_authorized = etree.tostring(root).decode()
         return xml_authorized
 
     def action_create_file_authorized(self):
@@ -891,6 +1070,7 @@ class SriXmlData(models.Model):
         for xml_rec in self:
             environment = xml_rec._get_environment()
             xml_rec.with_context(no_send=True).send_xml_data_to_check(environment, l10n_ec_max_intentos)
+            xml_rec._l10n_ec_schedule_next_attempt()
         return True
 
     def send_xml_data_to_check(self, environment, l10n_ec_max_intentos=1):
@@ -989,9 +1169,31 @@ class SriXmlData(models.Model):
         """
         return []
 
+    def _l10n_ec_prefetch_documents(self):
+        """
+        Precargar los datos de los documentos de todos los registros antes de generar sus xml,
+        los documentos se agrupan por modelo y cada modelo carga sus datos en lote
+        """
+        documents_by_model = {}
+        for field_name in (
+            "invoice_out_id",
+            "credit_note_out_id",
+            "debit_note_out_id",
+            "liquidation_id",
+            "withhold_id",
+        ):
+            documents = self.mapped(field_name)
+            documents_by_model.setdefault(documents._name, documents.browse())
+            documents_by_model[documents._name] |= documents
+        for documents in documents_by_model.values():
+            documents._l10n_ec_prefetch_electronic_data()
+        return True
+
     def action_create_xml_file(self):
         xml_to_notify = {}
         xml_to_sign = self.browse()
+        if len(self) > 1:
+            self._l10n_ec_prefetch_documents()
         for xml_rec in self:
             res_document = xml_rec.get_current_document()
             if not res_document:
@@ -1002,10 +1204,174 @@ class SriXmlData(models.Model):
                     xml_to_notify[xml_rec] = message_list
                     continue
             xml_to_sign |= xml_rec
+            # el xml firmado anteriormente sigue vigente, action_sign_batch solo debe cambiar el estado
+            if xml_rec._l10n_ec_is_signed_file_current(res_document):
+                continue
             string_data, binary_data = xml_rec.action_generate_xml_file(res_document)
             xml_rec.write_file(string_data)
         return xml_to_sign, xml_to_notify
 
+    def _l10n_ec_get_xml_fingerprint(self, document):
+        """
+        Calcular la huella(sha256) de los datos con que se genera el xml del documento
+        incluye los datos de la compañia, el ambiente y la llave de firma,
+        si alguno de ellos cambia, el xml se debe generar y firmar nuevamente
+        :param document: documento del xml
+        :return: str con la huella, False si el documento no permite calcularla
+        """
+        document_data = document._l10n_ec_get_xml_fingerprint_data()
+        if document_data is None:
+            return False
+        company = self.company_id or self.env.company
+        printer = self.l10n_ec_point_of_emission_id
+        key_type = company.l10n_ec_key_type_id
+        data = [
+            self._get_environment(),
+            document.l10n_ec_get_document_version_xml().version_file,
+            company.partner_id.name,
+            company.partner_id.l10n_ec_business_name,
+            company.partner_id.vat,
+            company.partner_id.get_direccion_matriz(printer),
+            company.partner_id.property_account_position_id.l10n_ec_no_account,
+            company.l10n_ec_microenterprise_regime_taxpayer,
+            company.l10n_ec_retention_resolution_number,
+            company.get_contribuyente_data(document.l10n_ec_get_document_date()),
+            printer.number,
+            printer.agency_id.number,
+            printer.agency_id.address_id.street,
+            key_type.id,
+            key_type.write_date,
+            document._l10n_ec_get_info_aditional(),
+            document_data,
+        ]
+        return hashlib.sha256(repr(data).encode()).hexdigest()
+
+    def _l10n_ec_is_signed_file_current(self, document):
+        """
+        Verificar si el xml firmado guardado se genero con los mismos datos que tiene el documento ahora,
+        en ese caso se puede reutilizar sin volver a generar, validar y firmar el xml
+        """
+        return bool(
+            self.xml_file
+            and self.xml_fingerprint
+            and self.xml_fingerprint == self._l10n_ec_get_xml_fingerprint(document)
+        )
+
+    def action_create_signed_xml_file(self):
+        """
+        Crear y firmar el xml en un solo paso, el arbol lxml generado se valida y firma directamente
+        y se serializa una unica vez al guardar el archivo firmado
+        :return: tuple(documentos firmados, dict con mensajes de validacion previos al envio)
+        """
+        xml_to_notify = {}
+        xml_signed = self.browse()
+        if len(self) > 1:
+            self._l10n_ec_prefetch_documents()
+        for xml_rec in self:
+            res_document = xml_rec.get_current_document()
+            if not res_document:
+                continue
+            if self.env.context.get("l10n_ec_xml_call_from_cron", False):
+                message_list = xml_rec._get_messages_before_sent_sri(res_document)
+                if message_list:
+                    xml_to_notify[xml_rec] = message_list
+                    continue
+            key_type = xml_rec.company_id.l10n_ec_key_type_id
+            if not key_type:
+                raise UserError(
+                    _(
+                        "Es obligatorio seleccionar el tipo de llave o archivo de cifrado usa para la firma de los documentos electrónicos, verificar la configuración de la compañia"
+                    )
+                )
+            # si el documento no cambio desde la ultima firma, reutilizar el xml firmado
+            if xml_rec._l10n_ec_is_signed_file_current(res_document):
+                xml_rec.write({"state": "signed"})
+                xml_signed |= xml_rec
+                continue
+            root = xml_rec._l10n_ec_build_xml_tree(res_document)
+            with xml_rec._l10n_ec_measure_stage("sign") as measure:
+                try:
+                    key_type._sign_tree(root)
+                except Exception as ex:
+                    raise UserError(tools.ustr(ex))
+                signed_data = etree.tostring(root, encoding="UTF-8", pretty_print=True)
+                measure["payload_size"] = len(signed_data)
+            vals = xml_rec._prepare_file_values(signed_data)
+            vals.update(
+                {
+                    "signed_date": time.strftime(DTF),
+                    "state": "signed",
+                }
+            )
+            if self.env.context.get("sign_now", True):
+                vals["xml_fingerprint"] = xml_rec._l10n_ec_get_xml_fingerprint(res_document)
+            xml_rec.write(vals)
+            xml_signed |= xml_rec
+        return xml_signed, xml_to_notify
+
+    def action_sign_batch(self):
+        """
+        Firmar en lote los xml ya creados, agrupados por la llave de firma de cada compañia
+        la firma puede repartirse en varios procesos(ver sri.key.type.action_sign_batch)
+        y los resultados se escriben al final de cada grupo
+        :return: recordset con los documentos firmados
+        """
+        xml_signed = self.browse()
+        xml_to_sign = self.filtered(lambda x: x.xml_file and x.state == "draft")
+        # los xml con huella ya estan firmados y siguen vigentes(ver action_create_xml_file)
+        xml_current = xml_to_sign.filtered("xml_fingerprint")
+        if xml_current:
+            xml_current.write({"state": "signed"})
+            xml_signed |= xml_current
+            xml_to_sign -= xml_current
+        for key_type in xml_to_sign.mapped("company_id.l10n_ec_key_type_id"):
+            xml_recs = xml_to_sign.filtered(lambda x: x.company_id.l10n_ec_key_type_id == key_type)
+            start = time.perf_counter()
+            queries_before = self.env.cr.sql_log_count
+            signed_list = key_type.action_sign_batch([xml_rec.get_file() for xml_rec in xml_recs])
+            # la firma en lote no se puede medir por documento, repartir el tiempo entre los documentos del grupo
+            duration = (time.perf_counter() - start) * 1000.0 / len(xml_recs)
+            query_count = (self.env.cr.sql_log_count - queries_before) // len(xml_recs)
+            xml_group_signed = self.browse()
+            for xml_rec, xml_signed_data in zip(xml_recs, signed_list):
+                xml_rec._l10n_ec_record_stage(
+                    "sign",
+                    duration,
+                    query_count,
+                    0 if isinstance(xml_signed_data, Exception) else len(xml_signed_data),
+                    "error" if isinstance(xml_signed_data, Exception) else "ok",
+                )
+                if isinstance(xml_signed_data, Exception):
+                    if not self.env.context.get("l10n_ec_xml_call_from_cron"):
+                        raise UserError(tools.ustr(xml_signed_data))
+                    _logger.error(
+                        "Error signing xml of document %s. ERROR: %s", xml_rec.id, tools.ustr(xml_signed_data)
+                    )
+                    continue
+                # el archivo firmado es distinto en cada documento, el estado se escribe una sola vez por grupo
+                vals = xml_rec._prepare_file_values(xml_signed_data.encode())
+                if self.env.context.get("sign_now", True):
+                    vals["xml_fingerprint"] = xml_rec._l10n_ec_get_xml_fingerprint(xml_rec.get_current_document())
+                xml_rec.write(vals)
+                xml_group_signed |= xml_rec
+            if xml_group_signed:
+                xml_group_signed.write(
+                    {
+                        "signed_date": time.strftime(DTF),
+                        "state": "signed",
+                    }
+                )
+            xml_signed |= xml_group_signed
+            self._l10n_ec_flush_stages()
+        xml_without_key = xml_to_sign.filtered(lambda x: not x.company_id.l10n_ec_key_type_id)
+        if xml_without_key:
+            raise UserError(
+                _(
+                    "Es obligatorio seleccionar el tipo de llave o archivo de cifrado usa para la firma de los documentos electrónicos, verificar la configuración de la compañia"
+                )
+            )
+        return xml_signed
+
     def action_sing_xml_file(self):
         for xml_rec in self:
             company = xml_rec.company_id
@@ -1017,7 +1383,10 @@ class SriXmlData(models.Model):
                             "Es obligatorio seleccionar el tipo de llave o archivo de cifrado usa para la firma de los documentos electrónicos, verificar la configuración de la compañia"
                         )
                     )
-                if xml_rec.xml_file:
+                if xml_rec.xml_file and xml_rec.xml_fingerprint:
+                    # el xml ya esta firmado y sigue vigente
+                    vals = {"state": "signed"}
+                elif xml_rec.xml_file:
                     xml_string_data = xml_rec.get_file()
                     xml_signed = company.l10n_ec_key_type_id.action_sign(xml_string_data)
                     if not xml_signed:
@@ -1042,6 +1411,75 @@ class SriXmlData(models.Model):
         for xml_rec in self:
             environment = xml_rec._get_environment()
             xml_rec.send_xml_data_to_check(environment)
+            xml_rec._l10n_ec_schedule_next_attempt()
+        return True
+
+    def _l10n_ec_is_retry_pending(self):
+        """
+        Verificar si el documento debe volver a consultarse en el SRI
+        * en espera de autorizacion
+        * firmados que ya se enviaron a autorizar
+        * no autorizados por un error temporal del SRI(50, 70, 43)
+        * no autorizados sin codigo del SRI que ya se enviaron a autorizar(error inesperado al enviar)
+        """
+        self.ensure_one()
+        if self.state == "waiting":
+            return True
+        sent = any(try_rec.type_send == "send" for try_rec in self.try_ids)
+        if self.state == "signed":
+            return sent
+        if self.state == "rejected":
+            if not self.last_error_id:
+                return sent
+            return self.last_error_id.code in RETRY_BACKOFF_BY_ERROR_CODE
+        return False
+
+    def _l10n_ec_get_backoff_class(self):
+        """
+        Tipo de reintento segun el ultimo codigo de error devuelto por el SRI
+        los documentos enviados que aun no tienen codigo de error(recibidos pero aun sin autorizar)
+        se consultan como documentos en procesamiento
+        """
+        self.ensure_one()
+        if not self.last_error_id and self.state in ("waiting", "signed"):
+            return "processing"
+        return RETRY_BACKOFF_BY_ERROR_CODE.get(self.last_error_id.code, "other")
+
+    def _l10n_ec_clear_last_error(self):
+        """
+        Descartar el ultimo error antes de procesar una nueva respuesta del SRI,
+        asi el tipo de reintento solo depende del error de la ultima respuesta
+        """
+        xml_with_error = self.filtered("last_error_id")
+        if xml_with_error:
+            xml_with_error.write({"last_error_id": False})
+        return True
+
+    def _l10n_ec_schedule_next_attempt(self):
+        """
+        Programar el siguiente intento de autorizacion con espera exponencial(con variacion aleatoria)
+        segun el ultimo codigo de error devuelto por el SRI
+        los documentos que ya no deben reintentarse quedan sin fecha de proximo intento
+        """
+        now = fields.Datetime.now()
+        for xml_data in self:
+            if not xml_data._l10n_ec_is_retry_pending():
+                if xml_data.next_attempt_date:
+                    xml_data.write({"next_attempt_date": False})
+                continue
+            backoff_class = xml_data._l10n_ec_get_backoff_class()
+            base_minutes, max_minutes = RETRY_BACKOFF[backoff_class]
+            delay = min(base_minutes * 2 ** xml_data.attempt_count, max_minutes)
+            # la mitad de la espera es fija y la otra mitad aleatoria
+            # para que los documentos que fallaron juntos no se consulten todos al mismo tiempo
+            delay = delay / 2.0 + uniform(0, delay / 2.0)
+            xml_data.write(
+                {
+                    "next_attempt_date": now + timedelta(minutes=delay),
+                    "attempt_count": xml_data.attempt_count + 1,
+                    "backoff_class": backoff_class,
+                }
+            )
         return True
 
     # @api.model
@@ -1085,8 +1523,9 @@ class SriXmlData(models.Model):
             #     documents_sended |= xml_rec
             #     continue
             try:
-                if document.l10n_ec_action_sent_mail_electronic():
-                    documents_sended |= xml_rec
+                with xml_rec._l10n_ec_measure_stage("mail"):
+                    if document.l10n_ec_action_sent_mail_electronic():
+                        documents_sended |= xml_rec
             except Exception as e:
                 if self.env.context.get("l10n_ec_xml_call_from_cron", False):
                     _logger.warning("Error send mail to partner. ERROR: %s", tools.ustr(e))
@@ -1121,10 +1560,9 @@ class SriXmlData(models.Model):
             xml_process_online = self - xml_process_offline
         # crear el xml, firmarlo y enviarlo al SRI
         if xml_process_online:
-            xml_to_sign, xml_to_notify = self.action_create_xml_file()
-            if xml_to_sign:
-                xml_to_sign.action_sing_xml_file()
-                xml_to_sign.filtered(lambda x: x.state == "signed").action_send_xml_file()
+            xml_signed, xml_to_notify = xml_process_online.action_create_signed_xml_file()
+            if xml_signed:
+                xml_signed.action_send_xml_file()
         # solo enviar a crear el xml con la clave de acceso,
         # una tarea cron se debe encargar de continuar con el proceso electronico
         if xml_process_offline:
@@ -1151,15 +1589,13 @@ class SriXmlData(models.Model):
     def _send_documents_offline(self):
         """
         Procesar los documentos emitidos en modo offline
+        cada documento se bloquea y se confirma en su propia transaccion,
+        asi varios procesos(hilos o tareas cron) pueden procesar documentos distintos al mismo tiempo
+        y un error en un documento no revierte los demas
         """
         company = self.env.company
-        xml_recs = self.search(
-            [("state", "=", "draft"), ("company_id", "=", company.id)],
-            order="number_document",
-            limit=company.l10n_ec_cron_process,
-        )
         # si no hay documentos evitar establecer conexion con el SRI
-        if not xml_recs:
+        if not self.search_count([("state", "=", "draft"), ("company_id", "=", company.id)]):
             return True
         environment = self._get_environment()
         receipt_client = self.get_current_wsClient(environment, "reception")
@@ -1167,46 +1603,356 @@ class SriXmlData(models.Model):
         if receipt_client is None or auth_client is None:
             _logger.error("No se puede conectar con el SRI, por favor verifique su conexion o intente luego")
             return False
-        counter = 1
-        total = len(xml_recs)
-        xml_to_notify_no_autorize = self.browse()
-        xml_to_notify2 = OrderedDict()
-        xml_to_notify = OrderedDict()
-        for xml_data in xml_recs:
-            _logger.info("Procesando documentos offline: %s de %s", counter, total)
-            counter += 1
+        if self._is_document_authorized("lote_masivo"):
+            return self._send_documents_offline_batch(receipt_client, auth_client)
+        queue = {
+            "lock": threading.Lock(),
+            "total": company.l10n_ec_cron_process,
+            "pending": company.l10n_ec_cron_process,
+            "processed_ids": set(),
+            "done": 0,
+        }
+        # en pruebas unitarias no se puede abrir otros cursores, procesar en la transaccion actual
+        if getattr(threading.currentThread(), "testing", False):
+            self._send_documents_offline_worker(queue, receipt_client, auth_client)
+            return True
+        threads = []
+        for index in range(max(company.l10n_ec_cron_workers, 1)):
+            thread = threading.Thread(
+                target=self._send_documents_offline_thread,
+                args=(queue, receipt_client, auth_client),
+                name="l10n_ec_offline_%s_%s" % (company.id, index),
+            )
+            thread.start()
+            threads.append(thread)
+        for thread in threads:
+            thread.join()
+        return True
+
+    @api.model
+    def _send_documents_offline_thread(self, queue, receipt_client, auth_client):
+        with api.Environment.manage(), self.pool.cursor() as new_cr:
+            self.with_env(self.env(cr=new_cr))._send_documents_offline_worker(
+                queue, receipt_client, auth_client, auto_commit=True
+            )
+
+    @api.model
+    def _send_documents_offline_worker(self, queue, receipt_client, auth_client, auto_commit=False):
+        """
+        Tomar documentos de la cola hasta procesar el limite configurado en la compañia,
+        los documentos se toman por bloques(OFFLINE_CLAIM_SIZE) y sus datos se precargan en lote
+        :param queue: dict compartido entre los hilos con el limite y los documentos ya procesados
+        :param auto_commit: confirmar la transaccion despues de procesar cada documento
+        """
+        while True:
+            with queue["lock"]:
+                if queue["pending"] <= 0:
+                    break
+                claim_size = min(queue["pending"], OFFLINE_CLAIM_SIZE)
+                queue["pending"] -= claim_size
+                processed_ids = tuple(queue["processed_ids"])
+            xml_recs = self._claim_documents_offline(processed_ids, limit=claim_size)
+            with queue["lock"]:
+                queue["processed_ids"].update(xml_recs.ids)
+                # devolver a la cola lo que no se pudo tomar
+                queue["pending"] += claim_size - len(xml_recs)
+            if not xml_recs:
+                break
+            xml_recs._l10n_ec_prefetch_documents()
+            for index, xml_data in enumerate(xml_recs):
+                # al confirmar la transaccion se liberan los bloqueos del resto del bloque, volver a bloquear
+                if auto_commit and index and not xml_data._l10n_ec_lock_document_offline():
+                    with queue["lock"]:
+                        queue["pending"] += 1
+                    continue
+                with queue["lock"]:
+                    queue["done"] += 1
+                    counter = queue["done"]
+                _logger.info("Procesando documentos offline: %s de %s", counter, queue["total"])
+                try:
+                    xml_data._process_document_offline(receipt_client, auth_client)
+                    if auto_commit:
+                        self.env.cr.commit()
+                except Exception as e:
+                    if not auto_commit:
+                        raise
+                    self.env.cr.rollback()
+                    self.env.clear()
+                    _logger.error(
+                        "Error processing offline document %s. ERROR: %s", xml_data.id, tools.ustr(e), exc_info=True
+                    )
+        return True
+
+    def _l10n_ec_lock_document_offline(self):
+        """
+        Volver a bloquear el documento tomado por este proceso,
+        :return: False si otro proceso lo tiene bloqueado o ya no esta en borrador
+        """
+        self.ensure_one()
+        self.env.cr.execute(
+            "SELECT id FROM sri_xml_data WHERE id = %s AND state = 'draft' FOR NO KEY UPDATE SKIP LOCKED",
+            (self.id,),
+        )
+        return bool(self.env.cr.fetchone())
+
+    @api.model
+    def _claim_documents_offline(self, exclude_ids=(), limit=1):
+        """
+        Bloquear los siguientes documentos en borrador de la compañia para procesarlos
+        los documentos bloqueados por otro proceso se omiten(SKIP LOCKED)
+        el bloqueo NO KEY UPDATE permite guardar los tiempos del documento desde otra transaccion(ver _store_stages)
+        :param exclude_ids: ids de documentos que ya fueron procesados en esta ejecucion
+        :param limit: numero maximo de documentos a bloquear
+        :return: recordset de sri.xml.data, vacio si no hay mas documentos por procesar
+        """
+        self.env["sri.xml.data"].flush(["state", "company_id", "number_document"])
+        self.env.cr.execute(
+            """
+            SELECT id FROM sri_xml_data
+            WHERE state = 'draft' AND company_id = %s AND id NOT IN %s
+            ORDER BY number_document
+            LIMIT %s
+            FOR NO KEY UPDATE SKIP LOCKED
+            """,
+            (self.env.company.id, tuple(exclude_ids) or (0,), limit),
+        )
+        return self.browse([row[0] for row in self.env.cr.fetchall()])
+
+    def _process_document_offline(self, receipt_client, auth_client):
+        """
+        Crear el xml, firmarlo, enviarlo y autorizarlo en el SRI
+        :return: dict con los mensajes de validacion previos al envio, si los hubiera
+        """
+        self.ensure_one()
+        xml_to_notify = {}
+        document = self.get_current_document()
+        if not document:
+            return xml_to_notify
+        # crear y firmar el xml, si no devuelve nada es xq no paso la validacion y no debe enviarse
+        xml_signed, xml_to_notify = self.action_create_signed_xml_file()
+        if not xml_signed or self.state != "signed":
+            return xml_to_notify
+        # enviar a autorizar el xml(si se autorizo, enviara el mail a los involucrados)
+        response = self._send_xml_data_to_valid(receipt_client, auth_client)
+        (
+            ok,
+            messages,
+            raise_error,
+            previous_authorized,
+        ) = self._process_response_check(response)
+        # si recibio la solicitud, enviar a autorizar
+        if ok:
+            response = self._send_xml_data_to_autorice(auth_client)
+            ok, messages = self._process_response_autorization(response)
+        self._create_messaje_response(messages, ok, raise_error)
+        # si no se puede autorizar, programar el siguiente intento segun el error devuelto
+        self._l10n_ec_schedule_next_attempt()
+        return xml_to_notify
+
+    @api.model
+    def _send_documents_offline_batch(self, receipt_client, auth_client):
+        """
+        Procesar los documentos offline en lotes masivos
+        cada documento se crea y firma individualmente, pero se envian al SRI en un solo lote
+        cada lote se confirma en su propia transaccion
+        """
+        company = self.env.company
+        auto_commit = not getattr(threading.currentThread(), "testing", False)
+        batch_size = max(company.l10n_ec_batch_size, 1)
+        pending = company.l10n_ec_cron_process
+        processed_ids = set()
+        sign_in_processes = self.env["sri.key.type"]._get_sign_processes() > 1
+        while pending > 0:
+            xml_recs = self._claim_documents_offline(tuple(processed_ids), min(batch_size, pending))
+            if not xml_recs:
+                break
+            pending -= len(xml_recs)
+            processed_ids.update(xml_recs.ids)
+            _logger.info("Procesando lote de documentos offline: %s documentos", len(xml_recs))
+            xml_recs._l10n_ec_prefetch_documents()
+            xml_to_sign = xml_to_send = self.browse()
+            for xml_data in xml_recs:
+                if not xml_data.get_current_document():
+                    continue
+                try:
+                    with self.env.cr.savepoint():
+                        # con varios procesos de firma, solo crear el xml y firmar todo el lote al final
+                        if sign_in_processes:
+                            xml_to_sign |= xml_data.action_create_xml_file()[0]
+                        else:
+                            xml_data.action_create_signed_xml_file()
+                except Exception as e:
+                    _logger.error("Error creating xml of document %s. ERROR: %s", xml_data.id, tools.ustr(e))
+                    continue
+                if xml_data.state == "signed":
+                    xml_to_send |= xml_data
+            if xml_to_sign:
+                try:
+                    with self.env.cr.savepoint():
+                        xml_to_send |= xml_to_sign.action_sign_batch()
+                except Exception as e:
+                    _logger.error("Error signing batch of documents %s. ERROR: %s", xml_to_sign.ids, tools.ustr(e))
+            for xml_batch in xml_to_send._l10n_ec_split_batch().values():
+                xml_batch._l10n_ec_send_batch(receipt_client, auth_client)
+                xml_batch._l10n_ec_schedule_next_attempt()
+            if auto_commit:
+                self.env.cr.commit()
+        return True
+
+    def _l10n_ec_split_batch(self):
+        """
+        Agrupar los documentos por tipo de documento y establecimiento,
+        un lote masivo solo puede tener comprobantes del mismo tipo y establecimiento
+        :return: dict(tuple(codDoc, establecimiento): recordset de sri.xml.data)
+        """
+        batches = {}
+        for xml_data in self:
             document = xml_data.get_current_document()
-            if not document:
-                continue
-            # enviar a crear el xml, si no devuelve nada es xq no paso la validacion y no debe firmarse
-            xml_to_sign, xml_to_notify2 = xml_data.action_create_xml_file()
-            if xml_to_notify2:
-                xml_to_notify.update(xml_to_notify2)
-            if not xml_to_sign:
-                continue
-            # enviar a firmar el xml
-            xml_data.action_sing_xml_file()
-            if xml_data.state != "signed":
-                continue
-            # enviar a autorizar el xml(si se autorizo, enviara el mail a los involucrados)
-            response = xml_data._send_xml_data_to_valid(receipt_client, auth_client)
-            (
-                ok,
-                messages,
-                raise_error,
-                previous_authorized,
-            ) = xml_data._process_response_check(response)
-            # si recibio la solicitud, enviar a autorizar
-            if ok:
-                response = xml_data._send_xml_data_to_autorice(auth_client)
-                ok, messages = xml_data._process_response_autorization(response)
-            xml_data._create_messaje_response(messages, ok, raise_error)
-            # TODO: si no se puede autorizar, que se debe hacer??
-            # por ahora, no hago nada para que la tarea siga intentando en una nueva llamada
-            if not ok and messages:
-                xml_to_notify_no_autorize |= xml_data
+            key = (
+                document.l10n_ec_get_document_code_sri(),
+                xml_data.l10n_ec_point_of_emission_id.agency_id.number,
+            )
+            batches.setdefault(key, self.browse())
+            batches[key] |= xml_data
+        return batches
+
+    def _l10n_ec_create_batch_xml(self, environment):
+        """
+        Crear el xml del lote masivo(loteMasivo_1.0.0.xsd) con los comprobantes firmados
+        todos los registros deben ser del mismo tipo de documento y establecimiento
+        :return: tuple(clave de acceso del lote, bytes del xml)
+        """
+        first_xml = self[0]
+        company = first_xml.company_id or self.env.company
+        document = first_xml.get_current_document()
+        document_code_sri = document.l10n_ec_get_document_code_sri()
+        printer = first_xml.l10n_ec_point_of_emission_id
+        batch_key = self.get_single_key(
+            company,
+            document_code_sri,
+            environment,
+            printer,
+            self.get_sequence(document.l10n_ec_get_document_number()),
+            fields.Date.context_today(self),
+        )
+        root = etree.Element("lote-masivo", id="lote", version="1.0.0")
+        etree.SubElement(root, "ambiente").text = environment
+        etree.SubElement(root, "tipoEmision").text = "1"
+        etree.SubElement(root, "ruc").text = company.partner_id.vat
+        etree.SubElement(root, "claveAcceso").text = batch_key
+        etree.SubElement(root, "establecimiento").text = printer.agency_id.number
+        etree.SubElement(root, "codDoc").text = document_code_sri
+        comprobantes = etree.SubElement(root, "comprobantes")
+        for xml_data in self:
+            comprobante = etree.SubElement(comprobantes, "comprobante")
+            comprobante.text = etree.CDATA(xml_data.get_file())
+        return batch_key, etree.tostring(root, encoding="UTF-8", xml_declaration=True)
+
+    def _l10n_ec_send_batch(self, receipt_client, auth_client):
+        """
+        Enviar los documentos firmados al SRI en un solo lote masivo
+        y procesar la autorizacion de cada documento del lote
+        """
+        try_model = self.env["sri.xml.data.send.try"]
+        environment = self._get_environment()
+        batch_key, batch_data = self._l10n_ec_create_batch_xml(environment)
+        now = time.strftime(DTF)
+        self._l10n_ec_clear_last_error()
+        self.write({"send_date": now})
+        try_model.create([{"xml_id": xml_data.id, "send_date": now, "type_send": "send"} for xml_data in self])
+        try:
+            response = receipt_client.service.validarComprobante(xml=batch_data)
+        except Exception as e:
+            _logger.warning("Error send batch %s to SRI. ERROR: %s", batch_key, tools.ustr(e))
+            # sin clave de lote, la tarea de documentos en espera verificara cada documento individualmente
+            self.write({"state": "waiting"})
+            return False
+        # solo guardar la clave del lote cuando el SRI lo recibio, para consultar su autorizacion posteriormente
+        self.write({"response_date": time.strftime(DTF), "l10n_ec_batch_key": batch_key})
+        _logger.info(
+            "Send batch succesful, claveAcceso %s. %s",
+            batch_key,
+            str(response.estado) if hasattr(response, "estado") else "SIN RESPUESTA",
+        )
+        if hasattr(response, "estado") and response.estado == "DEVUELTA":
+            self._l10n_ec_process_batch_returned(response)
+            return False
+        return self._l10n_ec_check_batch_authorization(auth_client, batch_key)
+
+    def _l10n_ec_process_batch_returned(self, response):
+        """
+        Registrar los mensajes de un lote devuelto en cada documento
+        los errores del lote(clave de acceso del lote) se registran en todos los documentos
+        """
+        xml_by_key = {xml_data.l10n_ec_xml_key: xml_data for xml_data in self}
+        try:
+            comprobantes = hasattr(response.comprobantes, "comprobante") and response.comprobantes.comprobante or []
+        except Exception:
+            comprobantes = []
+        for comprobante in comprobantes:
+            xml_recs = xml_by_key.get(getattr(comprobante, "claveAcceso", False)) or self
+            messages = []
+            for msj in comprobante.mensajes.mensaje:
+                messages.append(
+                    {
+                        "identificador": msj.identificador if hasattr(msj, "identificador") else "",
+                        "informacionAdicional": msj.informacionAdicional if hasattr(msj, "informacionAdicional") else "",
+                        "mensaje": msj.mensaje if hasattr(msj, "mensaje") else "",
+                        "tipo": msj.tipo if hasattr(msj, "tipo") else "",
+                    }
+                )
+            for xml_data in xml_recs:
+                xml_data.write({"state": "returned"})
+                xml_data._create_messaje_response(messages, False, False)
         return True
 
+    def _l10n_ec_check_batch_authorization(self, auth_client, batch_key):
+        """
+        Consultar la autorizacion del lote y asignar el resultado a cada documento
+        los documentos que aun no tienen respuesta quedan en espera de autorizacion
+        :return: True si todos los documentos del lote fueron autorizados
+        """
+        try:
+            response = auth_client.service.autorizacionComprobanteLote(claveAccesoLote=batch_key)
+        except Exception as e:
+            _logger.warning("Error checking authorization of batch %s. ERROR: %s", batch_key, tools.ustr(e))
+            response = False
+        self._l10n_ec_clear_last_error()
+        authorizations = []
+        if response and getattr(response, "autorizaciones", None) is not None:
+            authorizations = response.autorizaciones.autorizacion
+            if not isinstance(authorizations, list):
+                authorizations = [authorizations]
+        authorizations_by_key = {}
+        for authorization in authorizations:
+            access_key = self._l10n_ec_get_access_key_from_authorization(authorization)
+            # si un documento tiene varias respuestas, dar prioridad a la autorizada
+            if access_key not in authorizations_by_key or authorization.estado == "AUTORIZADO":
+                authorizations_by_key[access_key] = authorization
+        all_authorized = True
+        for xml_data in self:
+            authorization = authorizations_by_key.get(xml_data.l10n_ec_xml_key)
+            if authorization is None:
+                xml_data.write({"state": "waiting"})
+                all_authorized = False
+                continue
+            response_doc = SimpleNamespace(autorizaciones=SimpleNamespace(autorizacion=[authorization]))
+            ok, messages = xml_data._process_response_autorization(response_doc)
+            xml_data._create_messaje_response(messages, ok, False)
+            all_authorized = all_authorized and ok
+        return all_authorized
+
+    @api.model
+    def _l10n_ec_get_access_key_from_authorization(self, authorization):
+        """
+        Obtener la clave de acceso del comprobante autorizado dentro de la respuesta del lote
+        """
+        comprobante = getattr(authorization, "comprobante", None) or ""
+        match = re.search(r"<claveAcceso>(\d{49})</claveAcceso>", comprobante)
+        if match:
+            return match.group(1)
+        return str(getattr(authorization, "numeroAutorizacion", "") or "")
+
     @api.model
     def _get_documents_rejected(self, company):
         """
@@ -1271,32 +2017,17 @@ class SriXmlData(models.Model):
         solo esperar que sean confirmada su autorizacion
         """
         company = self.env.company
+        # solo tomar los documentos cuyo proximo intento ya se cumplio
+        # la fecha del proximo intento se programa al procesar cada documento(_l10n_ec_schedule_next_attempt)
         xml_recs = self.search(
-            [("state", "=", "waiting"), ("company_id", "=", company.id)],
-            limit=company.l10n_ec_cron_process,
-        )
-        # en algunas ocaciones los documentos se envian a autorizar, pero se quedan como firmados
-        # buscar los documentos firmados que se hayan enviado a autorizar para verificar si fueron autorizados o no
-        xml_signed_recs = self.search(
-            [("state", "in", ("signed", "rejected")), ("company_id", "=", company.id)],
+            [
+                ("company_id", "=", company.id),
+                ("state", "in", ("waiting", "signed", "rejected")),
+                ("next_attempt_date", "<=", fields.Datetime.now()),
+            ],
+            order="next_attempt_date",
             limit=company.l10n_ec_cron_process,
         )
-        xml_send_to_autorice = False
-        for xml_signed in xml_signed_recs:
-            xml_send_to_autorice = False
-            # si hay un intento de envio a autorizar, verificar si el registro fue autorizado
-            if xml_signed.try_ids.filtered(lambda x: x.type_send == "send"):
-                # cuando el estado sea rechazado(no autorizado) solo enviar a verificar si no hay mensajes informativos
-                # caso contrario se ignorara y una tarea cron lo enviara por correo notificando el error devuelto por el SRI
-                if xml_signed.state == "rejected":
-                    if not xml_signed.message_ids:
-                        xml_send_to_autorice = True
-                else:
-                    xml_send_to_autorice = True
-            # agregarlo a la lista para verificar si fue autorizado
-            if xml_send_to_autorice and xml_signed not in xml_recs:
-                xml_recs += xml_signed
-                continue
         if not xml_recs:
             return True
         environment = self._get_environment()
@@ -1305,6 +2036,17 @@ class SriXmlData(models.Model):
         if receipt_client is None or auth_client is None:
             _logger.error("No se puede conectar con el SRI, por favor verifique su conexion o intente luego")
             return False
+        # los documentos enviados en lote masivo se consultan por la clave del lote
+        # los que aun no tienen respuesta siguen en procesamiento en el SRI y no deben reenviarse
+        xml_batch_recs = xml_recs.filtered(lambda x: x.l10n_ec_batch_key)
+        xml_by_batch = {}
+        for xml_data in xml_batch_recs:
+            xml_by_batch.setdefault(xml_data.l10n_ec_batch_key, self.browse())
+            xml_by_batch[xml_data.l10n_ec_batch_key] |= xml_data
+        for batch_key, xml_batch in xml_by_batch.items():
+            xml_batch._l10n_ec_check_batch_authorization(auth_client, batch_key)
+        xml_batch_recs._l10n_ec_schedule_next_attempt()
+        xml_recs -= xml_batch_recs
         counter = 1
         total = len(xml_recs)
         xml_to_notify = self.browse()
@@ -1317,6 +2059,8 @@ class SriXmlData(models.Model):
             counter += 1
             document = xml_data.get_current_document()
             if not document:
+                # documentos huerfanos, no volver a tomarlos en la tarea cron
+                xml_data.write({"next_attempt_date": False})
                 continue
             response = xml_data._send_xml_data_to_valid(receipt_client, auth_client)
             (
@@ -1330,8 +2074,8 @@ class SriXmlData(models.Model):
                 response = xml_data._send_xml_data_to_autorice(auth_client)
                 ok, messages = xml_data._process_response_autorization(response)
             xml_data._create_messaje_response(messages, ok, raise_error)
-            # TODO: si no se puede autorizar, que se debe hacer??
-            # por ahora, no hago nada para que la tarea siga intentando en una nueva llamada
+            # si no se puede autorizar, programar el siguiente intento segun el error devuelto
+            xml_data._l10n_ec_schedule_next_attempt()
             if not ok and messages:
                 xml_to_notify |= xml_data
         return True
@@ -1450,15 +2194,31 @@ class SriXmlData(models.Model):
         @param file_content: el contenido del archivo, en str
         @return: el nombre del archivo generado
         """
-        # obtener el nombre del archivo
-        file_name = self.generate_file_name()
-        self.write(
-            {
-                "xml_file": base64.encodebytes(file_content.encode()),
-                "xml_filename": file_name,
-            }
-        )
-        return file_name
+        vals = self._prepare_file_values(file_content.encode())
+        self.write(vals)
+        return vals["xml_filename"]
+
+    def _prepare_file_values(self, file_content):
+        """
+        @param file_content: el contenido del archivo, en bytes
+        @return: dict con los valores a escribir del archivo y su nombre
+        """
+        return {
+            "xml_file": base64.encodebytes(file_content),
+            "xml_filename": self.generate_file_name(),
+            # la huella solo se asigna al guardar el xml firmado
+            "xml_fingerprint": False,
+        }
+
+    def _l10n_ec_get_file_without_declaration(self):
+        """
+        Devuelve el xml guardado en str, sin la declaracion xml
+        para poder anexarlo dentro de otro xml(archivo autorizado)
+        """
+        file_data = self.get_file().strip()
+        if file_data.startswith("<?xml"):
+            file_data = file_data[file_data.find("?>") + 2 :].lstrip()
+        return file_data
 
     def action_cancel(self):
         for xml_data in self:
@@ -1473,6 +2233,12 @@ class SriXmlData(models.Model):
         )
         return True
 
+    def write(self, vals):
+        # al autorizar o regresar a borrador el documento, los reintentos de autorizacion empiezan de nuevo
+        if vals.get("state") in ("authorized", "draft"):
+            vals = dict(vals, next_attempt_date=False, attempt_count=0, backoff_class=False)
+        return super(SriXmlData, self).write(vals)
+
     def unlink(self):
         for xml_data in self:
             # si el documento no esta en borrador no permitir eliminar
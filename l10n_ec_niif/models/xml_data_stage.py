@@ -0,0 +1,185 @@
+import logging
+from datetime import timedelta
+
+from psycopg2.extras import execute_values
+
+from odoo import api, fields, models, tools
+
+_logger = logging.getLogger(__name__)
+
+# etapas del proceso electronico que se miden por cada documento
+XML_STAGES = [
+    ("fetch", "Lectura del documento"),
+    ("build", "Creación del XML"),
+    ("xsd", "Validación XSD"),
+    ("sign", "Firma"),
+    ("reception", "Recepción SRI"),
+    ("authorization", "Autorización SRI"),
+    ("mail", "Envío de correo"),
+    ("attachment", "Adjunto autorizado"),
+]
+
+
+class SriXmlDataStage(models.Model):
+    _name = "sri.xml.data.stage"
+    _description = "Tiempos del proceso electrónico"
+    _order = "id desc"
+
+    xml_id = fields.Many2one("sri.xml.data", "XML Data", index=True, ondelete="cascade", readonly=True)
+    company_id = fields.Many2one("res.company", "Company", readonly=True)
+    point_of_emission_id = fields.Many2one("l10n_ec.point.of.emission", "Punto de Emisión", readonly=True)
+    stage = fields.Selection(XML_STAGES, "Etapa", required=True, readonly=True)
+    duration = fields.Float("Duración(ms)", digits=(16, 3), readonly=True, group_operator="avg")
+    payload_size = fields.Integer("Tamaño(bytes)", readonly=True, group_operator="avg")
+    query_count = fields.Integer("Consultas SQL", readonly=True, group_operator="avg")
+    outcome = fields.Selection(
+        [
+            ("ok", "Correcto"),
+            ("error", "Error"),
+        ],
+        string="Resultado",
+        readonly=True,
+        default="ok",
+    )
+    create_date = fields.Datetime("Fecha", readonly=True)
+
+    def init(self):
+        # indice para las estadisticas por compañia de las ultimas horas
+        tools.create_index(
+            self._cr,
+            "sri_xml_data_stage_company_date_index",
+            self._table,
+            ["company_id", "create_date"],
+        )
+
+    @api.model
+    def _is_enabled(self):
+        enabled = self.env["ir.config_parameter"].sudo().get_param("l10n_ec.xml_stage_stats", "1")
+        return enabled not in ("0", "False", "false")
+
+    @api.model
+    def _store_stages(self, stage_values, new_cursor=False):
+        """
+        Guardar las mediciones con una sola consulta
+        :param stage_values: lista de tuplas
+            (xml_id, company_id, point_of_emission_id, stage, duration, query_count, payload_size, outcome)
+        :param new_cursor: guardar en otra transaccion, asi las mediciones de etapas con error no se pierden
+            cuando se revierte la transaccion del documento,
+            las referencias que aun no existen para la otra transaccion se guardan vacias
+        """
+        query = """
+            INSERT INTO sri_xml_data_stage
+                (xml_id, company_id, point_of_emission_id, stage, duration, query_count, payload_size, outcome,
+                create_uid, create_date, write_uid, write_date)
+            SELECT
+                (SELECT id FROM sri_xml_data WHERE id = v.xml_id),
+                (SELECT id FROM res_company WHERE id = v.company_id),
+                (SELECT id FROM l10n_ec_point_of_emission WHERE id = v.point_of_emission_id),
+                v.stage, v.duration, v.query_count, v.payload_size, v.outcome,
+                {uid}, now() at time zone 'UTC', {uid}, now() at time zone 'UTC'
+            FROM (VALUES %s) AS v(xml_id, company_id, point_of_emission_id, stage, duration, query_count,
+                payload_size, outcome)
+        """.format(uid=int(self.env.uid))
+        template = "(%s::integer, %s::integer, %s::integer, %s, %s::numeric, %s::integer, %s::integer, %s)"
+        if not new_cursor:
+            execute_values(self.env.cr, query, stage_values, template=template)
+            return True
+        try:
+            with self.pool.cursor() as cr:
+                execute_values(cr, query, stage_values, template=template)
+        except Exception as e:
+            _logger.warning("Can't record stages of electronic documents. ERROR: %s", tools.ustr(e))
+            return False
+        return True
+
+    @api.model
+    def get_stage_statistics(self, hours=24, company_ids=None):
+        """
+        Estadisticas de cada etapa del proceso electronico en las ultimas horas,
+        por compañia, punto de emision y etapa
+        :param hours: cantidad de horas a considerar
+        :param company_ids: ids de compañias, por defecto las compañias activas del usuario
+        :return: list(dict) con cantidad, errores, documentos por hora,
+            promedio y percentiles(50, 90, 99) de duracion en ms, tamaño y consultas promedio
+        """
+        self.check_access_rights("read")
+        allowed_company_ids = self.env.companies.ids
+        if company_ids:
+            user_company_ids = self.env.user.company_ids.ids
+            allowed_company_ids = [company_id for company_id in company_ids if company_id in user_company_ids]
+        if not allowed_company_ids:
+            return []
+        hours = float(hours or 24)
+        self.flush()
+        self.env.cr.execute(
+            """
+            SELECT company_id, point_of_emission_id, stage,
+                COUNT(*),
+                COUNT(*) FILTER (WHERE outcome = 'error'),
+                AVG(duration),
+                PERCENTILE_CONT(0.5) WITHIN GROUP (ORDER BY duration),
+                PERCENTILE_CONT(0.9) WITHIN GROUP (ORDER BY duration),
+                PERCENTILE_CONT(0.99) WITHIN GROUP (ORDER BY duration),
+                MAX(duration),
+                AVG(payload_size),
+                AVG(query_count)
+            FROM sri_xml_data_stage
+            WHERE company_id IN %s AND create_date >= %s
+            GROUP BY company_id, point_of_emission_id, stage
+            ORDER BY company_id, point_of_emission_id, stage
+            """,
+            (tuple(allowed_company_ids), fields.Datetime.now() - timedelta(hours=hours)),
+        )
+        rows = self.env.cr.fetchall()
+        companies = self.env["res.company"].browse({row[0] for row in rows})
+        points = self.env["l10n_ec.point.of.emission"].browse({row[1] for row in rows if row[1]})
+        company_names = {company.id: company.name for company in companies.sudo()}
+        point_names = {point.id: point.display_name for point in points.sudo()}
+        statistics = []
+        for row in rows:
+            (
+                company_id,
+                point_id,
+                stage,
+                count,
+                errors,
+                avg_duration,
+                p50,
+                p90,
+                p99,
+                max_duration,
+                avg_payload,
+                avg_queries,
+            ) = row
+            statistics.append(
+                {
+                    "company_id": company_id,
+                    "company": company_names.get(company_id),
+                    "point_of_emission_id": point_id,
+                    "point_of_emission": point_names.get(point_id),
+                    "stage": stage,
+                    "count": count,
+                    "errors": errors,
+                    "documents_per_hour": round(count / hours, 2),
+                    "avg_ms": round(float(avg_duration or 0.0), 3),
+                    "p50_ms": round(p50 or 0.0, 3),
+                    "p90_ms": round(p90 or 0.0, 3),
+                    "p99_ms": round(p99 or 0.0, 3),
+                    "max_ms": round(max_duration or 0.0, 3),
+                    "avg_payload_size": round(float(avg_payload or 0.0), 2),
+                    "avg_query_count": round(float(avg_queries or 0.0), 2),
+                }
+            )
+        return statistics
+
+    @api.model
+    def _gc_stage_records(self):
+        """
+        Eliminar los tiempos registrados hace mas de N dias(parametro l10n_ec.xml_stage_stats_days, 30 por defecto)
+        """
+        days = int(self.env["ir.config_parameter"].sudo().get_param("l10n_ec.xml_stage_stats_days", 30))
+        self.env.cr.execute(
+            "DELETE FROM sri_xml_data_stage WHERE create_date < %s",
+            (fields.Datetime.now() - timedelta(days=days),),
+        )
+        return True
@@ -1 +1 @@
-from . import test_l10n_ec_niif
+from . import test_l10n_ec_benchmark, test_l10n_ec_niif
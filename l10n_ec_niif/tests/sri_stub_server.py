@@ -0,0 +1,378 @@
+"""
+Servidor SOAP local que simula los webservices offline del SRI(recepcion y autorizacion de comprobantes)
+se usa en las pruebas de rendimiento para no depender de la disponibilidad del SRI
+"""
+import base64
+import threading
+import time
+import zlib
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+
+from lxml import etree
+
+NS_SOAP = "http://schemas.xmlsoap.org/soap/envelope/"
+NS_RECEPTION = "http://ec.gob.sri.ws.recepcion"
+NS_AUTHORIZATION = "http://ec.gob.sri.ws.autorizacion"
+
+WSDL_TEMPLATE = """<?xml version="1.0" encoding="UTF-8"?>
+<definitions xmlns="http://schemas.xmlsoap.org/wsdl/" xmlns:soap="http://schemas.xmlsoap.org/wsdl/soap/"
+    xmlns:xs="http://www.w3.org/2001/XMLSchema" xmlns:tns="{namespace}"
+    targetNamespace="{namespace}" name="{service}">
+  <types>
+    <xs:schema targetNamespace="{namespace}" elementFormDefault="unqualified">
+      <xs:complexType name="mensaje">
+        <xs:sequence>
+          <xs:element name="identificador" type="xs:string" minOccurs="0"/>
+          <xs:element name="mensaje" type="xs:string" minOccurs="0"/>
+          <xs:element name="informacionAdicional" type="xs:string" minOccurs="0"/>
+          <xs:element name="tipo" type="xs:string" minOccurs="0"/>
+        </xs:sequence>
+      </xs:complexType>
+      <xs:complexType name="mensajes">
+        <xs:sequence>
+          <xs:element name="mensaje" type="tns:mensaje" minOccurs="0" maxOccurs="unbounded"/>
+        </xs:sequence>
+      </xs:complexType>
+      {types}
+    </xs:schema>
+  </types>
+  {messages}
+  <portType name="{service}">{operations}</portType>
+  <binding name="{service}PortBinding" type="tns:{service}">
+    <soap:binding transport="http://schemas.xmlsoap.org/soap/http" style="document"/>
+    {binding_operations}
+  </binding>
+  <service name="{service}Service">
+    <port name="{service}Port" binding="tns:{service}PortBinding">
+      <soap:address location="{location}"/>
+    </port>
+  </service>
+</definitions>
+"""
+
+RECEPTION_TYPES = """
+      <xs:element name="validarComprobante">
+        <xs:complexType><xs:sequence><xs:element name="xml" type="xs:base64Binary" minOccurs="0"/></xs:sequence>
+        </xs:complexType>
+      </xs:element>
+      <xs:element name="validarComprobanteResponse">
+        <xs:complexType><xs:sequence>
+          <xs:element name="RespuestaRecepcionComprobante" type="tns:respuestaSolicitud" minOccurs="0"/>
+        </xs:sequence></xs:complexType>
+      </xs:element>
+      <xs:complexType name="comprobante">
+        <xs:sequence>
+          <xs:element name="claveAcceso" type="xs:string" minOccurs="0"/>
+          <xs:element name="mensajes" type="tns:mensajes" minOccurs="0"/>
+        </xs:sequence>
+      </xs:complexType>
+      <xs:complexType name="respuestaSolicitud">
+        <xs:sequence>
+          <xs:element name="estado" type="xs:string" minOccurs="0"/>
+          <xs:element name="comprobantes" minOccurs="0">
+            <xs:complexType><xs:sequence>
+              <xs:element name="comprobante" type="tns:comprobante" minOccurs="0" maxOccurs="unbounded"/>
+            </xs:sequence></xs:complexType>
+          </xs:element>
+        </xs:sequence>
+      </xs:complexType>
+"""
+
+AUTHORIZATION_TYPES = """
+      <xs:element name="autorizacionComprobante">
+        <xs:complexType><xs:sequence>
+          <xs:element name="claveAccesoComprobante" type="xs:string" minOccurs="0"/>
+        </xs:sequence></xs:complexType>
+      </xs:element>
+      <xs:element name="autorizacionComprobanteResponse">
+        <xs:complexType><xs:sequence>
+          <xs:element name="RespuestaAutorizacionComprobante" type="tns:respuestaComprobante" minOccurs="0"/>
+        </xs:sequence></xs:complexType>
+      </xs:element>
+      <xs:element name="autorizacionComprobanteLote">
+        <xs:complexType><xs:sequence>
+          <xs:element name="claveAccesoLote" type="xs:string" minOccurs="0"/>
+        </xs:sequence></xs:complexType>
+      </xs:element>
+      <xs:element name="autorizacionComprobanteLoteResponse">
+        <xs:complexType><xs:sequence>
+          <xs:element name="RespuestaAutorizacionLote" type="tns:respuestaLote" minOccurs="0"/>
+        </xs:sequence></xs:complexType>
+      </xs:element>
+      <xs:complexType name="autorizacion">
+        <xs:sequence>
+          <xs:element name="estado" type="xs:string" minOccurs="0"/>
+          <xs:element name="numeroAutorizacion" type="xs:string" minOccurs="0"/>
+          <xs:element name="fechaAutorizacion" type="xs:dateTime" minOccurs="0"/>
+          <xs:element name="ambiente" type="xs:string" minOccurs="0"/>
+          <xs:element name="comprobante" type="xs:string" minOccurs="0"/>
+          <xs:element name="mensajes" type="tns:mensajes" minOccurs="0"/>
+        </xs:sequence>
+      </xs:complexType>
+      <xs:complexType name="autorizaciones">
+        <xs:sequence>
+          <xs:element name="autorizacion" type="tns:autorizacion" minOccurs="0" maxOccurs="unbounded"/>
+        </xs:sequence>
+      </xs:complexType>
+      <xs:complexType name="respuestaComprobante">
+        <xs:sequence>
+          <xs:element name="claveAccesoConsultada" type="xs:string" minOccurs="0"/>
+          <xs:element name="numeroComprobantes" type="xs:string" minOccurs="0"/>
+          <xs:element name="autorizaciones" type="tns:autorizaciones" minOccurs="0"/>
+        </xs:sequence>
+      </xs:complexType>
+      <xs:complexType name="respuestaLote">
+        <xs:sequence>
+          <xs:element name="claveAccesoLoteConsultada" type="xs:string" minOccurs="0"/>
+          <xs:element name="numeroComprobantesLote" type="xs:string" minOccurs="0"/>
+          <xs:element name="autorizaciones" type="tns:autorizaciones" minOccurs="0"/>
+        </xs:sequence>
+      </xs:complexType>
+"""
+
+
+def _build_wsdl(namespace, service, operation_names, types, location):
+    messages, operations, binding_operations = [], [], []
+    for operation in operation_names:
+        messages.append(
+            f'<message name="{operation}"><part name="parameters" element="tns:{operation}"/></message>'
+            f'<message name="{operation}Response">'
+            f'<part name="parameters" element="tns:{operation}Response"/></message>'
+        )
+        operations.append(
+            f'<operation name="{operation}"><input message="tns:{operation}"/>'
+            f'<output message="tns:{operation}Response"/></operation>'
+        )
+        binding_operations.append(
+            f'<operation name="{operation}"><soap:operation soapAction=""/>'
+            f'<input><soap:body use="literal"/></input><output><soap:body use="literal"/></output></operation>'
+        )
+    return WSDL_TEMPLATE.format(
+        namespace=namespace,
+        service=service,
+        types=types,
+        messages="".join(messages),
+        operations="".join(operations),
+        binding_operations="".join(binding_operations),
+        location=location,
+    ).encode()
+
+
+class SriStubServer(ThreadingMixIn, HTTPServer):
+    """
+    Simula el SRI con los siguientes comportamientos, decididos segun la clave de acceso
+    para que los resultados sean repetibles entre ejecuciones:
+    * processing_ratio: porcentaje de comprobantes que en la primera consulta
+        devuelven clave 70(CLAVE DE ACCESO EN PROCESAMIENTO)
+    * error_ratio: porcentaje de comprobantes devueltos en la recepcion(clave 35)
+    * fault_ratio: porcentaje de llamadas que fallan con error interno del servidor(HTTP 500)
+    * latency: segundos de espera en cada llamada
+    """
+
+    daemon_threads = True
+
+    def __init__(self, latency=0.0, processing_ratio=0.0, error_ratio=0.0, fault_ratio=0.0):
+        super().__init__(("127.0.0.1", 0), SriStubRequestHandler)
+        self.latency = latency
+        self.processing_ratio = processing_ratio
+        self.error_ratio = error_ratio
+        self.fault_ratio = fault_ratio
+        self.lock = threading.Lock()
+        self.received = {}
+        self.batches = {}
+        self.authorization_calls = {}
+        self.calls = {}
+        self.thread = None
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    @property
+    def reception_url(self):
+        return f"{self.url}/RecepcionComprobantesOffline?wsdl"
+
+    @property
+    def authorization_url(self):
+        return f"{self.url}/AutorizacionComprobantesOffline?wsdl"
+
+    def start(self):
+        self.thread = threading.Thread(target=self.serve_forever, name="sri_stub_server", daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    @staticmethod
+    def _ratio_match(key, ratio, salt):
+        if not ratio:
+            return False
+        return zlib.crc32(f"{salt}{key}".encode()) % 10000 < ratio * 10000
+
+    def is_fault(self, key):
+        # el error de servidor solo se da en la primera llamada de cada clave
+        return self._ratio_match(key, self.fault_ratio, "fault") and self.calls.get(key, 0) == 1
+
+    def is_error(self, key):
+        return self._ratio_match(key, self.error_ratio, "error")
+
+    def is_processing(self, key):
+        return self._ratio_match(key, self.processing_ratio, "processing")
+
+    def register_call(self, key):
+        with self.lock:
+            self.calls[key] = self.calls.get(key, 0) + 1
+
+
+class SriStubRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        # no llenar el log de las pruebas con cada peticion
+        pass
+
+    def _send(self, status, body, content_type="text/xml; charset=utf-8"):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path.startswith("/RecepcionComprobantesOffline"):
+            wsdl = _build_wsdl(
+                NS_RECEPTION,
+                "RecepcionComprobantesOffline",
+                ["validarComprobante"],
+                RECEPTION_TYPES,
+                f"{self.server.url}/RecepcionComprobantesOffline",
+            )
+        elif self.path.startswith("/AutorizacionComprobantesOffline"):
+            wsdl = _build_wsdl(
+                NS_AUTHORIZATION,
+                "AutorizacionComprobantesOffline",
+                ["autorizacionComprobante", "autorizacionComprobanteLote"],
+                AUTHORIZATION_TYPES,
+                f"{self.server.url}/AutorizacionComprobantesOffline",
+            )
+        else:
+            return self._send(404, b"")
+        return self._send(200, wsdl)
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        request = etree.fromstring(body).find(f"{{{NS_SOAP}}}Body")[0]
+        operation = etree.QName(request).localname
+        values = {etree.QName(child).localname: child.text or "" for child in request}
+        if operation == "validarComprobante":
+            key, response = self._validate(base64.b64decode(values.get("xml", "")))
+            namespace = NS_RECEPTION
+        elif operation == "autorizacionComprobante":
+            key = values.get("claveAccesoComprobante", "")
+            response = self._authorize(key)
+            namespace = NS_AUTHORIZATION
+        elif operation == "autorizacionComprobanteLote":
+            key = values.get("claveAccesoLote", "")
+            response = self._authorize_batch(key)
+            namespace = NS_AUTHORIZATION
+        else:
+            return self._send(500, self._fault(f"Unknown operation {operation}"))
+        self.server.register_call(key)
+        if self.server.is_fault(key):
+            return self._send(500, self._fault("Error Interno General del servidor"))
+        envelope = etree.Element(etree.QName(NS_SOAP, "Envelope"), nsmap={"soap": NS_SOAP, "ns2": namespace})
+        etree.SubElement(envelope, etree.QName(NS_SOAP, "Body")).append(response)
+        return self._send(200, etree.tostring(envelope, encoding="UTF-8", xml_declaration=True))
+
+    def _fault(self, message):
+        envelope = etree.Element(etree.QName(NS_SOAP, "Envelope"), nsmap={"soap": NS_SOAP})
+        fault = etree.SubElement(
+            etree.SubElement(envelope, etree.QName(NS_SOAP, "Body")), etree.QName(NS_SOAP, "Fault")
+        )
+        etree.SubElement(fault, "faultcode").text = "soap:Server"
+        etree.SubElement(fault, "faultstring").text = message
+        return etree.tostring(envelope, encoding="UTF-8", xml_declaration=True)
+
+    @staticmethod
+    def _add_message(parent, identifier, message, message_type):
+        mensaje = etree.SubElement(parent, "mensaje")
+        etree.SubElement(mensaje, "identificador").text = identifier
+        etree.SubElement(mensaje, "mensaje").text = message
+        etree.SubElement(mensaje, "tipo").text = message_type
+
+    def _validate(self, xml_data):
+        document = etree.fromstring(xml_data)
+        documents = [document]
+        key = document.findtext("infoTributaria/claveAcceso") or ""
+        if document.tag == "lote-masivo":
+            key = document.findtext("claveAcceso") or ""
+            documents = [etree.fromstring(node.text.encode()) for node in document.iterfind("comprobantes/comprobante")]
+        response = etree.Element(etree.QName(NS_RECEPTION, "validarComprobanteResponse"))
+        result = etree.SubElement(response, "RespuestaRecepcionComprobante")
+        estado = etree.SubElement(result, "estado")
+        comprobantes = etree.SubElement(result, "comprobantes")
+        returned = False
+        document_keys = []
+        for doc in documents:
+            document_key = doc.findtext("infoTributaria/claveAcceso") or ""
+            if self.server.is_error(document_key):
+                returned = True
+                comprobante = etree.SubElement(comprobantes, "comprobante")
+                etree.SubElement(comprobante, "claveAcceso").text = document_key
+                self._add_message(
+                    etree.SubElement(comprobante, "mensajes"), "35", "ARCHIVO NO CUMPLE ESTRUCTURA XML", "ERROR"
+                )
+                continue
+            document_keys.append(document_key)
+            with self.server.lock:
+                self.server.received[document_key] = doc
+        if document.tag == "lote-masivo":
+            with self.server.lock:
+                self.server.batches[key] = document_keys
+        estado.text = "DEVUELTA" if returned and document.tag != "lote-masivo" else "RECIBIDA"
+        return key, response
+
+    def _add_authorization(self, autorizaciones, key):
+        with self.server.lock:
+            document = self.server.received.get(key)
+            calls = self.server.authorization_calls[key] = self.server.authorization_calls.get(key, 0) + 1
+        if document is None:
+            return False
+        autorizacion = etree.SubElement(autorizaciones, "autorizacion")
+        estado = etree.SubElement(autorizacion, "estado")
+        etree.SubElement(autorizacion, "numeroAutorizacion").text = key
+        etree.SubElement(autorizacion, "fechaAutorizacion").text = datetime.now().astimezone().isoformat()
+        etree.SubElement(autorizacion, "ambiente").text = "PRUEBAS"
+        etree.SubElement(autorizacion, "comprobante").text = etree.tostring(document, encoding="unicode")
+        mensajes = etree.SubElement(autorizacion, "mensajes")
+        if self.server.is_processing(key) and calls == 1:
+            estado.text = "NO AUTORIZADO"
+            self._add_message(mensajes, "70", "CLAVE DE ACCESO EN PROCESAMIENTO", "ADVERTENCIA")
+        else:
+            estado.text = "AUTORIZADO"
+        return True
+
+    def _authorize(self, key):
+        response = etree.Element(etree.QName(NS_AUTHORIZATION, "autorizacionComprobanteResponse"))
+        result = etree.SubElement(response, "RespuestaAutorizacionComprobante")
+        etree.SubElement(result, "claveAccesoConsultada").text = key
+        number = etree.SubElement(result, "numeroComprobantes")
+        autorizaciones = etree.SubElement(result, "autorizaciones")
+        number.text = str(int(self._add_authorization(autorizaciones, key)))
+        return response
+
+    def _authorize_batch(self, batch_key):
+        response = etree.Element(etree.QName(NS_AUTHORIZATION, "autorizacionComprobanteLoteResponse"))
+        result = etree.SubElement(response, "RespuestaAutorizacionLote")
+        etree.SubElement(result, "claveAccesoLoteConsultada").text = batch_key
+        number = etree.SubElement(result, "numeroComprobantesLote")
+        autorizaciones = etree.SubElement(result, "autorizaciones")
+        keys = self.server.batches.get(batch_key, [])
+        number.text = str(sum(self._add_authorization(autorizaciones, key) for key in keys))
+        return response
@@ -0,0 +1,282 @@
+import base64
+import logging
+import os
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from unittest.mock import patch
+
+from OpenSSL import crypto
+
+from odoo import fields, tools
+from odoo.tests import Form, tagged
+
+from odoo.addons.account.tests.account_test_savepoint import AccountTestInvoicingCommon
+
+from ..models import sri_ws_client
+from .sri_stub_server import SriStubServer
+
+_logger = logging.getLogger(__name__)
+
+# cantidad de documentos por cada tipo, configurable con variables de entorno
+BENCHMARK_DOCUMENTS = int(os.environ.get("L10N_EC_BENCHMARK_DOCUMENTS", 20))
+# comportamiento del SRI simulado
+BENCHMARK_LATENCY = float(os.environ.get("L10N_EC_BENCHMARK_LATENCY", 0.05))
+BENCHMARK_PROCESSING_RATIO = float(os.environ.get("L10N_EC_BENCHMARK_PROCESSING_RATIO", 0.2))
+BENCHMARK_ERROR_RATIO = float(os.environ.get("L10N_EC_BENCHMARK_ERROR_RATIO", 0.05))
+BENCHMARK_FAULT_RATIO = float(os.environ.get("L10N_EC_BENCHMARK_FAULT_RATIO", 0.05))
+KEY_PASSWORD = "benchmark"
+
+
+def _create_certificate_p12(password):
+    """
+    Crear un archivo de firma(p12) autofirmado con keyUsage digital_signature
+    """
+    key = crypto.PKey()
+    key.generate_key(crypto.TYPE_RSA, 2048)
+    cert = crypto.X509()
+    cert.get_subject().CN = "BENCHMARK L10N EC"
+    cert.get_subject().serialNumber = "1792060346001"
+    cert.set_serial_number(1)
+    cert.gmtime_adj_notBefore(0)
+    cert.gmtime_adj_notAfter(365 * 24 * 60 * 60)
+    cert.set_issuer(cert.get_subject())
+    cert.set_pubkey(key)
+    cert.add_extensions([crypto.X509Extension(b"keyUsage", True, b"digitalSignature, nonRepudiation")])
+    cert.sign(key, "sha256")
+    p12 = crypto.PKCS12()
+    p12.set_privatekey(key)
+    p12.set_certificate(cert)
+    return p12.export(password.encode())
+
+
+@tagged("post_install", "-at_install", "-standard", "l10n_ec_benchmark")
+class EcuadorianElectronicBenchmark(AccountTestInvoicingCommon):
+    """
+    Pruebas de rendimiento del proceso electronico completo contra un SRI simulado
+    no se ejecutan con las pruebas normales, usar: --test-tags l10n_ec_benchmark
+    reporta en el log los tiempos, documentos por segundo y cantidad de consultas de cada etapa
+    """
+
+    @classmethod
+    def setUpClass(cls, chart_template_ref="l10n_ec_niif.ec_chart_template"):
+        super().setUpClass(chart_template_ref=chart_template_ref)
+        ec_chart_template = cls.env.ref("l10n_ec_niif.ec_chart_template")
+        cls.env.company.write({"chart_template_id": ec_chart_template.id})
+        cls.company_data = cls.setup_company_data(
+            "company_EC_data", ec_chart_template, country_id=cls.env.ref("base.ec").id
+        )
+        cls.company = cls.company_data["company"]
+        cls.env.user.write({"company_id": cls.company.id})
+        cls.sri_server = SriStubServer(
+            latency=BENCHMARK_LATENCY,
+            processing_ratio=BENCHMARK_PROCESSING_RATIO,
+            error_ratio=BENCHMARK_ERROR_RATIO,
+            fault_ratio=BENCHMARK_FAULT_RATIO,
+        ).start()
+        ICPSudo = cls.env["ir.config_parameter"].sudo()
+        ICPSudo.set_param("l10n_ec_ws_receipt_test", cls.sri_server.reception_url)
+        ICPSudo.set_param("l10n_ec_ws_auth_test", cls.sri_server.authorization_url)
+        it_ruc = cls.env.ref("l10n_ec_niif.it_ruc")
+        it_cedula = cls.env.ref("l10n_ec_niif.it_cedula")
+        country_ec = cls.env.ref("base.ec")
+        cls.company.partner_id.write(
+            {
+                "vat": "1792060346001",
+                "l10n_latam_identification_type_id": it_ruc.id,
+                "street": "Av. Amazonas",
+                "country_id": country_ec.id,
+            }
+        )
+        key_type = cls.env["sri.key.type"].create(
+            {
+                "name": "Benchmark",
+                "file_content": base64.b64encode(_create_certificate_p12(KEY_PASSWORD)),
+                "file_name": "benchmark.p12",
+                "password": KEY_PASSWORD,
+                "company_id": cls.company.id,
+            }
+        )
+        key_type.action_validate_and_load()
+        cls.company.write(
+            {
+                "l10n_ec_type_environment": "test",
+                "l10n_ec_type_conection_sri": "offline",
+                "l10n_ec_key_type_id": key_type.id,
+                "l10n_ec_electronic_invoice": True,
+                "l10n_ec_electronic_withhold": True,
+                "l10n_ec_electronic_credit_note": True,
+                "l10n_ec_electronic_debit_note": True,
+                "l10n_ec_electronic_liquidation": True,
+                "l10n_ec_cron_process": BENCHMARK_DOCUMENTS * 5,
+            }
+        )
+        agency = cls.env["l10n_ec.agency"].create(
+            {
+                "name": "Benchmark",
+                "number": "001",
+                "company_id": cls.company.id,
+            }
+        )
+        cls.printer = cls.env["l10n_ec.point.of.emission"].create(
+            {
+                "name": "Benchmark",
+                "number": "001",
+                "agency_id": agency.id,
+                "type_emission": "electronic",
+            }
+        )
+        cls.customer = cls.env["res.partner"].create(
+            {
+                "name": "Cliente Benchmark",
+                "vat": "0992397535001",
+                "l10n_latam_identification_type_id": it_ruc.id,
+                "street": "Av. 9 de Octubre",
+                "country_id": country_ec.id,
+            }
+        )
+        cls.supplier = cls.env["res.partner"].create(
+            {
+                "name": "Proveedor Benchmark",
+                "vat": "1713175071",
+                "l10n_latam_identification_type_id": it_cedula.id,
+                "street": "Av. Quito",
+                "country_id": country_ec.id,
+            }
+        )
+        # diarios por tipo de documento, el tipo de documento se calcula segun el diario y el cliente
+        cls.journals = {}
+        for journal_type, internal_type, code in (
+            ("sale", "invoice", "BFAC"),
+            ("sale", "debit_note", "BND"),
+            ("purchase", "invoice", "BFPR"),
+            ("purchase", "liquidation", "BLIQ"),
+        ):
+            cls.journals[internal_type if journal_type == "sale" else f"in_{internal_type}"] = cls.env[
+                "account.journal"
+            ].create(
+                {
+                    "name": f"Benchmark {code}",
+                    "code": code,
+                    "type": journal_type,
+                    "l10n_latam_internal_type": internal_type,
+                    "l10n_latam_use_documents": True,
+                    "company_id": cls.company.id,
+                }
+            )
+        cls.journals["credit_note"] = cls.journals["invoice"]
+        cls.sri_payment = cls.env.ref("l10n_ec_niif.cp_01")
+        cls.product = cls.company_data["product"]
+        cls.tax_withhold = cls.env["account.tax"].search(
+            [
+                ("company_id", "=", cls.company.id),
+                ("tax_group_id", "=", cls.env.ref("l10n_ec_niif.tax_group_renta_withhold").id),
+                ("type_tax_use", "=", "purchase"),
+            ],
+            limit=1,
+        )
+        cls.stats = []
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.sri_server.stop()
+        sri_ws_client.clear_clients()
+        cls._report_stats()
+        super().tearDownClass()
+
+    @classmethod
+    def _report_stats(cls):
+        lines = ["", "%-45s %8s %10s %10s %10s" % ("Etapa", "Docs", "Segundos", "Docs/seg", "Consultas")]
+        for stage, documents, elapsed, queries in cls.stats:
+            lines.append(
+                "%-45s %8d %10.3f %10.2f %10d"
+                % (stage, documents, elapsed, documents / elapsed if elapsed else 0.0, queries)
+            )
+        _logger.info("Benchmark de documentos electronicos:%s", "\n".join(lines))
+
+    @contextmanager
+    def _measure(self, stage, documents):
+        """
+        Medir tiempo y cantidad de consultas a la base de datos de una etapa del proceso
+        """
+        self.env["base"].flush()
+        queries_before = self.env.cr.sql_log_count
+        start = time.perf_counter()
+        yield
+        self.env["base"].flush()
+        elapsed = time.perf_counter() - start
+        self.stats.append((stage, documents, elapsed, self.env.cr.sql_log_count - queries_before))
+
+    def _prepare_move_form(self, move_type, internal_type, partner, invoice=None):
+        journal = self.journals[f"in_{internal_type}" if move_type == "in_invoice" else internal_type]
+        move_form = Form(
+            self.env["account.move"].with_context(
+                default_type=move_type,
+                default_journal_id=journal.id,
+                internal_type=internal_type,
+            ),
+        )
+        move_form.partner_id = partner
+        move_form.invoice_date = fields.Date.context_today(self.env.user)
+        if move_type != "in_invoice" or internal_type == "liquidation":
+            move_form.l10n_ec_point_of_emission_id = self.printer
+        if move_type != "in_invoice":
+            move_form.l10n_ec_sri_payment_id = self.sri_payment
+        if invoice:
+            move_form.l10n_ec_original_invoice_id = invoice
+        with move_form.invoice_line_ids.new() as line_form:
+            line_form.product_id = self.product
+            line_form.quantity = 2
+            line_form.price_unit = 25.0
+        return move_form
+
+    def _create_documents(self, invoices=None):
+        moves = self.env["account.move"]
+        invoices = invoices or moves
+        for index in range(BENCHMARK_DOCUMENTS):
+            moves |= self._prepare_move_form("out_invoice", "invoice", self.customer).save()
+            moves |= self._prepare_move_form("out_invoice", "debit_note", self.customer).save()
+            moves |= self._prepare_move_form("in_invoice", "liquidation", self.supplier).save()
+            if index < len(invoices):
+                moves |= self._prepare_move_form("out_refund", "credit_note", self.customer, invoices[index]).save()
+            # factura de proveedor con retencion electronica
+            move_form = self._prepare_move_form("in_invoice", "invoice", self.supplier)
+            move_form.l10n_ec_type_emission = "auto_printer"
+            move_form.l10n_latam_document_number = "001-001-%09d" % (index + 1)
+            move_form.l10n_ec_electronic_authorization = "%010d" % (index + 1)
+            move_form.l10n_ec_point_of_emission_withhold_id = self.printer
+            with move_form.invoice_line_ids.edit(0) as line_form:
+                line_form.tax_ids.add(self.tax_withhold)
+            moves |= move_form.save()
+        return moves
+
+    def _get_xml_data(self, moves):
+        return moves.mapped("l10n_ec_xml_data_id") | moves.mapped("l10n_ec_withhold_ids.l10n_ec_xml_data_id")
+
+    def test_benchmark_electronic_documents(self):
+        # las notas de credito electronicas requieren que la factura original tenga documento electronico
+        invoices = self.env["account.move"]
+        for _index in range(BENCHMARK_DOCUMENTS):
+            invoices |= self._prepare_move_form("out_invoice", "invoice", self.customer).save()
+        invoices.post()
+        moves = self._create_documents(invoices)
+        with self._measure("Validar documentos(crear xml_data)", len(moves)):
+            moves.post()
+        xml_recs = self._get_xml_data(invoices | moves)
+        self.assertTrue(xml_recs, "No se crearon documentos electronicos")
+        with patch.dict(tools.config.options, {"send_sri_documents": True}):
+            with self._measure("Tarea cron: firmar, enviar y autorizar", len(xml_recs)):
+                self.env["sri.xml.data"].send_documents_offline()
+            # no esperar el tiempo entre reintentos, consultar de inmediato los pendientes
+            pending = xml_recs.filtered(lambda x: x.state != "authorized" and x.next_attempt_date)
+            pending.write({"next_attempt_date": datetime.now() - timedelta(minutes=1)})
+            with self._measure("Tarea cron: documentos en espera(clave 70)", len(pending)):
+                self.env["sri.xml.data"].send_documents_waiting_autorization()
+        authorized = xml_recs.filtered(lambda x: x.state == "authorized")
+        _logger.info(
+            "Documentos electronicos: %s, autorizados: %s, pendientes o rechazados: %s",
+            len(xml_recs),
+            len(authorized),
+            len(xml_recs - authorized),
+        )
+        self.assertTrue(authorized, "Ningun documento fue autorizado por el SRI simulado")
@@ -1,8 +1,94 @@
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from unittest.mock import patch
+
+from cryptography import x509
+from cryptography.hazmat.backends import default_backend
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from cryptography.hazmat.primitives.serialization import pkcs12
+from cryptography.x509.oid import NameOID
+from lxml import etree
+from psycopg2 import IntegrityError
+
+from odoo import fields, tools
 from odoo.exceptions import UserError, ValidationError
-from odoo.tests import tagged
+from odoo.tests import Form, tagged
+from odoo.tests.common import BaseCase
+from odoo.tools import mute_logger
 
 from odoo.addons.account.tests.account_test_savepoint import AccountTestInvoicingCommon
 
+from ..models import sri_key_type, sri_pkcs12, sri_xml_plan, sri_xsd_schema
+
+P12_PASSWORD = "l10n_ec"
+
+
+def _der(tag, content):
+    length = len(content)
+    if length < 0x80:
+        return bytes([tag, length]) + content
+    size = (length.bit_length() + 7) // 8
+    return bytes([tag, 0x80 | size]) + length.to_bytes(size, "big") + content
+
+
+def _ber(tag, content):
+    # longitud indefinida, terminada en fin de contenido
+    return bytes([tag, 0x80]) + content + b"\0\0"
+
+
+def _create_certificate(key, name, digital_signature):
+    subject = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, name)])
+    return (
+        x509.CertificateBuilder()
+        .subject_name(subject)
+        .issuer_name(subject)
+        .public_key(key.public_key())
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(datetime.utcnow())
+        .not_valid_after(datetime.utcnow() + timedelta(days=1))
+        .add_extension(
+            x509.KeyUsage(digital_signature, False, not digital_signature, False, False, False, False, False, False),
+            critical=True,
+        )
+        .sign(key, hashes.SHA256(), default_backend())
+    )
+
+
+def _create_p12(key, certificate, legacy=False):
+    if legacy:
+        # cifrado de archivos antiguos: pbeWithSHA1And3-KeyTripleDES-CBC y mac SHA1
+        encryption = (
+            serialization.PrivateFormat.PKCS12.encryption_builder()
+            .kdf_rounds(2048)
+            .key_cert_algorithm(pkcs12.PBES.PBESv1SHA1And3KeyTripleDESCBC)
+            .hmac_hash(hashes.SHA1())
+            .build(P12_PASSWORD.encode())
+        )
+    else:
+        encryption = serialization.BestAvailableEncryption(P12_PASSWORD.encode())
+    return pkcs12.serialize_key_and_certificates(b"l10n_ec", key, certificate, None, encryption)
+
+
+def _merge_p12(files_content, indefinite=False):
+    """
+    Unir el contenido(llaves y certificados) de varios archivos p12 en uno solo, sin mac,
+    como los archivos de entidades emisoras que traen varias llaves
+    :param indefinite: codificar los contenedores con longitud indefinida(BER) y el contenido en segmentos
+    """
+    content_infos = b""
+    for file_content in files_content:
+        pfx = sri_pkcs12._decode(file_content, 0, len(file_content))[0][0]
+        auth_safe = sri_pkcs12._content_info_data(pfx[1][1])
+        content_infos += b"".join(node[2] for node in sri_pkcs12._decode(auth_safe, 0, len(auth_safe))[0][0][1])
+    auth_safe = _der(0x30, content_infos)
+    oid = _der(0x06, sri_pkcs12.OID_PKCS7_DATA)
+    if indefinite:
+        half = len(auth_safe) // 2
+        octets = _ber(0x24, _der(0x04, auth_safe[:half]) + _der(0x04, auth_safe[half:]))
+        return _ber(0x30, _der(0x02, b"\x03") + _ber(0x30, oid + _ber(0xA0, octets)))
+    return _der(0x30, _der(0x02, b"\x03") + _der(0x30, oid + _der(0xA0, _der(0x04, auth_safe))))
+
 
 @tagged("post_install", "-at_install")
 class EcuadorianNiifTest(AccountTestInvoicingCommon):
@@ -169,3 +255,595 @@ class EcuadorianNiifTest(AccountTestInvoicingCommon):
                     "point_of_emission_id": self.test_pofe1.id,
                 }
             )
+
+    def test_sequence_counter(self):
+        counter_model = self.env["l10n_ec.point.of.emission.counter"]
+        date = fields.Date.to_date("2020-08-05")
+        next_number, auth_line = self.test_pofe1.get_next_value_sequence("out_invoice", date)
+        self.assertEqual(next_number, "999-001-000000001")
+        self.assertEqual(auth_line, self.test_doc1)
+        counter_model._register_numbers({(self.test_pofe1, "out_invoice"): 5})
+        next_number, auth_line = self.test_pofe1.get_next_value_sequence("out_invoice", date)
+        self.assertEqual(next_number, "999-001-000000006")
+        # al eliminar el ultimo documento se vuelve a tomar el secuencial de los documentos existentes
+        counter_model._release_numbers({(self.test_pofe1, "out_invoice"): 5})
+        next_number, auth_line = self.test_pofe1.get_next_value_sequence("out_invoice", date)
+        self.assertEqual(next_number, "999-001-000000001")
+
+    def test_sequence_counter_release(self):
+        counter_model = self.env["l10n_ec.point.of.emission.counter"]
+        date = fields.Date.to_date("2020-08-05")
+        key = (self.test_pofe1, "out_invoice")
+        counter_model._register_numbers({key: 3})
+        counter_model._register_numbers({key: 8})
+        # eliminar un documento que no es el ultimo no debe cambiar el contador
+        counter_model._release_numbers({key: 3})
+        next_number, auth_line = self.test_pofe1.get_next_value_sequence("out_invoice", date)
+        self.assertEqual(next_number, "999-001-000000009")
+        # eliminar el ultimo documento recalcula el contador con los documentos existentes
+        counter_model._release_numbers({key: 8})
+        self.assertEqual(counter_model._get_last_number(*key), 0)
+        # registrar un secuencial luego de recalcular el contador
+        counter_model._register_numbers({key: 4})
+        self.assertEqual(counter_model._get_last_number(*key), 4)
+        counter_model._release_numbers({key: 4})
+        self.assertEqual(counter_model._get_last_number(*key), 0)
+
+    def test_authorization_ranges(self):
+        date = fields.Date.to_date("2020-08-05")
+        self.assertEqual(
+            self.test_pofe1.get_authorization_for_number("out_invoice", "999-001-000000050", date), self.test_doc1
+        )
+        with self.assertRaises(UserError):
+            self.test_pofe1.get_authorization_for_number("out_invoice", "999-001-000000150", date)
+        # al modificar la autorizacion se debe descartar los rangos en cache
+        self.test_doc1.write({"last_sequence": 200})
+        self.assertEqual(
+            self.test_pofe1.get_authorization_for_number("out_invoice", "999-001-000000150", date), self.test_doc1
+        )
+
+    def test_clean_str(self):
+        util_model = self.env["l10n_ec.utils"]
+        self.assertEqual(util_model._clean_str("  Av. Amazonas N34-451, Quito\n"), "Av Amazonas N34451 Quito")
+        self.assertEqual(util_model._clean_str("CAÑAS & ASOCIADOS S.A."), "CANAS Y ASOCIADOS SA")
+        self.assertEqual(util_model._clean_str("Fábrica 1/2 º´ ñandú\tÜber"), "Fabrica 1 2  nanduUber")
+        self.assertEqual(util_model._clean_str("Producto™ (caja)"), "Producto   caja ")
+        self.assertEqual(util_model._clean_str("Calle 1, Casa 2", [("Casa", "Villa")], " "), "Calle 1  Villa 2")
+        self.assertFalse(util_model._clean_str(False))
+
+    def test_tax_classification(self):
+        iva_group = self.env.ref("l10n_ec_niif.tax_group_iva")
+        iva_0_group = self.env.ref("l10n_ec_niif.tax_group_iva_0")
+        tax = self.env["account.tax"].search(
+            [("company_id", "=", self.company.id), ("tax_group_id", "=", iva_group.id)], limit=1
+        )
+        self.assertEqual(tax._l10n_ec_get_tax_info()["role"], "iva")
+        self.assertEqual(tax._l10n_ec_filter_by_role("iva0", "iva_exempt"), tax.browse())
+        # al modificar el impuesto se debe descartar la clasificacion
+        tax.write({"tax_group_id": iva_0_group.id, "amount": 0})
+        self.assertEqual(tax._l10n_ec_get_tax_info()["role"], "iva0")
+        self.assertEqual(tax._l10n_ec_filter_by_role("iva0", "iva_exempt"), tax)
+
+    def _create_xml_invoice(self, partner, lines=1):
+        return self.test_obj5.create(
+            {
+                "type": "out_invoice",
+                "partner_id": partner.id,
+                "invoice_date": "2020-08-05",
+                "l10n_ec_point_of_emission_id": self.test_pofe1.id,
+                "l10n_ec_authorization_line_id": self.test_doc1.id,
+                "invoice_line_ids": [
+                    (0, 0, {"product_id": self.company_data["product"].id, "quantity": 2, "price_unit": 25.0})
+                    for _index in range(lines)
+                ],
+            }
+        )
+
+    def _generate_xml_data(self, moves, xml_version):
+        # leer los datos del xml con la cache del ORM vacia
+        self.env["base"].invalidate_cache()
+        moves._l10n_ec_prefetch_electronic_data()
+        for move in moves:
+            move.l10n_ec_action_generate_xml_data(etree.Element("factura"), xml_version)
+
+    def test_xml_data_query_count(self):
+        xml_version = self.env.ref("l10n_ec_niif.sri_xml_e_invoice_2_1_0")
+        self.company.l10n_ec_invoice_version_xml_id = xml_version
+        customer = self.env["res.partner"].create(
+            {
+                "name": "Cliente",
+                "vat": "0992397535001",
+                "l10n_latam_identification_type_id": self.env.ref("l10n_ec_niif.it_ruc").id,
+                "street": "Av. 9 de Octubre",
+                "country_id": self.env.ref("base.ec").id,
+            }
+        )
+        invoice = self._create_xml_invoice(customer)
+        invoice_lines = self._create_xml_invoice(customer, lines=10)
+        invoices = self.test_obj5.browse()
+        for _index in range(5):
+            invoices |= self._create_xml_invoice(customer)
+        self.env["base"].flush()
+        queries_before = self.env.cr.sql_log_count
+        self._generate_xml_data(invoice, xml_version)
+        queries = self.env.cr.sql_log_count - queries_before
+        # la cantidad de consultas no debe depender de la cantidad de lineas ni de documentos
+        with self.assertQueryCount(queries):
+            self._generate_xml_data(invoice_lines, xml_version)
+        with self.assertQueryCount(queries):
+            self._generate_xml_data(invoices, xml_version)
+
+    def _setup_electronic_documents(self):
+        """
+        Compañia con documentos electronicos(sin llave de firma, los documentos solo se crean en borrador),
+        punto de emision electronico, clientes, proveedores y diarios de venta y compra
+        """
+        it_ruc = self.env.ref("l10n_ec_niif.it_ruc")
+        country_ec = self.env.ref("base.ec")
+        self.company.partner_id.write(
+            {
+                "vat": "1792060346001",
+                "l10n_latam_identification_type_id": it_ruc.id,
+                "street": "Av. Amazonas",
+                "country_id": country_ec.id,
+            }
+        )
+        self.company.write(
+            {
+                "l10n_ec_type_environment": "test",
+                "l10n_ec_type_conection_sri": "offline",
+                "l10n_ec_electronic_invoice": True,
+                "l10n_ec_electronic_withhold": True,
+            }
+        )
+        self.electronic_pofe = self.env["l10n_ec.point.of.emission"].create(
+            {
+                "name": "PofE Electronico",
+                "number": "002",
+                "agency_id": self.test_agency1.id,
+                "type_emission": "electronic",
+            }
+        )
+        self.customer = self.env["res.partner"].create(
+            {
+                "name": "Cliente",
+                "vat": "0992397535001",
+                "l10n_latam_identification_type_id": it_ruc.id,
+                "street": "Av. 9 de Octubre",
+                "country_id": country_ec.id,
+            }
+        )
+        self.supplier = self.env["res.partner"].create(
+            {
+                "name": "Proveedor",
+                "vat": "1713175071",
+                "l10n_latam_identification_type_id": self.env.ref("l10n_ec_niif.it_cedula").id,
+                "street": "Av. Quito",
+                "country_id": country_ec.id,
+            }
+        )
+        self.journals = {}
+        for journal_type, internal_type, code in (
+            ("sale", "invoice", "EFAC"),
+            ("sale", "debit_note", "ENDB"),
+            ("purchase", "invoice", "EFPR"),
+        ):
+            self.journals[journal_type if internal_type == "invoice" else internal_type] = self.env[
+                "account.journal"
+            ].create(
+                {
+                    "name": f"Electronico {code}",
+                    "code": code,
+                    "type": journal_type,
+                    "l10n_latam_internal_type": internal_type,
+                    "l10n_latam_use_documents": True,
+                    "company_id": self.company.id,
+                }
+            )
+        self.tax_withhold = self.env["account.tax"].search(
+            [
+                ("company_id", "=", self.company.id),
+                ("tax_group_id", "=", self.env.ref("l10n_ec_niif.tax_group_renta_withhold").id),
+                ("type_tax_use", "=", "purchase"),
+            ],
+            limit=1,
+        )
+
+    def _prepare_electronic_move_form(self, move_type, partner, internal_type="invoice"):
+        if move_type == "in_invoice":
+            journal = self.journals["purchase"]
+        else:
+            journal = self.journals["sale" if internal_type == "invoice" else internal_type]
+        move_form = Form(
+            self.env["account.move"].with_context(
+                default_type=move_type,
+                default_journal_id=journal.id,
+                internal_type=internal_type,
+            ),
+        )
+        move_form.partner_id = partner
+        move_form.invoice_date = fields.Date.context_today(self.env.user)
+        if move_type == "out_invoice":
+            move_form.l10n_ec_point_of_emission_id = self.electronic_pofe
+            move_form.l10n_ec_sri_payment_id = self.env.ref("l10n_ec_niif.cp_01")
+        with move_form.invoice_line_ids.new() as line_form:
+            line_form.product_id = self.company_data["product"]
+            line_form.quantity = 2
+            line_form.price_unit = 25.0
+        return move_form
+
+    def test_post_bulk(self):
+        self._setup_electronic_documents()
+        moves = self.env["account.move"]
+        # facturas de proveedor electronicas con retencion electronica
+        for index in range(3):
+            move_form = self._prepare_electronic_move_form("in_invoice", self.supplier)
+            move_form.l10n_ec_type_emission = "electronic"
+            move_form.l10n_latam_document_number = "001-001-%09d" % (index + 1)
+            move_form.l10n_ec_electronic_authorization = "%049d" % (index + 1)
+            move_form.l10n_ec_point_of_emission_withhold_id = self.electronic_pofe
+            with move_form.invoice_line_ids.edit(0) as line_form:
+                line_form.tax_ids.add(self.tax_withhold)
+            moves |= move_form.save()
+        purchases = moves
+        self.assertTrue(all(purchases.mapped("l10n_ec_withhold_required")))
+        sale = self._prepare_electronic_move_form("out_invoice", self.customer).save()
+        moves |= sale
+        xml_data_class = type(self.env["sri.xml.data"])
+        with patch.dict(tools.config.options, {"validate_authorization_sri": True}):
+            with patch.object(xml_data_class, "process_document_electronic") as process_document_electronic:
+                with patch.object(xml_data_class, "get_current_wsClient") as get_current_ws_client:
+                    moves.l10n_ec_post_bulk()
+        # sin conexion al SRI ni creacion del xml, los documentos quedan para las tareas cron
+        process_document_electronic.assert_not_called()
+        get_current_ws_client.assert_not_called()
+        self.assertEqual(set(moves.mapped("state")), {"posted"})
+        for purchase in purchases:
+            self.assertEqual(len(purchase.l10n_ec_withhold_ids), 1)
+            self.assertEqual(purchase.l10n_ec_sri_authorization_state, "to_check")
+        xml_recs = sale.l10n_ec_xml_data_id | purchases.mapped("l10n_ec_withhold_ids.l10n_ec_xml_data_id")
+        self.assertEqual(len(xml_recs), 4)
+        self.assertEqual(set(xml_recs.mapped("state")), {"draft"})
+
+    @contextmanager
+    def _assert_duplicated(self):
+        """
+        El documento duplicado lo rechaza la restriccion de la base de datos
+        o la validacion del lote, la que se ejecute primero
+        """
+        try:
+            with self.assertRaises((IntegrityError, ValidationError)), mute_logger("odoo.sql_db"):
+                with self.env.cr.savepoint():
+                    yield
+                    self.env["base"].flush()
+        finally:
+            self.env["base"].invalidate_cache()
+
+    def _create_supplier_invoice(self, partner, number, authorization):
+        move_form = self._prepare_electronic_move_form("in_invoice", partner)
+        move_form.l10n_ec_type_emission = "electronic"
+        move_form.l10n_latam_document_number = number
+        move_form.l10n_ec_electronic_authorization = authorization
+        return move_form.save()
+
+    def test_document_number_duplicity(self):
+        self._setup_electronic_documents()
+        invoice = self._prepare_electronic_move_form("out_invoice", self.customer).save()
+        invoice2 = self._prepare_electronic_move_form("out_invoice", self.customer).save()
+        number = invoice.l10n_latam_document_number
+        # duplicado con un documento de otro lote
+        with self._assert_duplicated():
+            invoice2.write({"l10n_latam_document_number": number})
+        # duplicado dentro del mismo lote
+        with self._assert_duplicated():
+            (invoice | invoice2).write({"l10n_latam_document_number": "999-002-000000099"})
+        # una nota de debito puede tener el mismo numero que una factura
+        debit_note = self._prepare_electronic_move_form("out_invoice", self.customer, "debit_note").save()
+        debit_note.write({"l10n_latam_document_number": number})
+        self.env["base"].flush()
+        self.assertEqual(debit_note.l10n_ec_document_number, invoice.l10n_ec_document_number)
+        # documentos de proveedor: el numero se repite solo entre proveedores distintos
+        other_supplier = self.supplier.copy({"name": "Otro Proveedor", "vat": "1716537343"})
+        purchase = self._create_supplier_invoice(self.supplier, "001-001-000000001", "%049d" % 1)
+        purchase2 = self._create_supplier_invoice(other_supplier, "001-001-000000001", "%049d" % 2)
+        self.assertEqual(purchase.l10n_ec_document_number, purchase2.l10n_ec_document_number)
+        with self._assert_duplicated():
+            purchase2.write({"partner_id": self.supplier.id})
+        # la autorizacion electronica no se puede repetir, aunque sea de otro proveedor
+        with self.assertRaises(ValidationError):
+            with self.env.cr.savepoint():
+                purchase2.write({"l10n_ec_electronic_authorization": "%049d" % 1})
+
+    def test_withhold_number_duplicity(self):
+        self._setup_electronic_documents()
+        withhold_model = self.env["l10n_ec.withhold"]
+        values = {
+            "company_id": self.company.id,
+            "number": "999-002-000000001",
+            "issue_date": fields.Date.context_today(self.env.user),
+            "partner_id": self.supplier.id,
+            "type": "purchase",
+            "document_type": "electronic",
+            "point_of_emission_id": self.electronic_pofe.id,
+        }
+        # duplicado dentro del mismo lote
+        with self._assert_duplicated():
+            withhold_model.create([values, dict(values)])
+        withhold = withhold_model.create(values)
+        # duplicado con una retencion de otro lote, aunque sea de otro proveedor
+        with self._assert_duplicated():
+            withhold_model.create(dict(values, partner_id=self.customer.id))
+        withhold2 = withhold_model.create(dict(values, number="999-002-000000002"))
+        self.assertNotEqual(withhold.number, withhold2.number)
+
+    def test_refund_number_duplicity(self):
+        refund_model = self.env["l10n_ec.account.invoice.refund"]
+        partner = self.env["res.partner"].create(
+            {"name": "Proveedor Reembolso", "country_id": self.env.ref("base.ec").id}
+        )
+        other_partner = partner.copy({"name": "Otro Proveedor Reembolso"})
+        foreign_partner = partner.copy({"name": "Proveedor Extranjero", "country_id": self.env.ref("base.us").id})
+        self.assertTrue(foreign_partner.l10n_ec_foreign)
+        values = {
+            "partner_id": partner.id,
+            "document_number": "001-001-000000001",
+            "document_type": "electronic",
+            "electronic_authorization": "%049d" % 1,
+        }
+        # duplicado dentro del mismo lote
+        with self.assertRaises(ValidationError):
+            with self.env.cr.savepoint():
+                refund_model.create([values, dict(values, electronic_authorization="%049d" % 2)])
+        refund_model.create(values)
+        # duplicado con un reembolso de otro lote
+        with self.assertRaises(ValidationError):
+            with self.env.cr.savepoint():
+                refund_model.create(dict(values, electronic_authorization="%049d" % 2))
+        # el mismo numero de otro proveedor, o de un proveedor extranjero, es valido
+        refund_model.create(dict(values, partner_id=other_partner.id, electronic_authorization="%049d" % 2))
+        foreign_values = {"partner_id": foreign_partner.id, "document_number": "INV-1", "document_type": "normal"}
+        refunds = refund_model.create([foreign_values, dict(foreign_values)])
+        self.assertEqual(len(refunds), 2)
+
+    def test_sri_xml_plan(self):
+        formats = {"qty": 4, "price": 3, "discount": 2, "amount": 2}
+        plan = sri_xml_plan.get_plan("liquidacionCompra", formats, "1.1.0")
+        self.assertIs(plan, sri_xml_plan.get_plan("liquidacionCompra", dict(formats), "1.1.0"))
+        # cada version compila su propio plan
+        self.assertIsNot(plan, sri_xml_plan.get_plan("liquidacionCompra", formats, "1.0.0"))
+        line_data = {
+            "codigoPrincipal": "P01",
+            "descripcion": "Producto",
+            "unidadMedida": "Unidades",
+            "cantidad": 2,
+            "precioUnitario": 1.5,
+            "descuento": 0.0,
+            "precioTotalSinImpuesto": 3.0,
+            "impuestos": {
+                "impuesto": [
+                    {"codigo": "2", "codigoPorcentaje": "2", "baseImponible": 3.0, "tarifa": 12, "valor": 0.36}
+                ]
+            },
+        }
+        detalles = etree.Element("detalles")
+        sri_xml_plan.render(detalles, plan, line_data)
+        self.assertEqual(
+            etree.tostring(detalles),
+            b"<detalles><detalle><codigoPrincipal>P01</codigoPrincipal><descripcion>Producto</descripcion>"
+            b"<unidadMedida>Unidades</unidadMedida><cantidad>2.0000</cantidad><precioUnitario>1.500</precioUnitario>"
+            b"<descuento>0.00</descuento><precioTotalSinImpuesto>3.00</precioTotalSinImpuesto><impuestos><impuesto>"
+            b"<codigo>2</codigo><codigoPorcentaje>2</codigoPorcentaje><tarifa>12</tarifa>"
+            b"<baseImponible>3.00</baseImponible><valor>0.36</valor></impuesto></impuestos></detalle></detalles>",
+        )
+        # el detalle generado debe pasar la validacion xsd de todas las versiones de liquidacion de compra
+        for version in ("1_0_0", "1_1_0"):
+            with tools.file_open("l10n_ec_niif/data/xml_samples/Liquidacion_Compra_V_%s.xml" % version, "rb") as f:
+                xml_doc = etree.parse(f).getroot()
+            # quitar del ejemplo los datos que no cumplen el esquema, no son parte del detalle
+            for reembolsos in xml_doc.findall("reembolsos"):
+                xml_doc.remove(reembolsos)
+            xml_doc.find("infoLiquidacionCompra/identificacionProveedor").text = "1792060346001"
+            detalles = etree.Element("detalles")
+            sri_xml_plan.render(detalles, plan, line_data)
+            xml_doc.replace(xml_doc.find("detalles"), detalles)
+            self.assertTrue(
+                sri_xsd_schema.validate(xml_doc, "l10n_ec_niif/data/xsd/Liquidacion_Compra_V_%s.xsd" % version)
+            )
+
+    def test_xml_retry_schedule(self):
+        xml_model = self.env["sri.xml.data"]
+        # recibido por el SRI pero aun sin autorizar, sin codigo de error
+        xml_waiting = xml_model.create({"company_id": self.company.id, "state": "waiting"})
+        xml_waiting._l10n_ec_schedule_next_attempt()
+        self.assertEqual(xml_waiting.backoff_class, "processing")
+        self.assertTrue(xml_waiting.next_attempt_date)
+        # un codigo de un intento anterior no debe definir el tipo de reintento de la nueva respuesta
+        xml_waiting.write({"last_error_id": self.env.ref("l10n_ec_niif.error_code_50").id})
+        xml_waiting._l10n_ec_clear_last_error()
+        xml_waiting._l10n_ec_schedule_next_attempt()
+        self.assertEqual(xml_waiting.backoff_class, "processing")
+        # no autorizado por un error inesperado al enviar(sin codigo del SRI)
+        xml_rejected = xml_model.create({"company_id": self.company.id, "state": "rejected"})
+        self.assertFalse(xml_rejected._l10n_ec_is_retry_pending())
+        self.env["sri.xml.data.send.try"].create({"xml_id": xml_rejected.id, "type_send": "send"})
+        xml_rejected._l10n_ec_schedule_next_attempt()
+        self.assertEqual(xml_rejected.backoff_class, "other")
+        self.assertTrue(xml_rejected.next_attempt_date)
+        # al autorizar o regresar a borrador se reinician los reintentos
+        for xml_data, state in ((xml_waiting, "authorized"), (xml_rejected, "draft")):
+            self.assertTrue(xml_data.attempt_count)
+            xml_data.write({"state": state})
+            self.assertEqual(xml_data.attempt_count, 0)
+            self.assertFalse(xml_data.backoff_class)
+            self.assertFalse(xml_data.next_attempt_date)
+
+    def _pop_stage_records(self, payload_sizes):
+        # las mediciones se guardan en otra transaccion, leerlas y borrarlas desde otro cursor
+        with self.registry.cursor() as cr:
+            cr.execute(
+                """
+                DELETE FROM sri_xml_data_stage WHERE payload_size IN %s
+                RETURNING stage, payload_size, outcome
+                """,
+                (tuple(payload_sizes),),
+            )
+            return sorted(cr.fetchall())
+
+    def test_sign_pool(self):
+        # el pool de firma se crea una sola vez por proceso
+        pool = sri_key_type.get_sign_pool(2)
+        self.addCleanup(sri_key_type.discard_sign_pool)
+        self.assertIs(sri_key_type.get_sign_pool(2), pool)
+        sri_key_type.discard_sign_pool()
+        self.assertIsNot(sri_key_type.get_sign_pool(2), pool)
+
+    def test_xml_stage_statistics(self):
+        stage_model = self.env["sri.xml.data.stage"]
+        xml_data_model = self.env["sri.xml.data"]
+        with xml_data_model._l10n_ec_measure_stage("build") as measure:
+            measure["payload_size"] = 987101
+            with xml_data_model._l10n_ec_measure_stage("xsd") as nested_measure:
+                nested_measure["payload_size"] = 987102
+                nested_measure["outcome"] = "error"
+        self.assertEqual(
+            self._pop_stage_records([987101, 987102]),
+            [("build", 987101, "ok"), ("xsd", 987102, "error")],
+        )
+        for stage, outcome in [("build", "ok"), ("xsd", "error")]:
+            stage_model.create(
+                {
+                    "company_id": self.company.id,
+                    "stage": stage,
+                    "duration": 12.5,
+                    "payload_size": 100,
+                    "outcome": outcome,
+                }
+            )
+        statistics = {row["stage"]: row for row in stage_model.get_stage_statistics(hours=1)}
+        self.assertEqual(statistics["xsd"]["errors"], 1)
+        self.assertEqual(statistics["build"]["count"], 1)
+        self.assertIsInstance(statistics["build"]["avg_ms"], float)
+
+    def test_xml_stage_rollback(self):
+        xml_data_model = self.env["sri.xml.data"]
+        # la etapa con error se guarda aunque se revierta la transaccion del documento
+        with self.assertRaises(UserError):
+            with self.env.cr.savepoint():
+                with xml_data_model._l10n_ec_measure_stage("reception") as measure:
+                    measure["payload_size"] = 987103
+                    raise UserError("Error de recepcion")
+        self.assertEqual(self._pop_stage_records([987103]), [("reception", 987103, "error")])
+
+    def test_taxpayer_cache(self):
+        taxpayer_model = self.env["l10n_ec.taxpayer.cache"]
+        registry_file = (
+            "NUMERO_RUC|RAZON_SOCIAL|ESTADO_CONTRIBUYENTE|CLASE_CONTRIBUYENTE\n"
+            "1792060346001|EMPRESA DE PRUEBAS S.A.|ACTIVO|OTROS\n"
+        )
+        self.assertEqual(taxpayer_model.load_registry_file(registry_file.encode()), 1)
+        # la consulta se responde desde la cache, sin llamar al SRI
+        data = self.env["res.partner"]._get_partner_info_from_sri("1792060346001")
+        self.assertEqual(data["razonSocial"], "EMPRESA DE PRUEBAS S.A.")
+        self.assertEqual(data["descripcion"], "ACTIVO")
+
+    def test_taxpayer_pending_queue(self):
+        taxpayer_model = self.env["l10n_ec.taxpayer.cache"]
+        taxpayer_model._enqueue_taxpayers(["1234567890"])
+        taxpayer_model._enqueue_taxpayers(["1234567891"])
+        taxpayer_model._enqueue_taxpayers(["1234567892"])
+        fetched_vats = []
+
+        def fetch_from_sri(model, vat):
+            fetched_vats.append(vat)
+            return {}
+
+        # los contribuyentes sin respuesta del SRI pasan al final de la cola
+        with patch.object(type(taxpayer_model), "_fetch_from_sri", fetch_from_sri):
+            taxpayer_model._cron_fetch_pending_taxpayers(limit=2)
+            taxpayer_model._cron_fetch_pending_taxpayers(limit=2)
+        self.assertEqual(fetched_vats, ["1234567890", "1234567891", "1234567892", "1234567890"])
+        self.assertFalse(taxpayer_model.search([("vat", "=", "1234567890")]).fetch_date)
+        # sin tiempo para esperar la respuesta del SRI no se consulta ningun contribuyente
+        self.env["ir.config_parameter"].sudo().set_param("l10n_ec.taxpayer_cron_time_limit", "0")
+        with patch.object(type(taxpayer_model), "_fetch_from_sri", fetch_from_sri):
+            taxpayer_model._cron_fetch_pending_taxpayers(limit=2)
+        self.assertEqual(len(fetched_vats), 4)
+
+    def test_validate_vat_batch(self):
+        ecuador = self.env.ref("base.ec")
+        vals_list = [
+            {"name": "Cedula", "vat": "1716537343", "country_id": ecuador.id},
+            {"name": "RUC", "vat": "1792060346001", "country_id": ecuador.id},
+            {"name": "Cedula repetida", "vat": "1716537343", "country_id": ecuador.id},
+            {"name": "Invalido", "vat": "1234567890", "country_id": ecuador.id},
+            {"name": "Extranjero", "vat": "AB123", "country_id": self.env.ref("base.us").id},
+        ]
+        report = self.env["res.partner"].l10n_ec_validate_vat_batch(vals_list, async_lookup=True)
+        self.assertEqual([line["status"] for line in report], ["valid", "valid", "valid", "pending", "skipped"])
+        self.assertEqual(report[0]["vat_type"], "Cedula")
+        self.assertEqual(report[1]["vat_type"], "Ruc")
+        # la identificacion sin respuesta queda pendiente para la tarea programada
+        taxpayer = self.env["l10n_ec.taxpayer.cache"].search([("vat", "=", "1234567890")])
+        self.assertTrue(taxpayer)
+        self.assertFalse(taxpayer.fetch_date)
+
+
+@tagged("post_install", "-at_install")
+class SriPkcs12Test(BaseCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        # llave de cifrado(sin digital_signature) y llave de firma
+        cls.encryption_key = rsa.generate_private_key(65537, 2048, default_backend())
+        cls.signing_key = rsa.generate_private_key(65537, 2048, default_backend())
+        cls.encryption_certificate = _create_certificate(cls.encryption_key, "Decryption Key", False)
+        cls.signing_certificate = _create_certificate(cls.signing_key, "Signing Key", True)
+
+    def assertSameKey(self, key, expected_key):
+        self.assertEqual(key.public_key().public_numbers(), expected_key.public_key().public_numbers())
+
+    def test_single_key(self):
+        file_content = _create_p12(self.signing_key, self.signing_certificate)
+        private_keys = sri_pkcs12.load_private_keys(file_content, P12_PASSWORD)
+        self.assertEqual(len(private_keys), 1)
+        self.assertSameKey(private_keys[0], self.signing_key)
+        private_key, certificate = sri_pkcs12.get_signing_key(file_content, P12_PASSWORD)
+        self.assertSameKey(private_key, self.signing_key)
+        self.assertEqual(certificate, self.signing_certificate)
+
+    def test_multi_key(self):
+        file_content = _merge_p12(
+            [
+                _create_p12(self.encryption_key, self.encryption_certificate),
+                _create_p12(self.signing_key, self.signing_certificate),
+            ]
+        )
+        private_keys = sri_pkcs12.load_private_keys(file_content, P12_PASSWORD)
+        self.assertEqual(len(private_keys), 2)
+        self.assertSameKey(private_keys[0], self.encryption_key)
+        self.assertSameKey(private_keys[1], self.signing_key)
+        # el archivo devuelve la primera llave, se debe tomar la del certificado con digital_signature
+        bundle = (self.encryption_key, self.encryption_certificate, [self.signing_certificate])
+        private_key, certificate = sri_pkcs12.get_signing_key(file_content, P12_PASSWORD, bundle=bundle)
+        self.assertSameKey(private_key, self.signing_key)
+        self.assertEqual(certificate, self.signing_certificate)
+
+    def test_legacy_encrypted(self):
+        file_content = _create_p12(self.signing_key, self.signing_certificate, legacy=True)
+        private_key, certificate = sri_pkcs12.get_signing_key(file_content, P12_PASSWORD)
+        self.assertSameKey(private_key, self.signing_key)
+        self.assertEqual(certificate, self.signing_certificate)
+        # varias llaves con cifrado antiguo y codificacion BER de longitud indefinida
+        file_content = _merge_p12(
+            [
+                _create_p12(self.encryption_key, self.encryption_certificate, legacy=True),
+                file_content,
+            ],
+            indefinite=True,
+        )
+        private_keys = sri_pkcs12.load_private_keys(file_content, P12_PASSWORD)
+        self.assertEqual(len(private_keys), 2)
+        bundle = (self.encryption_key, self.encryption_certificate, [self.signing_certificate])
+        private_key, certificate = sri_pkcs12.get_signing_key(file_content, P12_PASSWORD, bundle=bundle)
+        self.assertSameKey(private_key, self.signing_key)
+        self.assertEqual(certificate, self.signing_certificate)
@@ -2,3 +2,4 @@ from . import wizard_cancel_withhold
 from . import wizard_cancel_invoice
 from . import wizard_cancel_electronic_documents
 from . import account_debit_note
+from . import wizard_load_taxpayer_registry
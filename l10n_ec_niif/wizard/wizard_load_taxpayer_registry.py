@@ -0,0 +1,35 @@
+import base64
+
+from odoo import fields, models
+from odoo.exceptions import UserError
+from odoo.tools.translate import _
+
+
+class WizardLoadTaxpayerRegistry(models.TransientModel):
+
+    _name = "wizard.load.taxpayer.registry"
+    _description = "Wizard to load the SRI taxpayer registry"
+
+    file_content = fields.Binary("File", required=True)
+    file_name = fields.Char("File Name")
+    encoding = fields.Selection(
+        [
+            ("utf-8", "UTF-8"),
+            ("latin-1", "Latin 1"),
+        ],
+        string="Encoding",
+        required=True,
+        default="utf-8",
+    )
+
+    def action_load(self):
+        self.ensure_one()
+        if not self.file_content:
+            raise UserError(_("You must select the file to load"))
+        total = self.env["l10n_ec.taxpayer.cache"].load_registry_file(
+            base64.decodebytes(self.file_content), self.encoding
+        )
+        action = self.env.ref("l10n_ec_niif.action_l10n_ec_taxpayer_cache_view").read()[0]
+        action["name"] = _("Loaded taxpayers: %s") % total
+        action["domain"] = [("source", "=", "file")]
+        return action